@@ -0,0 +1,184 @@
+"""
+Vectorized fleet analytics
+
+FleetColumns converts a snapshot's trains into NumPy column arrays once per
+cycle: line and station codes are factorized to integer ids and delays are
+parsed to float minutes (NaN when absent or not numeric). Metrics for any
+subset of rows, such as the trains a flow selected (the 'rows' returned by
+flows.evaluate_flows), are then computed in bulk with bincount and sorted
+group quantiles, so adding flows does not add passes over the payload.
+
+Metrics (FleetColumns.summarize):
+- line_counts: Trains per line code
+- delay: count, mean, p50 and p95 of ultRetraso over trains reporting one
+- line_delays: The same distribution per line code
+- station_counts: Trains per current station (codEstAct), busiest first
+
+Requires the numpy package (pip install prenfe-scraper[analytics]).
+"""
+
+import records
+import snapshots
+
+try:
+    import numpy
+except ImportError:  # optional dependency
+    numpy = None
+
+DELAY_FIELD = 'ultRetraso'
+STATION_FIELD = 'codEstAct'
+
+
+def available():
+    """Return True if numpy is installed"""
+    return numpy is not None
+
+
+def _to_delay(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def _group_stats(group_ids, values, groups):
+    """
+    Count, mean, p50 and p95 of values per group id
+
+    Args:
+        group_ids (numpy.ndarray): Group id (0..groups-1) of every value
+        values (numpy.ndarray): Float values, NaNs are ignored
+        groups (int): Number of groups
+
+    Returns:
+        tuple: (counts, means, p50s, p95s) arrays indexed by group id, NaN for
+        groups without values
+    """
+    valid = ~numpy.isnan(values)
+    group_ids = group_ids[valid]
+    values = values[valid]
+
+    counts = numpy.bincount(group_ids, minlength=groups)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        means = numpy.bincount(group_ids, weights=values, minlength=groups) / counts
+
+    # Sort by (group, value); each group is then a contiguous sorted run
+    order = numpy.lexsort((values, group_ids))
+    ordered = values[order]
+    starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+    present = counts > 0
+    quantiles = []
+    for q in (0.5, 0.95):
+        result = numpy.full(groups, numpy.nan)
+        # Linear interpolation between closest ranks, as numpy.percentile does
+        position = starts[present] + q * (counts[present] - 1)
+        low = numpy.floor(position).astype(numpy.intp)
+        high = numpy.ceil(position).astype(numpy.intp)
+        result[present] = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+        quantiles.append(result)
+    return counts, means, quantiles[0], quantiles[1]
+
+
+def _stats_dict(count, mean, p50, p95):
+    if not count:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None}
+    return {'count': int(count), 'mean': float(mean), 'p50': float(p50), 'p95': float(p95)}
+
+
+class FleetColumns:
+    """Column arrays of one snapshot's trains (see the module docstring)"""
+
+    def __init__(self, trains):
+        """
+        Args:
+            trains (list): Train dicts or records; other items get no line or
+                station and are left out of every metric
+        """
+        line_ids = {}  # raw codLinea -> line id
+        normalized_ids = {}  # normalized line code -> line id
+        station_ids = {}
+        lines = []
+        stations = []
+        delays = []
+        for item in trains:
+            if not isinstance(item, records.TRAIN_TYPES):
+                lines.append(-1)
+                stations.append(-1)
+                delays.append(float('nan'))
+                continue
+            raw_code = item.get('codLinea')
+            line_id = line_ids.get(raw_code)
+            if line_id is None:
+                code = 'UNKNOWN' if raw_code is None else raw_code.upper()
+                line_id = line_ids[raw_code] = normalized_ids.setdefault(code, len(normalized_ids))
+            lines.append(line_id)
+            station = item.get(STATION_FIELD)
+            if station is None or station == '':
+                stations.append(-1)
+            else:
+                stations.append(station_ids.setdefault(str(station), len(station_ids)))
+            delays.append(_to_delay(item.get(DELAY_FIELD)))
+
+        self.line_codes = list(normalized_ids)
+        self.station_codes = list(station_ids)
+        self.line = numpy.array(lines, dtype=numpy.intp)
+        self.station = numpy.array(stations, dtype=numpy.intp)
+        self.delay = numpy.array(delays, dtype=numpy.float64)
+
+    @classmethod
+    def from_payload(cls, payload):
+        """
+        Build the columns of a snapshot payload
+
+        Args:
+            payload (dict or list): Dict with 'trenes' or a trains list
+
+        Returns:
+            FleetColumns: The columns, one row per item of the trains list
+        """
+        trains, _ = snapshots.split_payload(payload)
+        return cls(trains)
+
+    def __len__(self):
+        return len(self.line)
+
+    def summarize(self, rows=None):
+        """
+        Compute the metrics of a subset of the trains
+
+        Args:
+            rows (list): Row positions to include (None = every row)
+
+        Returns:
+            dict: 'line_counts', 'delay', 'line_delays' and 'station_counts'
+        """
+        line, station, delay = self.line, self.station, self.delay
+        if rows is not None:
+            rows = numpy.asarray(rows, dtype=numpy.intp)
+            line, station, delay = line[rows], station[rows], delay[rows]
+        trains = line >= 0
+        line, station, delay = line[trains], station[trains], delay[trains]
+
+        line_total = numpy.bincount(line, minlength=len(self.line_codes))
+        counts, means, p50s, p95s = (
+            column.tolist() for column in _group_stats(line, delay, len(self.line_codes))
+        )
+        overall = _group_stats(numpy.zeros(len(delay), dtype=numpy.intp), delay, 1)
+
+        station_total = numpy.bincount(station[station >= 0], minlength=len(self.station_codes))
+        occupied = numpy.flatnonzero(station_total)
+        busiest = occupied[numpy.argsort(-station_total[occupied], kind='stable')]
+
+        lines = numpy.flatnonzero(line_total).tolist()
+        line_codes = self.line_codes
+        return {
+            'line_counts': dict(zip([line_codes[i] for i in lines],
+                                    line_total[lines].tolist())),
+            'delay': _stats_dict(*(column[0] for column in overall)),
+            'line_delays': {
+                line_codes[i]: _stats_dict(counts[i], means[i], p50s[i], p95s[i])
+                for i in lines
+            },
+            'station_counts': dict(zip([self.station_codes[i] for i in busiest.tolist()],
+                                       station_total[busiest].tolist())),
+        }
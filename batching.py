@@ -0,0 +1,226 @@
+"""
+Time-partitioned batching of flow cycles with a local write-ahead log
+
+Instead of one object per flow per cycle, each cycle is appended to a local
+write-ahead log (WAL) file per flow and partition, and fsynced before the
+cycle completes. Once a partition is over, its WAL is encoded into a single
+batch object and deleted:
+
+    <folder>/flow=<flow>/date=<YYYY-MM-DD>/hour=<HH>/part-<YYYYMMDDTHHMMSS>.jsonl.zst
+    <folder>/flow=<flow>/date=<YYYY-MM-DD>/part-<YYYYMMDDTHHMMSS>.parquet   (daily)
+
+The part suffix is the first cycle in the batch, so a partition flushed in
+several parts (e.g. by flush(now=None)) never overwrites another.
+
+WAL files live under <wal_dir>/<flow>/<YYYY-MM-DD>[T<HH>].jsonl with one
+compact JSON record per line:
+
+    {"fetched_at": "2026-10-17T08:02:00", "payload": {...}}
+    {"fetched_at": "2026-10-17T08:04:00", "unchanged": true, "same_as": "..."}
+
+A restarted instance finds its WAL files on disk and flushes them as usual;
+a line torn by a crash mid-write is dropped. That only holds on a local disk:
+on an in-memory filesystem (Cloud Run) the WAL, and every cycle buffered in
+it, is lost with the instance. Batch formats:
+- jsonl: the WAL records, compressed with the batch codec (see serialization.py)
+- parquet: one row per train with its fetched_at (see columnar.py); unchanged
+  cycles have no rows
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import columnar
+import serialization
+import snapshots
+
+GRANULARITIES = ('hour', 'day')
+FORMATS = ('jsonl', 'parquet')
+
+WAL_EXTENSION = '.jsonl'
+
+
+class BatchWriter:
+    """
+    Buffers flow cycles in WAL files and flushes completed partitions
+
+    Args:
+        wal_dir (Path): Directory for the write-ahead log
+        granularity (str): 'hour' or 'day'
+        fmt (str): 'jsonl' or 'parquet'
+        codec (str): Compression codec for jsonl batches
+    """
+
+    def __init__(self, wal_dir, granularity='hour', fmt='jsonl', codec='gzip'):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown batch granularity '{granularity}'")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown batch format '{fmt}'")
+        if fmt == 'parquet' and not columnar.available():
+            raise ValueError("Parquet batches require the pyarrow package")
+        if fmt == 'jsonl' and codec not in serialization.available_codecs():
+            raise ValueError(f"Codec '{codec}' is not available")
+        self.wal_dir = Path(wal_dir)
+        self.granularity = granularity
+        self.fmt = fmt
+        self.codec = codec
+        self._lock = threading.Lock()
+
+    def partition_start(self, when):
+        """Start of the partition containing a time"""
+        if self.granularity == 'hour':
+            return when.replace(minute=0, second=0, microsecond=0)
+        return when.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def partition_end(self, start):
+        """End of the partition starting at 'start'"""
+        return start + (timedelta(hours=1) if self.granularity == 'hour' else timedelta(days=1))
+
+    def wal_path(self, flow_name, when):
+        """WAL file of a flow's partition"""
+        start = self.partition_start(when)
+        key = start.strftime('%Y-%m-%dT%H' if self.granularity == 'hour' else '%Y-%m-%d')
+        return self.wal_dir / flow_name / f"{key}{WAL_EXTENSION}"
+
+    def append(self, flow_name, fetched_at, record):
+        """
+        Durably append a cycle to the flow's WAL
+
+        Args:
+            flow_name (str): Flow name
+            fetched_at (datetime): Cycle time
+            record (dict): {'payload': ...} or an unchanged marker
+        """
+        line = serialization.dumps(
+            {'fetched_at': fetched_at.isoformat(timespec='seconds'), **record}
+        ) + b'\n'
+        path = self.wal_path(flow_name, fetched_at)
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'a+b') as f:
+                # Terminate a line torn by a crash so it does not swallow this record
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        line = b'\n' + line
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def pending(self, now=None):
+        """
+        List WAL files ready to flush
+
+        Args:
+            now (datetime): Only partitions that ended at or before this time
+                are listed; None lists every WAL file
+
+        Returns:
+            list: (flow name, partition start, path) tuples, oldest first
+        """
+        found = []
+        if not self.wal_dir.is_dir():
+            return found
+        for path in self.wal_dir.glob(f"*/*{WAL_EXTENSION}"):
+            try:
+                start = datetime.fromisoformat(path.name[:-len(WAL_EXTENSION)])
+            except ValueError:
+                continue
+            if now is None or self.partition_end(start) <= now:
+                found.append((path.parent.name, start, path))
+        found.sort(key=lambda item: (item[1], item[0]))
+        return found
+
+    def object_name(self, flow_name, start, first_cycle):
+        """Partitioned object name of a batch, relative to the destination folder"""
+        parts = [f"flow={flow_name}", f"date={start:%Y-%m-%d}"]
+        if self.granularity == 'hour':
+            parts.append(f"hour={start:%H}")
+        if self.fmt == 'parquet':
+            extension = columnar.FORMATS['parquet']['extension']
+        else:
+            extension = serialization.CODECS[self.codec]['extension'].replace('.json', '.jsonl', 1)
+        parts.append(f"part-{first_cycle:%Y%m%dT%H%M%S}{extension}")
+        return '/'.join(parts)
+
+    def encode_batch(self, entries):
+        """
+        Encode WAL records as a batch
+
+        Args:
+            entries (list): Decoded WAL records
+
+        Returns:
+            tuple: (encoded bytes, Content-Type, Content-Encoding or None)
+        """
+        if self.fmt == 'parquet':
+            import pyarrow
+
+            tables = [
+                columnar.trains_to_table(
+                    snapshots.split_payload(record['payload'])[0],
+                    datetime.fromisoformat(record['fetched_at']),
+                )
+                for record in entries if 'payload' in record
+            ]
+            table = pyarrow.concat_tables(tables) if tables else \
+                columnar.trains_to_table([], datetime.now())
+            return (columnar.encode_table(table, 'parquet'),
+                    columnar.FORMATS['parquet']['content_type'], None)
+
+        raw = b''.join(serialization.dumps(record) + b'\n' for record in entries)
+        codec = serialization.CODECS[self.codec]
+        return (serialization.compress(raw, self.codec),
+                codec['content_type'] or 'application/x-ndjson', codec['content_encoding'])
+
+    def flush(self, store, now=None):
+        """
+        Encode and store completed partitions, then delete their WAL files
+
+        A WAL file is kept when storing fails, so it is retried on the next flush.
+
+        Args:
+            store (callable): store(flow_name, object_name, encoded, content_type,
+                content_encoding) -> bool, True once the batch is persisted
+            now (datetime): Reference time; None flushes every partition,
+                including the current one
+
+        Returns:
+            int: Number of batches stored
+        """
+        stored = 0
+        with self._lock:
+            for flow_name, start, path in self.pending(now):
+                entries = read_wal(path)
+                if not entries:
+                    path.unlink(missing_ok=True)
+                    continue
+                first_cycle = datetime.fromisoformat(entries[0]['fetched_at'])
+                encoded, content_type, content_encoding = self.encode_batch(entries)
+                name = self.object_name(flow_name, start, first_cycle)
+                if store(flow_name, name, encoded, content_type, content_encoding):
+                    path.unlink(missing_ok=True)
+                    stored += 1
+        return stored
+
+
+def read_wal(path):
+    """
+    Read the records of a WAL file, dropping a torn last line
+
+    Args:
+        path (Path): WAL file
+
+    Returns:
+        list: Decoded records
+    """
+    entries = []
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                entries.append(serialization.loads(line))
+            except ValueError:
+                continue
+    return entries
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Per-cycle fleet metrics: Python loops per flow vs. NumPy columns built once
+
+Usage:
+    python benchmarks/bench_analytics.py [--scales 1 10 100] [--flows flows.example.toml]
+
+Computes every flow's line counts, delay distribution (mean/p50/p95, overall
+and per line) and station occupancy the straightforward way, walking each
+flow's trains with dicts and sorted lists, and with analytics.FleetColumns,
+which converts the fleet to arrays once and summarizes each flow's rows.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import analytics  # noqa: E402
+import flows  # noqa: E402
+from benchmarks.synthetic import generate_flota  # noqa: E402
+
+
+def percentile(ordered, q):
+    position = q * (len(ordered) - 1)
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def distribution(delays):
+    if not delays:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None}
+    ordered = sorted(delays)
+    return {'count': len(ordered), 'mean': sum(ordered) / len(ordered),
+            'p50': percentile(ordered, 0.5), 'p95': percentile(ordered, 0.95)}
+
+
+def python_metrics(trains):
+    """Reference implementation: one dict/list pass over a flow's trains"""
+    line_counts = {}
+    line_delays = {}
+    station_counts = {}
+    delays = []
+    for item in trains:
+        line = (item.get('codLinea') or 'UNKNOWN').upper()
+        line_counts[line] = line_counts.get(line, 0) + 1
+        try:
+            delay = float(item.get('ultRetraso'))
+        except (TypeError, ValueError):
+            delay = None
+        if delay is not None:
+            delays.append(delay)
+            line_delays.setdefault(line, []).append(delay)
+        station = item.get('codEstAct')
+        if station:
+            station_counts[station] = station_counts.get(station, 0) + 1
+    return {
+        'line_counts': line_counts,
+        'delay': distribution(delays),
+        'line_delays': {line: distribution(line_delays.get(line, [])) for line in line_counts},
+        'station_counts': dict(sorted(station_counts.items(), key=lambda kv: -kv[1])),
+    }
+
+
+def best_of(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100],
+                        help="Synthetic fleet size multipliers")
+    parser.add_argument('--flows', type=Path,
+                        default=Path(__file__).resolve().parent.parent / 'flows.example.toml',
+                        help="Flow registry whose flows are summarized")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement")
+    args = parser.parse_args()
+
+    registry = flows.load_flows(args.flows)
+    print(f"flows: {len(registry)}")
+    print(f"{'scale':<8}{'trains':>8}{'python ms':>12}{'numpy ms':>11}{'speedup':>9}")
+    for scale in args.scales:
+        data = generate_flota(scale)
+        results = flows.evaluate_flows(registry, data)
+        payloads = [result['payload'] for result in results.values()]
+        payloads = [p['trenes'] if isinstance(p, dict) else p for p in payloads]
+
+        def loop():
+            return [python_metrics(trains) for trains in payloads]
+
+        def vectorized():
+            fleet = analytics.FleetColumns.from_payload(data)
+            return [fleet.summarize(result['rows']) for result in results.values()]
+
+        python_ms = best_of(loop, args.repeat)
+        numpy_ms = best_of(vectorized, args.repeat)
+        print(f"{scale:<8g}{len(data['trenes']):>8}{python_ms:>12.2f}{numpy_ms:>11.2f}"
+              f"{python_ms / numpy_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Encode/decode time vs. size for each snapshot codec and level
+
+Usage:
+    python benchmarks/bench_codecs.py [--payload data/general-prenfe_....json] [--scale 1]
+
+Pass --payload with a saved flota.json (or general-prenfe snapshot) to measure
+a real payload; otherwise a synthetic fleet is generated.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import serialization  # noqa: E402
+from benchmarks.synthetic import generate_flota  # noqa: E402
+
+LEVELS = {
+    'json': [None],
+    'json-compact': [None],
+    'gzip': [1, 6, 9],
+    'zstd': [1, 3, 10, 19],
+}
+
+
+def best_of(func, repeat):
+    """Return the fastest wall-clock time of func() in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--payload', type=Path, help="Saved flota.json payload to encode")
+    parser.add_argument('--scale', type=float, default=1, help="Synthetic fleet size multiplier")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement (best is kept)")
+    args = parser.parse_args()
+
+    if args.payload:
+        payload = serialization.decode_snapshot(
+            args.payload.read_bytes(), serialization.codec_for_filename(args.payload.name)
+        )
+    else:
+        payload = generate_flota(args.scale)
+
+    baseline = len(serialization.encode_snapshot(payload, 'json'))
+    print(f"{'codec':<14}{'level':>6}{'bytes':>12}{'ratio':>8}{'encode ms':>12}{'decode ms':>12}")
+    for codec in serialization.available_codecs():
+        for level in LEVELS[codec]:
+            encoded = serialization.encode_snapshot(payload, codec, level)
+            encode_ms = best_of(lambda: serialization.encode_snapshot(payload, codec, level),
+                                args.repeat)
+            decode_ms = best_of(lambda: serialization.decode_snapshot(encoded, codec), args.repeat)
+            print(f"{codec:<14}{level if level is not None else '-':>6}{len(encoded):>12}"
+                  f"{len(encoded) / baseline:>8.3f}{encode_ms:>12.2f}{decode_ms:>12.2f}")
+
+    if 'zstd' not in serialization.available_codecs():
+        print("zstd skipped: install zstandard to include it")
+
+
+if __name__ == "__main__":
+    main()
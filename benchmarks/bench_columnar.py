@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Analyst scan over many snapshots: JSON files vs. Parquet / Arrow IPC files
+
+Usage:
+    python benchmarks/bench_columnar.py [--snapshots 200] [--scale 1]
+
+Writes the same synthetic cycles as pretty-printed JSON (the historical
+format), gzip JSON and columnar files, then times a typical downstream scan:
+mean delay per line over every snapshot. The columnar scan reads only the
+codLinea and ultRetraso columns.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import columnar  # noqa: E402
+import serialization  # noqa: E402
+import snapshots  # noqa: E402
+from benchmarks.synthetic import generate_flota  # noqa: E402
+
+
+def scan_json(paths):
+    """Mean delay per line by decoding every JSON snapshot"""
+    totals = {}
+    for path in paths:
+        for train in snapshots.read_snapshot(path)['trenes']:
+            try:
+                delay = int(train.get('ultRetraso'))
+            except (TypeError, ValueError):
+                continue
+            count, total = totals.get(train.get('codLinea'), (0, 0))
+            totals[train.get('codLinea')] = (count + 1, total + delay)
+    return {line: total / count for line, (count, total) in totals.items()}
+
+
+def scan_columnar(paths, fmt):
+    """Mean delay per line reading only the needed columns"""
+    import pyarrow
+
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        tables = [pyarrow.parquet.read_table(path, columns=['codLinea', 'ultRetraso'])
+                  for path in paths]
+    else:
+        tables = [columnar.decode_table(path.read_bytes(), fmt).select(['codLinea', 'ultRetraso'])
+                  for path in paths]
+    grouped = pyarrow.concat_tables(tables).group_by('codLinea').aggregate([('ultRetraso', 'mean')])
+    return dict(zip(grouped['codLinea'].to_pylist(), grouped['ultRetraso_mean'].to_pylist()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--snapshots', type=int, default=200, help="Number of cycles written")
+    parser.add_argument('--scale', type=float, default=1, help="Synthetic fleet size multiplier")
+    args = parser.parse_args()
+
+    if not columnar.available():
+        print("pyarrow is not installed: pip install prenfe-scraper[columnar]")
+        return 1
+
+    start = datetime(2026, 10, 17, 6, 0)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        directory = Path(tmpdir)
+        files = {'json': [], 'gzip': [], 'parquet': [], 'arrow': []}
+        for i in range(args.snapshots):
+            now = start + timedelta(minutes=2 * i)
+            payload = generate_flota(args.scale, seed=i, now=now)
+            stem = f"general-prenfe_{now:%Y%m%d_%H%M%S}"
+            for codec in ('json', 'gzip'):
+                path = directory / f"{stem}{serialization.CODECS[codec]['extension']}"
+                path.write_bytes(serialization.encode_snapshot(payload, codec))
+                files[codec].append(path)
+            for fmt in ('parquet', 'arrow'):
+                path = directory / f"{stem}{columnar.FORMATS[fmt]['extension']}"
+                path.write_bytes(columnar.encode_columnar(payload, now, fmt))
+                files[fmt].append(path)
+
+        baseline_bytes = sum(path.stat().st_size for path in files['json'])
+        print(f"snapshots: {args.snapshots}  trains/snapshot: {len(payload['trenes'])}")
+        print(f"{'format':<10}{'MiB':>10}{'ratio':>8}{'scan s':>10}{'speedup':>9}")
+        baseline_s = None
+        for name, paths in files.items():
+            size = sum(path.stat().st_size for path in paths)
+            started = time.perf_counter()
+            if name in columnar.FORMATS:
+                scan_columnar(paths, name)
+            else:
+                scan_json(paths)
+            elapsed = time.perf_counter() - started
+            baseline_s = baseline_s or elapsed
+            print(f"{name:<10}{size / 2 ** 20:>10.2f}{size / baseline_bytes:>8.3f}"
+                  f"{elapsed:>10.3f}{baseline_s / elapsed:>8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
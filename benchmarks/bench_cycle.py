@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Per-cycle CPU time of the flow pipeline, one change at a time
+
+Usage:
+    python benchmarks/bench_cycle.py [--scale 1] [--cycles 20]
+
+The legacy path is a verbatim copy of the original implementation (its
+filter_cat_trains and analyze_flota_data included): analyze + json.dump for
+general, filter + analyze + json.dump for CAT. The single-pass path is then
+measured with the stdlib JSON backend, with orjson, and with orjson plus
+dedup, each step against the previous one. The same payload is saved every
+cycle, so with dedup on every cycle after the first writes unchanged markers
+only: that row is an upper bound. Uploads are disabled; snapshots go to a
+temporary directory in the default json codec.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import scraper  # noqa: E402
+import serialization  # noqa: E402
+from benchmarks.synthetic import generate_flota  # noqa: E402
+
+
+def legacy_filter_cat_trains(data):
+    """Original filter_cat_trains: a fixed tuple of regional lines"""
+    if data is None:
+        return data
+
+    trains_list = data.get('trenes', []) if isinstance(data, dict) and 'trenes' in data else data
+
+    if isinstance(trains_list, list):
+        return [
+            item for item in trains_list
+            if isinstance(item, dict) and item.get('codLinea', '').upper() in (
+                'R1', 'R2', 'R2N', 'R2S', 'R3', 'R4', 'R7', 'R8', 'R11', 'R13', 'R14', 'R15',
+                'R16', 'R17', 'RG1', 'RL3', 'RL4', 'RT1', 'RT2'
+            )
+        ]
+
+    return data
+
+
+def legacy_analyze_flota_data(data):
+    """Original analyze_flota_data: train counts by line"""
+    analysis = {
+        'total_trains': 0,
+        'line_counts': {},
+    }
+
+    if data is None:
+        return analysis
+
+    trains_list = data.get('trenes', []) if isinstance(data, dict) and 'trenes' in data else data
+
+    if isinstance(trains_list, list):
+        analysis['total_trains'] = len(trains_list)
+        for item in trains_list:
+            if isinstance(item, dict):
+                line_code = item.get('codLinea', 'UNKNOWN').upper()
+                analysis['line_counts'][line_code] = analysis['line_counts'].get(line_code, 0) + 1
+
+    return analysis
+
+
+def legacy_cycle(data, output_dir):
+    """Original save path: two analyses, one filter, two json.dump calls"""
+    legacy_analyze_flota_data(data)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    with open(output_dir / f"general-prenfe_{timestamp}.json", 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+    filtered_data = legacy_filter_cat_trains(data)
+    legacy_analyze_flota_data(filtered_data)
+    with open(output_dir / f"prenfe-cat_{timestamp}.json", 'w', encoding='utf-8') as f:
+        json.dump(filtered_data, f, indent=2, ensure_ascii=False)
+
+
+def single_pass_cycle(data, output_dir):
+    """Current save path: one partition pass, one encode per flow"""
+    flows = scraper.partition_flota_data(data)
+    scraper.process_general_flow(data, flows['general-prenfe'])
+    scraper.process_cat_flow(data, flows['prenfe-cat'])
+
+
+def measure(cycle, data, cycles, json_backend='stdlib', dedup=False):
+    """Return mean CPU milliseconds per cycle"""
+    serialization.set_json_backend(json_backend)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_dir = Path(tmpdir)
+        with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                patch.object(scraper, 'GCS_ENABLED', False), \
+                patch.object(scraper, 'OUTPUT_CODEC', 'json'), \
+                patch.object(scraper, 'SNAPSHOT_MODE', 'full'), \
+                patch.object(scraper, 'DEDUP_ENABLED', dedup), \
+                patch.object(scraper, 'DEDUP_PERSIST', False), \
+                patch.object(scraper, '_dedup_state', None):
+            cycle(data, output_dir)  # warm-up
+            start = time.process_time()
+            for _ in range(cycles):
+                cycle(data, output_dir)
+            return (time.process_time() - start) * 1000 / cycles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1, help="Fleet size multiplier")
+    parser.add_argument('--cycles', type=int, default=20, help="Cycles per measurement")
+    args = parser.parse_args()
+
+    for logger in (scraper.general_logger, scraper.cat_logger):
+        logger.setLevel(logging.WARNING)
+
+    data = generate_flota(args.scale)
+    backend = 'orjson' if 'orjson' in serialization.JSON_BACKENDS else 'stdlib'
+    steps = [('legacy', measure(legacy_cycle, data, args.cycles)),
+             ('single pass, stdlib json', measure(single_pass_cycle, data, args.cycles))]
+    if backend == 'orjson':
+        steps.append(('+ orjson backend',
+                      measure(single_pass_cycle, data, args.cycles, json_backend=backend)))
+    else:
+        print("orjson is not installed: skipping the orjson backend")
+    steps.append(('+ dedup (unchanged cycles)',
+                  measure(single_pass_cycle, data, args.cycles, json_backend=backend,
+                          dedup=True)))
+
+    print(f"trains: {len(data['trenes'])}  cycles: {args.cycles}")
+    previous = None
+    for label, ms in steps:
+        change = f" ({previous / ms:.2f}x vs. the row above)" if previous else ""
+        print(f"{label:<28}: {ms:8.2f} ms CPU/cycle{change}")
+        previous = ms
+
+
+if __name__ == "__main__":
+    main()
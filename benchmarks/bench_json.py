@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Parse/serialize time of flota.json payloads per JSON backend
+
+Usage:
+    python benchmarks/bench_json.py [--payload flota.json] [--scales 1 10]
+
+For each installed backend (orjson, msgspec, stdlib) measures parsing the
+response bytes and encoding the compact and pretty (indent=2) snapshots.
+The 'response.json' row is the previous fetch path: requests decodes the
+body to str, then the stdlib parses it; 'strict schema' parses and validates
+into Train structs (schema.decode_flota, STRICT_SCHEMA=true).
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import schema  # noqa: E402
+import serialization  # noqa: E402
+from benchmarks.synthetic import generate_flota  # noqa: E402
+
+
+def best_of(func, repeat):
+    """Return the fastest wall-clock time of func() in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--payload', type=Path, help="Saved flota.json to use instead")
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10],
+                        help="Synthetic fleet size multipliers")
+    parser.add_argument('--repeat', type=int, default=10, help="Runs per measurement")
+    args = parser.parse_args()
+
+    if args.payload:
+        bodies = [(args.payload.name, args.payload.read_bytes())]
+    else:
+        bodies = [(f"{scale:g}x", json.dumps(generate_flota(scale)).encode('utf-8'))
+                  for scale in args.scales]
+
+    previous = serialization.json_backend()
+    print(f"{'payload':<10}{'backend':<15}{'parse ms':>10}{'compact ms':>12}{'pretty ms':>11}")
+    for label, body in bodies:
+        payload = json.loads(body)
+        parse_ms = best_of(lambda: json.loads(body.decode('utf-8')), args.repeat)
+        print(f"{label:<10}{'response.json':<15}{parse_ms:>10.2f}{'-':>12}{'-':>11}")
+        if schema.available():
+            parse_ms = best_of(lambda: schema.decode_flota(body), args.repeat)
+            print(f"{label:<10}{'strict schema':<15}{parse_ms:>10.2f}{'-':>12}{'-':>11}")
+        for backend in serialization.JSON_BACKENDS:
+            serialization.set_json_backend(backend)
+            parse_ms = best_of(lambda: serialization.loads(body), args.repeat)
+            compact_ms = best_of(lambda: serialization.dumps(payload), args.repeat)
+            pretty_ms = best_of(lambda: serialization.dumps(payload, pretty=True), args.repeat)
+            print(f"{label:<10}{backend:<15}{parse_ms:>10.2f}{compact_ms:>12.2f}"
+                  f"{pretty_ms:>11.2f}")
+    serialization.set_json_backend(previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of filter_cat_trains: legacy tuple-literal filter vs compiled matcher
+
+Usage:
+    python benchmarks/bench_line_filter.py [--scale 10] [--repeat 50]
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import scraper  # noqa: E402
+from benchmarks.synthetic import generate_flota  # noqa: E402
+
+
+def legacy_filter_cat_trains(data):
+    """Pre-matcher implementation: tuple literal and .upper() per record"""
+    trains_list = data.get('trenes', []) if isinstance(data, dict) and 'trenes' in data else data
+    return [
+        item for item in trains_list
+        if isinstance(item, dict) and item.get('codLinea', '').upper() in (
+            'R1', 'R2', 'R2N', 'R2S', 'R3', 'R4', 'R7', 'R8', 'R11', 'R13', 'R14', 'R15', 'R16',
+            'R17', 'RG1', 'RL3', 'RL4', 'RT1', 'RT2'
+        )
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=float, default=10, help="Fleet size multiplier")
+    parser.add_argument('--repeat', type=int, default=50, help="Calls per measurement")
+    args = parser.parse_args()
+
+    data = generate_flota(args.scale)
+    assert legacy_filter_cat_trains(data) == scraper.filter_cat_trains(data)
+
+    results = {}
+    for name, func in [('legacy', legacy_filter_cat_trains),
+                       ('compiled', scraper.filter_cat_trains)]:
+        best = min(timeit.repeat(lambda: func(data), number=args.repeat, repeat=5))
+        results[name] = best * 1000 / args.repeat
+
+    print(f"trains: {len(data['trenes'])}  matcher: {scraper.cat_line_matcher!r}")
+    print(f"legacy   : {results['legacy']:8.3f} ms/call")
+    print(f"compiled : {results['compiled']:8.3f} ms/call "
+          f"({results['legacy'] / results['compiled']:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
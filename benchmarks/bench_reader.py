@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Loading many stored snapshots: sequential dicts vs. pooled dicts vs. Arrow buffers
+
+Usage:
+    python benchmarks/bench_reader.py [--snapshots 240] [--workers 1 2 4] [--scale 1]
+
+Writes synthetic general-prenfe gzip snapshots to a temporary directory and
+loads them (a) sequentially as dicts, (b) across a process pool returning
+pickled dicts, and (c) with reader.read_snapshots, whose workers return one
+Arrow IPC buffer per chunk.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import reader  # noqa: E402
+import serialization  # noqa: E402
+from benchmarks.synthetic import generate_flota  # noqa: E402
+
+
+def load_dicts(path):
+    return serialization.decode_snapshot(path.read_bytes(), 'gzip')
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--snapshots', type=int, default=240, help="Snapshots to load")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help="Process counts to compare")
+    parser.add_argument('--scale', type=float, default=1, help="Synthetic fleet size multiplier")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        start = datetime(2026, 10, 17, 5, 0)
+        paths = []
+        for i in range(args.snapshots):
+            now = start + timedelta(minutes=2 * i)
+            path = Path(tmpdir) / f"general-prenfe_{now:%Y%m%d_%H%M%S}.json.gz"
+            path.write_bytes(serialization.encode_snapshot(
+                generate_flota(args.scale, seed=i, now=now), 'gzip'))
+            paths.append(path)
+
+        _, sequential = timed(lambda: [load_dicts(path) for path in paths])
+        print(f"{'method':<24}{'workers':>8}{'seconds':>9}{'snapshots/s':>13}")
+        print(f"{'sequential dicts':<24}{1:>8}{sequential:>9.2f}"
+              f"{len(paths) / sequential:>13.0f}")
+        for workers in args.workers:
+            def pooled():
+                with ProcessPoolExecutor(workers) as executor:
+                    return list(executor.map(load_dicts, paths, chunksize=8))
+
+            _, pooled_s = timed(pooled)
+            table, arrow_s = timed(lambda: reader.read_snapshots(paths, workers=workers))
+            print(f"{'pooled dicts':<24}{workers:>8}{pooled_s:>9.2f}{len(paths) / pooled_s:>13.0f}")
+            print(f"{'read_snapshots (Arrow)':<24}{workers:>8}{arrow_s:>9.2f}"
+                  f"{len(paths) / arrow_s:>13.0f}")
+        print(f"rows: {table.num_rows}  arrow bytes: {table.nbytes / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
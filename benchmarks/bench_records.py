@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Memory of holding many snapshots: train dicts vs. TrainRecords
+
+Usage:
+    python benchmarks/bench_records.py [--snapshots 60] [--scale 1]
+
+Decodes the same serialized cycles the way a replay job does and measures the
+memory held (tracemalloc) and the decode time with plain dicts and with
+records.parse_payload.
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import records  # noqa: E402
+from benchmarks.synthetic import generate_flota  # noqa: E402
+
+
+def load(encoded_cycles, parse):
+    """Decode every cycle, returning (held snapshots, MiB held, seconds)"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    held = [parse(json.loads(encoded)) for encoded in encoded_cycles]
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return held, current / 2 ** 20, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--snapshots', type=int, default=60, help="Cycles held in memory")
+    parser.add_argument('--scale', type=float, default=1, help="Synthetic fleet size multiplier")
+    args = parser.parse_args()
+
+    start = datetime(2026, 10, 17, 8, 0)
+    encoded_cycles = [
+        json.dumps(generate_flota(args.scale, seed=i, now=start + timedelta(minutes=2 * i)))
+        for i in range(args.snapshots)
+    ]
+    trains = args.snapshots * len(json.loads(encoded_cycles[0])['trenes'])
+    print(f"snapshots: {args.snapshots}  trains held: {trains}")
+
+    _, dict_mib, dict_s = load(encoded_cycles, lambda payload: payload)
+    _, record_mib, record_s = load(encoded_cycles, records.parse_payload)
+    print(f"dicts       : {dict_mib:8.1f} MiB  {dict_s * 1000:8.1f} ms")
+    print(f"TrainRecord : {record_mib:8.1f} MiB  {record_s * 1000:8.1f} ms  "
+          f"({record_mib / dict_mib:.2f}x memory)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Replay throughput over stored snapshot history, by number of worker processes
+
+Usage:
+    python benchmarks/bench_replay.py [--cycles 600] [--workers 1 2 4] [--scale 1]
+
+Writes a synthetic general-prenfe history in delta mode (a gzip keyframe every
+30 cycles, like SNAPSHOT_MODE=delta) to a temporary directory, then re-derives
+prenfe-cat from it with replay.py and reports cycles per second and the time a
+month of 2-minute cycles would take.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import replay  # noqa: E402
+import serialization  # noqa: E402
+import snapshots  # noqa: E402
+from benchmarks.synthetic import generate_flota  # noqa: E402
+
+KEYFRAME_INTERVAL = 30
+CYCLES_PER_MONTH = 30 * 24 * 30  # one cycle every 2 minutes
+
+
+def write_history(directory, cycles, scale):
+    start = datetime(2026, 10, 17, 5, 0)
+    previous = None
+    for i in range(cycles):
+        now = start + timedelta(minutes=2 * i)
+        payload = generate_flota(scale, seed=i, now=now)
+        if i % KEYFRAME_INTERVAL == 0:
+            name = f"general-prenfe_{now:%Y%m%d_%H%M%S}.json.gz"
+            document = payload
+            index, _ = snapshots.index_trains(payload['trenes'])
+        else:
+            name = f"general-prenfe_{now:%Y%m%d_%H%M%S}.delta.json.gz"
+            document, index = snapshots.compute_delta(previous[0], payload, previous[1])
+        previous = (index, name)
+        (directory / name).write_bytes(serialization.encode_snapshot(document, 'gzip'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cycles', type=int, default=600, help="Stored cycles to replay")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help="Process counts to compare")
+    parser.add_argument('--scale', type=float, default=1, help="Synthetic fleet size multiplier")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = Path(tmpdir) / 'data'
+        source.mkdir()
+        write_history(source, args.cycles, args.scale)
+        print(f"{'workers':<9}{'seconds':>9}{'cycles/s':>10}{'month (min)':>13}")
+        for workers in args.workers:
+            started = time.perf_counter()
+            stats = replay.replay(source, Path(tmpdir) / f'out-{workers}',
+                                  cat_filter='R*,RG1,RL*,RT*', workers=workers)
+            elapsed = time.perf_counter() - started
+            rate = stats['cycles'] / elapsed
+            print(f"{workers:<9}{elapsed:>9.2f}{rate:>10.0f}{CYCLES_PER_MONTH / rate / 60:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Locating and reading one snapshot: per-cycle files vs. the local snapshot store
+
+Usage:
+    python benchmarks/bench_store.py [--snapshots 20000] [--lookups 200]
+
+Stores the same small snapshots as <flow>_<ts>.json files and in a
+store.SnapshotStore, then times finding and reading the snapshot at or
+before random points in time: listing and parsing the file names (what
+snapshots.reconstruct does) vs. a binary search over the store's index.
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import snapshots  # noqa: E402
+import store  # noqa: E402
+
+FLOW = 'general-prenfe'
+
+
+def lookup_files(directory, at):
+    candidates = [item for item in snapshots.list_snapshots(directory, FLOW) if item[0] <= at]
+    return candidates[-1][2].read_bytes()
+
+
+def lookup_store(local_store, at):
+    return local_store.read(local_store.locate(at))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--snapshots', type=int, default=20000, help="Stored cycles")
+    parser.add_argument('--lookups', type=int, default=200, help="Random lookups to time")
+    args = parser.parse_args()
+
+    start = datetime(2026, 1, 1, 5, 0)
+    times = [start + timedelta(minutes=2 * i) for i in range(args.snapshots)]
+    rng = random.Random(0)
+    points = [rng.choice(times) + timedelta(seconds=30) for _ in range(args.lookups)]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files_dir = Path(tmpdir) / 'files'
+        files_dir.mkdir()
+        local_store = store.SnapshotStore(Path(tmpdir) / 'store', FLOW, writable=True)
+        for i, when in enumerate(times):
+            encoded = b'{"trenes":[{"codComercial":"%d"}]}' % i
+            (files_dir / f"{FLOW}_{when:%Y%m%d_%H%M%S}.json").write_bytes(encoded)
+        started = time.perf_counter()
+        for i, when in enumerate(times):
+            local_store.append(when, b'{"trenes":[{"codComercial":"%d"}]}' % i)
+        append_s = time.perf_counter() - started
+
+        print(f"{'method':<16}{'ms/lookup':>11}")
+        for label, lookup, target in (('files', lookup_files, files_dir),
+                                      ('store', lookup_store, local_store)):
+            started = time.perf_counter()
+            for at in points:
+                lookup(target, at)
+            elapsed = time.perf_counter() - started
+            print(f"{label:<16}{elapsed / len(points) * 1000:>11.3f}")
+        print(f"store append: {append_s / len(times) * 1000:.3f} ms/snapshot (fsynced)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite over the cycle's hot path on 1x/10x/100x synthetic fleets
+
+Usage:
+    python benchmarks/bench_suite.py [--scales 1 10 100] [--repeats 5] [--only NAME ...]
+                                     [--output results.json] [--compare baseline.json]
+
+Times fetch + parse (fetch_flota_data on a canned response), filter_cat_trains,
+analyze_flota_data, partition_flota_data, snapshot encoding/decoding and the
+full save_flota_data path, uploading to files (STORAGE_BACKEND=local, see
+object_storage.py). Results are printed as a table and, with --output,
+written as JSON with the environment they were measured in. --compare reports
+each median against a previous JSON run and exits with status 1 when one is
+slower than --tolerance allows, so runs can be tracked for regressions.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import object_storage  # noqa: E402
+import scraper  # noqa: E402
+import serialization  # noqa: E402
+from benchmarks.synthetic import generate_flota  # noqa: E402
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def bench_fetch_parse(data, workdir):
+    body = serialization.dumps(data)
+    response = Mock(status_code=200, content=body, headers={})
+
+    def run():
+        scraper._fetch_validators['body_hash'] = None
+        with patch('scraper.session.get', return_value=response):
+            return scraper.fetch_flota_data()
+
+    return run
+
+
+def bench_filter(data, workdir):
+    return lambda: scraper.filter_cat_trains(data)
+
+
+def bench_analyze(data, workdir):
+    return lambda: scraper.analyze_flota_data(data)
+
+
+def bench_partition(data, workdir):
+    return lambda: scraper.partition_flota_data(data)
+
+
+def bench_encode(codec):
+    def bench(data, workdir):
+        return lambda: serialization.encode_snapshot(data, codec)
+    return bench
+
+
+def bench_decode(codec):
+    def bench(data, workdir):
+        encoded = serialization.encode_snapshot(data, codec)
+        return lambda: serialization.decode_snapshot(encoded, codec)
+    return bench
+
+
+def bench_save(data, workdir):
+    backend = object_storage.LocalBackend(workdir / 'bucket')
+    output_dir = workdir / 'data'
+    output_dir.mkdir()
+    patches = [
+        patch.object(scraper, 'GCS_ENABLED', True),
+        patch.object(scraper, 'storage_backend', backend),
+        patch.object(scraper, 'OUTPUT_DIR', output_dir),
+        patch.object(scraper, 'KEEP_LOCAL_COPY', False),
+        patch.object(scraper, 'DEDUP_ENABLED', False),  # store every cycle in full
+        patch.object(scraper, 'schedule_output_maintenance', lambda: None),
+    ]
+
+    def run():
+        for p in patches:
+            p.start()
+        try:
+            scraper.save_flota_data(data)
+        finally:
+            for p in reversed(patches):
+                p.stop()
+
+    return run
+
+
+# Benchmark name -> factory(data, workdir) returning the callable to time
+BENCHMARKS = {
+    'fetch_parse': bench_fetch_parse,
+    'filter_cat_trains': bench_filter,
+    'analyze_flota_data': bench_analyze,
+    'partition_flota_data': bench_partition,
+    'encode_json': bench_encode('json'),
+    'encode_gzip': bench_encode('gzip'),
+    'decode_gzip': bench_decode('gzip'),
+    'save_flota_data': bench_save,
+}
+
+
+def measure(func, repeats):
+    """Run func once to warm up, then time it; returns durations in milliseconds"""
+    func()
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - started) * 1000)
+    return durations
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'json_backend': serialization.json_backend(),
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    """Print medians against a previous run; returns True if none regressed"""
+    baseline = {(row['name'], row['scale']): row
+                for row in json.loads(Path(baseline_path).read_text())['results']}
+    ok = True
+    print(f"\nvs. {baseline_path} (tolerance {tolerance:.0%})")
+    for row in results:
+        previous = baseline.get((row['name'], row['scale']))
+        if previous is None:
+            continue
+        ratio = row['median_ms'] / previous['median_ms']
+        regressed = ratio > 1 + tolerance
+        ok = ok and not regressed
+        print(f"{row['name']:<22}{row['scale']:>6g}x{ratio:>8.2f}x"
+              f"{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100],
+                        help="Fleet sizes as multiples of the real train count")
+    parser.add_argument('--repeats', type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="Benchmarks to run")
+    parser.add_argument('--output', type=Path, help="Write the results as JSON here")
+    parser.add_argument('--compare', type=Path, help="Previous JSON results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed median slowdown vs. --compare before failing (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    for logger in (scraper.general_logger, scraper.cat_logger):
+        logger.setLevel(logging.WARNING)
+
+    results = []
+    print(f"{'benchmark':<22}{'scale':>7}{'trains':>8}{'min ms':>10}{'median ms':>11}")
+    for scale in args.scales:
+        data = generate_flota(scale)
+        for name in args.only or BENCHMARKS:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                durations = measure(BENCHMARKS[name](data, Path(tmpdir)), args.repeats)
+            row = {
+                'name': name,
+                'scale': scale,
+                'trains': len(data['trenes']),
+                'repeats': args.repeats,
+                'min_ms': min(durations),
+                'median_ms': statistics.median(durations),
+                'mean_ms': statistics.fmean(durations),
+            }
+            results.append(row)
+            print(f"{name:<22}{scale:>6g}x{row['trains']:>8}{row['min_ms']:>10.2f}"
+                  f"{row['median_ms']:>11.2f}")
+
+    if args.output:
+        report = {'environment': environment(), 'results': results}
+        args.output.write_text(json.dumps(report, indent=2) + '\n', encoding='utf-8')
+        print(f"\nWrote {args.output}")
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Uploading a large batch archive: one stream vs. parallel composite uploads
+
+Usage:
+    python benchmarks/bench_upload.py [--size-mb 256] [--stream-mbps 400] [--parallel 1 2 4 8]
+
+Uploads through object_storage.GcsBackend to a simulated bucket whose
+connections each carry at most --stream-mbps (what one TCP stream to GCS
+gets over a long path), so the timings show how composite uploads scale
+with parallel_uploads when the link has more bandwidth than one stream.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import object_storage  # noqa: E402
+
+
+class SimulatedBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.content_type = self.content_encoding = None
+
+    def upload_from_string(self, data, content_type=None):
+        time.sleep(len(data) / self.bucket.stream_bytes_per_s)
+        self.bucket.objects[self.name] = len(data)
+
+    def compose(self, sources):
+        self.bucket.objects[self.name] = sum(self.bucket.objects[s.name] for s in sources)
+
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+
+class SimulatedBucket:
+    def __init__(self, stream_bytes_per_s):
+        self.stream_bytes_per_s = stream_bytes_per_s
+        self.objects = {}
+
+    def blob(self, name):
+        return SimulatedBlob(self, name)
+
+
+class SimulatedClient:
+    def __init__(self, stream_bytes_per_s):
+        self._bucket = SimulatedBucket(stream_bytes_per_s)
+
+    def bucket(self, name):
+        return self._bucket
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=256, help="Archive size in MiB")
+    parser.add_argument('--stream-mbps', type=float, default=400,
+                        help="Bandwidth of one connection in Mbit/s")
+    parser.add_argument('--parallel', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="parallel_uploads values to time")
+    args = parser.parse_args()
+
+    data = bytes(args.size_mb * 1024 ** 2)
+    client = SimulatedClient(args.stream_mbps * 1e6 / 8)
+    print(f"{'parallel':>8}{'seconds':>10}{'MiB/s':>9}")
+    for parallel in args.parallel:
+        # A chunk size above the part size keeps every part to one request
+        backend = object_storage.GcsBackend('bench', client, chunk_size=len(data),
+                                            composite_threshold=1, parallel_uploads=parallel)
+        started = time.perf_counter()
+        backend.upload('prenfe-data/archive.json.gz', data, 'application/json', 'gzip')
+        elapsed = time.perf_counter() - started
+        assert client._bucket.objects == {'prenfe-data/archive.json.gz': len(data)}
+        print(f"{parallel:>8}{elapsed:>10.2f}{args.size_mb / elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
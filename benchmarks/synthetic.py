@@ -0,0 +1,82 @@
+"""
+Synthetic flota.json generator for benchmarks
+
+Builds fleets shaped like the RENFE payload: a dict with 'fechaActualizacion'
+and a 'trenes' list whose records carry the same fields and line mix the live
+feed returns.
+"""
+
+import random
+from datetime import datetime
+
+# Train count of a typical peak-hour flota.json response
+REAL_TRAIN_COUNT = 800
+
+# (line code, nucleo, relative weight) - regional Catalan lines are ~20% of the fleet
+LINE_MIX = [
+    ('C1', '10', 6), ('C2', '10', 4), ('C3', '10', 5), ('C4', '10', 6), ('C5', '10', 7),
+    ('C7', '10', 4), ('C8', '10', 3), ('C10', '10', 4),
+    ('R1', '50', 4), ('R2', '50', 2), ('R2N', '50', 3), ('R2S', '50', 3), ('R3', '50', 2),
+    ('R4', '50', 3), ('R7', '50', 1), ('R8', '50', 1), ('R11', '50', 1), ('R13', '50', 1),
+    ('R14', '50', 1), ('R15', '50', 1), ('R16', '50', 1), ('RG1', '50', 1),
+    ('C1', '40', 3), ('C2', '40', 2), ('C3', '40', 2), ('C6', '40', 2),
+    ('C1', '61', 2), ('C2', '61', 1), ('C1', '70', 2),
+    ('AVE', '', 5), ('ALVIA', '', 2), ('AVANT', '', 3), ('MD', '', 4), ('REG', '', 3), ('', '', 2),
+]
+
+
+def generate_train(rng, index, timestamp_ms):
+    """
+    Build one train record
+
+    Args:
+        rng (random.Random): Random source
+        index (int): Sequence number, used to derive a unique train id
+        timestamp_ms (int): Position timestamp in milliseconds
+
+    Returns:
+        dict: Train record with flota.json field names
+    """
+    line_code, nucleo, _ = rng.choices(LINE_MIX, weights=[w for _, _, w in LINE_MIX])[0]
+    origin, destination, current, following = rng.sample(range(60000, 79999), 4)
+    return {
+        'codComercial': f"{10000 + index:05d}",
+        'codProducto': rng.choice([11, 13, 16, 17, 18, 28]),
+        'codLinea': line_code,
+        'nucleo': nucleo,
+        'codEstOrig': str(origin),
+        'codEstDest': str(destination),
+        'codEstAct': str(current),
+        'codEstSig': str(following),
+        'horaLlegadaSigEst': f"{rng.randint(5, 23):02d}:{rng.randint(0, 59):02d}",
+        'latitud': round(rng.uniform(36.0, 43.5), 6),
+        'longitud': round(rng.uniform(-9.0, 3.3), 6),
+        'ultRetraso': str(max(0, int(rng.gauss(2, 4)))),
+        'accesible': rng.random() < 0.8,
+        'via': str(rng.randint(1, 12)),
+        'nextVia': rng.randint(1, 12),
+        'time': timestamp_ms - rng.randint(0, 60000),
+        'mat': f"{rng.choice(['447', '450', '463', '465', '470'])}-{rng.randint(1, 300):03d}",
+    }
+
+
+def generate_flota(scale=1, seed=0, now=None):
+    """
+    Generate a synthetic flota.json payload
+
+    Args:
+        scale (float): Fleet size as a multiple of REAL_TRAIN_COUNT
+        seed (int): Random seed, so repeated runs produce the same fleet
+        now (datetime): Update timestamp (defaults to the current time)
+
+    Returns:
+        dict: Payload with 'fechaActualizacion' and 'trenes'
+    """
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    timestamp_ms = int(now.timestamp() * 1000)
+    count = int(REAL_TRAIN_COUNT * scale)
+    return {
+        'fechaActualizacion': now.strftime("%Y-%m-%dT%H:%M:%S"),
+        'trenes': [generate_train(rng, i, timestamp_ms) for i in range(count)],
+    }
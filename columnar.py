@@ -0,0 +1,238 @@
+"""
+Columnar (Parquet / Arrow IPC) snapshots of the train fleet
+
+Trains are written with a stable typed schema (COLUMNS) so that files from
+different cycles concatenate without schema drift: codes are strings even
+when the feed sends numbers, delays and product codes are integers, positions
+are doubles and 'time' is a UTC millisecond timestamp. Values that do not
+convert are stored as nulls, fields outside the schema are dropped, and every
+row carries the cycle's fetch time in 'fetched_at'.
+
+Formats:
+- parquet: Parquet file, zstd-compressed column chunks
+- arrow: Arrow IPC file (Feather v2), zstd-compressed buffers
+
+Requires the pyarrow package (pip install prenfe-scraper[columnar]).
+"""
+
+from datetime import timezone
+
+import records
+import snapshots
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional dependency
+    pyarrow = None
+
+# Format name -> file extension and Content-Type
+FORMATS = {
+    'parquet': {'extension': '.parquet', 'content_type': 'application/vnd.apache.parquet'},
+    'arrow': {'extension': '.arrow', 'content_type': 'application/vnd.apache.arrow.file'},
+}
+
+# Column name -> type, in file order ('fetched_at' is appended to every file)
+COLUMNS = [
+    ('codComercial', 'string'),
+    ('codProducto', 'int32'),
+    ('codLinea', 'string'),
+    ('nucleo', 'string'),
+    ('codEstOrig', 'string'),
+    ('codEstDest', 'string'),
+    ('codEstAct', 'string'),
+    ('codEstSig', 'string'),
+    ('horaLlegadaSigEst', 'string'),
+    ('latitud', 'float64'),
+    ('longitud', 'float64'),
+    ('ultRetraso', 'int32'),
+    ('accesible', 'bool'),
+    ('via', 'string'),
+    ('nextVia', 'string'),
+    ('time', 'timestamp'),
+    ('mat', 'string'),
+]
+FETCHED_AT_COLUMN = 'fetched_at'
+
+
+def available():
+    """Return True if pyarrow is installed"""
+    return pyarrow is not None
+
+
+def _to_string(value):
+    if value is None or value == '':
+        return None
+    return str(value)
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true')
+    return None if value is None else bool(value)
+
+
+# Numeric strings pyarrow casts exactly like int()/float() (others take the slow path)
+_NUMERIC_STRINGS = {
+    'int32': r'^[+-]?\d+$',
+    'float64': r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$',
+}
+
+# 'timestamp' values are epoch milliseconds, which pyarrow takes as integers
+_CONVERTERS = {
+    'string': _to_string,
+    'int32': _to_int,
+    'float64': _to_float,
+    'bool': _to_bool,
+    'timestamp': _to_int,
+}
+
+
+def schema():
+    """
+    Build the Arrow schema of columnar snapshots
+
+    Returns:
+        pyarrow.Schema: COLUMNS plus the fetched_at column
+    """
+    types = {
+        'string': pyarrow.string(),
+        'int32': pyarrow.int32(),
+        'float64': pyarrow.float64(),
+        'bool': pyarrow.bool_(),
+        'timestamp': pyarrow.timestamp('ms', tz='UTC'),
+    }
+    fields = [pyarrow.field(name, types[kind]) for name, kind in COLUMNS]
+    fields.append(pyarrow.field(FETCHED_AT_COLUMN, pyarrow.timestamp('ms', tz='UTC'),
+                                nullable=False))
+    return pyarrow.schema(fields)
+
+
+def trains_to_table(trains, fetched_at):
+    """
+    Convert train records to an Arrow table with the columnar schema
+
+    Args:
+        trains (list): Train dicts or TrainRecords (other items are skipped)
+        fetched_at (datetime): Fetch time of the cycle (naive = local time)
+
+    Returns:
+        pyarrow.Table: One row per train
+    """
+    if pyarrow is None:
+        raise ValueError("Columnar output requires the pyarrow package")
+
+    rows = [item for item in trains if isinstance(item, records.TRAIN_TYPES)]
+    target = schema()
+    arrays = [
+        _column_array([item.get(name) for item in rows], kind, field.type)
+        for (name, kind), field in zip(COLUMNS, target)
+    ]
+
+    fetched_ms = int(fetched_at.astimezone(timezone.utc).timestamp() * 1000)
+    fetched_type = target.field(FETCHED_AT_COLUMN).type
+    arrays.append(pyarrow.array([fetched_ms] * len(rows), type=fetched_type))
+    return pyarrow.Table.from_arrays(arrays, schema=target)
+
+
+def _column_array(values, kind, arrow_type):
+    """
+    Build one column, converting in pyarrow when the values allow it
+
+    Columns the feed sends with the declared type (or, for numbers, as
+    numeric strings) are converted by pyarrow in C; any other value sends the
+    whole column through the per-value converter, so results are identical.
+    """
+    try:
+        array = pyarrow.array(values, type=arrow_type)
+        if kind == 'string' and '' in values:  # empty codes are stored as nulls
+            array = pyarrow.compute.if_else(pyarrow.compute.equal(array, ''),
+                                            pyarrow.scalar(None, arrow_type), array)
+        return array
+    except (TypeError, ValueError, OverflowError):
+        if kind in _NUMERIC_STRINGS:
+            try:
+                strings = pyarrow.array(values, type=pyarrow.string())
+                if pyarrow.compute.all(
+                        pyarrow.compute.match_substring_regex(strings, _NUMERIC_STRINGS[kind])
+                ).as_py() is not False:
+                    return strings.cast(arrow_type)
+            except (TypeError, ValueError, OverflowError):
+                pass
+    convert = _CONVERTERS[kind]
+    return pyarrow.array([convert(value) for value in values], type=arrow_type)
+
+
+def encode_table(table, fmt='parquet'):
+    """
+    Serialize an Arrow table
+
+    Args:
+        table (pyarrow.Table): Table from trains_to_table
+        fmt (str): 'parquet' or 'arrow'
+
+    Returns:
+        bytes: The encoded file
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown columnar format '{fmt}', expected one of {sorted(FORMATS)}")
+
+    sink = pyarrow.BufferOutputStream()
+    if fmt == 'parquet':
+        pyarrow.parquet.write_table(table, sink, compression='zstd')
+    else:
+        options = pyarrow.ipc.IpcWriteOptions(compression='zstd')
+        with pyarrow.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_table(data, fmt='parquet'):
+    """
+    Read bytes produced by encode_table
+
+    Args:
+        data (bytes): The encoded file
+        fmt (str): 'parquet' or 'arrow'
+
+    Returns:
+        pyarrow.Table: The decoded table
+    """
+    if fmt == 'parquet':
+        return pyarrow.parquet.read_table(pyarrow.BufferReader(data))
+    return pyarrow.ipc.open_file(pyarrow.BufferReader(data)).read_all()
+
+
+def encode_columnar(payload, fetched_at, fmt='parquet'):
+    """
+    Encode a flow payload's trains as a columnar file
+
+    Args:
+        payload (dict or list): The flow payload (trains list or dict with 'trenes')
+        fetched_at (datetime): Fetch time of the cycle
+        fmt (str): 'parquet' or 'arrow'
+
+    Returns:
+        bytes: The encoded file
+
+    Raises:
+        ValueError: If pyarrow is missing or the payload has no trains list
+    """
+    trains, _ = snapshots.split_payload(payload)
+    return encode_table(trains_to_table(trains, fetched_at), fmt)
@@ -0,0 +1,238 @@
+"""
+Declarative flow registry for the scraper
+
+A flow selects trains from the fleet (by line-code filter and optional field
+values), optionally projects them to a subset of fields, and is stored with
+its own codec and GCS folder. Flows are defined in a TOML file:
+
+    [[flows]]
+    name = "general-prenfe"
+    lines = "*"                  # line filter, see line_filter.py
+    envelope = true              # keep the top-level payload (fechaActualizacion, ...)
+
+    [[flows]]
+    name = "prenfe-madrid"
+    lines = "C*"
+    match = { nucleo = ["10"] }  # extra field filters (any listed value matches)
+    fields = ["codComercial", "codLinea", "codEstAct", "latitud", "longitud"]
+    codec = "gzip"               # defaults to OUTPUT_CODEC
+    destination = "prenfe-madrid"  # GCS folder, defaults to GCS_FOLDER_NAME
+    skip_empty = true            # store nothing when no train matches
+    columnar = "parquet"         # also store a Parquet or Arrow file (see columnar.py)
+
+evaluate_flows() evaluates every flow in one pass over the trains list.
+"""
+
+import tomllib
+
+import columnar as columnar_module
+import line_filter
+import records
+import serialization
+
+# Regional lines kept by the prenfe-cat flow: exact codes, 'RL*' prefixes and
+# 're:<regex>' patterns, comma-separated (see line_filter.py)
+DEFAULT_CAT_LINE_FILTER = (
+    'R1,R2,R2N,R2S,R3,R4,R7,R8,R11,R13,R14,R15,R16,R17,'
+    'RG1,RL3,RL4,RT1,RT2'
+)
+
+FLOW_KEYS = {
+    'name', 'lines', 'match', 'fields', 'envelope', 'codec', 'destination', 'skip_empty',
+    'columnar',
+}
+
+
+class Flow:
+    """A configured flow (see the module docstring for the options)"""
+
+    def __init__(self, name, lines='*', match=None, fields=None, envelope=False, codec=None,
+                 destination=None, skip_empty=False, columnar=None):
+        if not name:
+            raise ValueError("Flow needs a name")
+        if codec is not None and codec not in serialization.CODECS:
+            raise ValueError(f"Flow '{name}': unknown codec '{codec}'")
+        if columnar is not None and columnar not in columnar_module.FORMATS:
+            raise ValueError(f"Flow '{name}': unknown columnar format '{columnar}'")
+        if match is not None and not isinstance(match, dict):
+            raise ValueError(f"Flow '{name}': match must be a table of field = [values]")
+        for field, values in (match or {}).items():
+            if not isinstance(values, (list, tuple, set, frozenset)):
+                raise ValueError(f"Flow '{name}': match.{field} must be a list of values, "
+                                 f"e.g. {field} = [{values!r}]")
+        self.name = name
+        self.lines = lines
+        self.matcher = line_filter.compile_line_filter(lines)
+        self.match = {
+            field: frozenset(str(value).upper() for value in values)
+            for field, values in (match or {}).items()
+        }
+        self.fields = tuple(fields) if fields else None
+        self.envelope = envelope
+        self.codec = codec
+        self.destination = destination
+        self.skip_empty = skip_empty
+        self.columnar = columnar
+
+    def accepts(self, line_code, values):
+        """
+        Check a train against the flow filters
+
+        Args:
+            line_code (str): Raw codLinea ('' if missing)
+            values (dict): Field -> value for the fields in self.match
+
+        Returns:
+            bool: True if the train belongs to the flow
+        """
+        if not self.matcher(line_code):
+            return False
+        for field, allowed in self.match.items():
+            value = values.get(field)
+            if value is None or str(value).upper() not in allowed:
+                return False
+        return True
+
+    def __repr__(self):
+        return f"Flow({self.name!r}, lines={self.lines!r})"
+
+
+def default_flows(cat_line_filter=DEFAULT_CAT_LINE_FILTER, general_columnar=None):
+    """
+    Built-in registry: the general-prenfe and prenfe-cat flows
+
+    Args:
+        cat_line_filter (str): Line filter spec for prenfe-cat (default:
+            DEFAULT_CAT_LINE_FILTER, the scraper's default)
+        general_columnar (str): Columnar format also stored for general-prenfe
+
+    Returns:
+        list: Flow objects
+    """
+    return [
+        Flow('general-prenfe', lines='*', envelope=True, columnar=general_columnar),
+        Flow('prenfe-cat', lines=cat_line_filter, skip_empty=True),
+    ]
+
+
+def load_flows(path):
+    """
+    Load a flow registry from a TOML file
+
+    Args:
+        path (Path): TOML file with a [[flows]] array
+
+    Returns:
+        list: Flow objects
+
+    Raises:
+        ValueError: If the file is invalid
+    """
+    try:
+        with open(path, 'rb') as f:
+            config = tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        raise ValueError(f"Cannot read flow config {path}: {e}") from e
+
+    definitions = config.get('flows')
+    if not definitions:
+        raise ValueError(f"{path} defines no [[flows]]")
+
+    flows = []
+    for definition in definitions:
+        unknown = set(definition) - FLOW_KEYS
+        if unknown:
+            raise ValueError(f"Flow {definition.get('name')!r}: unknown keys {sorted(unknown)}")
+        flows.append(Flow(**definition))
+
+    names = [flow.name for flow in flows]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate flow names in {path}")
+    return flows
+
+
+def evaluate_flows(flows, data):
+    """
+    Select, project and count every flow's trains in a single pass
+
+    Each train is classified once per distinct combination of codLinea and
+    match-field values (memoized), then appended and counted for each flow it
+    belongs to. A flow that takes every train unprojected with its envelope
+    reuses the input payload instead of copying it.
+
+    Args:
+        flows (list): Flow objects
+        data (dict or list): The flota data
+
+    Returns:
+        dict: Flow name -> {'payload', 'analysis', 'rows'} with analysis
+        holding 'total_trains' and 'line_counts', and rows the positions of
+        the flow's trains in the input trains list (None when it takes them
+        all), for analytics.FleetColumns
+    """
+    results = {
+        flow.name: {
+            'payload': data,
+            'analysis': {'total_trains': 0, 'line_counts': {}},
+            'rows': None,
+        }
+        for flow in flows
+    }
+
+    # Extract trenes array if wrapped in dict
+    trains_list = data.get('trenes', []) if isinstance(data, dict) and 'trenes' in data else data
+    if not isinstance(trains_list, list):
+        return results
+
+    match_fields = sorted({field for flow in flows for field in flow.match})
+    selected = [[] for _ in flows]
+    positions = [[] for _ in flows]
+    counts = [results[flow.name]['analysis']['line_counts'] for flow in flows]
+    passthrough = [
+        flow.envelope and flow.fields is None and flow.matcher.match_all and not flow.match
+        for flow in flows
+    ]
+
+    # (codLinea, match field values...) -> (normalized line code, indices of matching flows)
+    classified = {}
+    for position, item in enumerate(trains_list):
+        if not isinstance(item, records.TRAIN_TYPES):
+            continue
+        raw_code = item.get('codLinea')
+        key = (raw_code, *[item.get(field) for field in match_fields]) if match_fields \
+            else raw_code
+        info = classified.get(key)
+        if info is None:
+            values = {field: item.get(field) for field in match_fields}
+            line_code = 'UNKNOWN' if raw_code is None else raw_code.upper()
+            members = tuple(
+                i for i, flow in enumerate(flows)
+                if flow.accepts('' if raw_code is None else raw_code, values)
+            )
+            info = classified[key] = (line_code, members)
+
+        line_code, members = info
+        for i in members:
+            line_counts = counts[i]
+            line_counts[line_code] = line_counts.get(line_code, 0) + 1
+            if passthrough[i]:
+                continue
+            positions[i].append(position)
+            fields = flows[i].fields
+            selected[i].append(
+                item if fields is None else {f: item[f] for f in fields if f in item}
+            )
+
+    for i, flow in enumerate(flows):
+        analysis = results[flow.name]['analysis']
+        if passthrough[i]:
+            analysis['total_trains'] = len(trains_list)
+            continue
+        analysis['total_trains'] = len(selected[i])
+        results[flow.name]['rows'] = positions[i]
+        if flow.envelope and isinstance(data, dict):
+            results[flow.name]['payload'] = {**data, 'trenes': selected[i]}
+        else:
+            results[flow.name]['payload'] = selected[i]
+
+    return results
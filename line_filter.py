@@ -0,0 +1,108 @@
+"""
+Line-code filters for the scraper flows
+
+A filter spec is a list of patterns (or one comma-separated string):
+- Exact codes: 'R1', 'RG1'
+- Prefixes, with a trailing '*': 'RL*', 'RT*' ('*' alone matches every line)
+- Regular expressions, with a 're:' prefix: 're:^R\\d+[NS]?$'
+
+Matching is case-insensitive. Specs are compiled once into a LineMatcher that
+checks a frozenset of exact codes, a tuple of prefixes (str.startswith) and a
+single combined regex, and memoizes the result per line code: a fleet has a
+few dozen distinct codes, so after the first cycle a match is one dict lookup.
+"""
+
+import re
+
+# Memoized codes per matcher; beyond this, results are computed but not stored
+MAX_CACHED_CODES = 4096
+
+
+class LineMatcher:
+    """Compiled line-code filter (see compile_line_filter)"""
+
+    def __init__(self, exact=(), prefixes=(), patterns=()):
+        self.exact = frozenset(code.upper() for code in exact)
+        self.prefixes = tuple(sorted({prefix.upper() for prefix in prefixes}))
+        self.regex = re.compile('|'.join(f'(?:{p})' for p in patterns), re.IGNORECASE) \
+            if patterns else None
+        self.match_all = '' in self.prefixes
+        self._cache = {}
+
+    def __call__(self, line_code):
+        """
+        Check whether a line code passes the filter
+
+        Args:
+            line_code (str): Line code, in any case
+
+        Returns:
+            bool: True if the code matches any pattern
+        """
+        result = self._cache.get(line_code)
+        if result is None:
+            result = self._match(line_code)
+            if len(self._cache) < MAX_CACHED_CODES:
+                self._cache[line_code] = result
+        return result
+
+    def _match(self, line_code):
+        if self.match_all:
+            return True
+        code = line_code.upper()
+        if code in self.exact:
+            return True
+        if self.prefixes and code.startswith(self.prefixes):
+            return True
+        return self.regex is not None and self.regex.search(code) is not None
+
+    def __repr__(self):
+        return (f"LineMatcher(exact={sorted(self.exact)}, prefixes={list(self.prefixes)}, "
+                f"regex={self.regex.pattern if self.regex else None!r})")
+
+
+def parse_line_filter(spec):
+    """
+    Split a filter spec into exact codes, prefixes and regex patterns
+
+    Args:
+        spec (str or iterable): Comma-separated string or list of patterns
+
+    Returns:
+        tuple: (exact codes, prefixes, regex patterns)
+    """
+    if isinstance(spec, str):
+        spec = spec.split(',')
+
+    exact, prefixes, patterns = [], [], []
+    for raw in spec:
+        pattern = raw.strip()
+        if not pattern:
+            continue
+        if pattern.startswith('re:'):
+            patterns.append(pattern[3:])
+        elif pattern.endswith('*'):
+            prefixes.append(pattern[:-1])
+        else:
+            exact.append(pattern)
+    return exact, prefixes, patterns
+
+
+def compile_line_filter(spec):
+    """
+    Compile a filter spec into a LineMatcher
+
+    Args:
+        spec (str or iterable): Comma-separated string or list of patterns
+
+    Returns:
+        LineMatcher: The compiled matcher
+
+    Raises:
+        ValueError: If a regex pattern is invalid
+    """
+    exact, prefixes, patterns = parse_line_filter(spec)
+    try:
+        return LineMatcher(exact, prefixes, patterns)
+    except re.error as e:
+        raise ValueError(f"Invalid line filter regex: {e}") from e
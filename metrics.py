@@ -0,0 +1,213 @@
+"""
+In-process Prometheus metrics, rendered for the /metrics route
+
+Counters, gauges and histograms with labels, kept in a registry and rendered
+in the Prometheus text exposition format (version 0.0.4) without extra
+dependencies:
+
+    stage_seconds = metrics.Histogram('prenfe_stage_seconds', "Stage duration", ('stage',))
+    with stage_seconds.timer(stage='fetch'):
+        ...
+    metrics.render()
+
+Values live in the process and start from zero when it restarts; every Cloud
+Run instance exposes its own, and Prometheus aggregates them.
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds (seconds) covering sub-millisecond encodes to multi-second fetches
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = [
+        (name, str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for name, value in pairs
+    ]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Registry:
+    """Metrics rendered together by render()"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Add a metric
+
+        Raises:
+            ValueError: If a metric with the same name is registered
+        """
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"Metric '{metric.name}' is already registered")
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text format
+
+        Returns:
+            str: The exposition, one sample per line
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up, e.g. requests or rejected trains
+
+    Args:
+        name (str): Metric name, ending in _total by convention
+        help (str): Description
+        labelnames (tuple): Label names every sample must set
+        registry (Registry): Registry to add it to (None for none)
+    """
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Add a non-negative amount to the labelled counter"""
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Current value of the labelled counter"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self._items()]
+
+
+class Gauge(Counter):
+    """A value that can go up and down, e.g. the time of the last good cycle"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        """Set the labelled gauge"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, e.g. stage durations or response sizes
+
+    Args:
+        name (str): Metric name
+        help (str): Description
+        labelnames (tuple): Label names every sample must set
+        buckets (tuple): Increasing bucket upper bounds; +Inf is added
+        registry (Registry): Registry to add it to (None for none)
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(float(bound) for bound in buckets)) + (math.inf,)
+        super().__init__(name, help, labelnames, registry)
+
+    def observe(self, value, **labels):
+        """Record one value in the labelled histogram"""
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0}
+            state['counts'][position] += 1
+            state['sum'] += value
+
+    @contextmanager
+    def timer(self, **labels):
+        """Observe the seconds spent in the with block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        """Number of values observed in the labelled histogram"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return sum(state['counts']) if state else 0
+
+    def samples(self):
+        lines = []
+        for key, state in self._items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render():
+    """Render the default registry in the Prometheus text format"""
+    return REGISTRY.render()
@@ -0,0 +1,310 @@
+"""
+Pluggable object storage for uploads: GCS, a local directory or memory
+
+The scraper uploads snapshots, batches and its dedup state through a backend
+selected by STORAGE_BACKEND, so the whole trigger can run and be load-tested
+without credentials or network access:
+
+- gcs: a Cloud Storage bucket. With STORAGE_EMULATOR_HOST set (e.g.
+  http://localhost:4443 for fake-gcs-server), the google-cloud-storage
+  client talks to the emulator with anonymous credentials, and the bucket is
+  created there if missing.
+- local: <root>/<bucket>/<object name> files, e.g. on a laptop or in CI
+- memory: a dict in the process, for tests and benchmarks
+
+Object names are full names within the bucket, e.g.
+'prenfe-data/general-prenfe_20261017_080000.json'.
+
+GCS uploads pick their mode by size:
+- up to one chunk: a single request (upload_from_string)
+- larger: a resumable session sent in chunk_size chunks. A chunk that fails
+  with a connection error, 408, 429 or 5xx does not restart the upload: the
+  session is asked how many bytes it committed and the upload resumes from
+  there, up to max_resumes times per object.
+- from composite_threshold (e.g. daily batch archives): parallel_uploads
+  parts uploaded concurrently as temporary objects, each over its own
+  connection, then joined with one compose request and deleted
+"""
+
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from google.cloud import storage
+
+BACKENDS = ('gcs', 'local', 'memory')
+
+# Resumable chunks must be multiples of 256 KiB
+CHUNK_ALIGNMENT = 256 * 1024
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+# A compose request takes at most 32 source objects
+MAX_COMPOSE_SOURCES = 32
+RESUMABLE_RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+RESUME_BACKOFF_SECONDS = 1
+
+
+class GcsBackend:
+    """
+    Objects in a Cloud Storage bucket
+
+    Args:
+        bucket_name (str): Bucket name
+        client (storage.Client): Client to use (default: a new client, which
+            honors STORAGE_EMULATOR_HOST)
+        chunk_size (int): Resumable upload chunk size in bytes, rounded down
+            to a multiple of 256 KiB; larger objects use resumable sessions
+        composite_threshold (int): Size from which objects are uploaded as
+            parallel parts and composed (0 = never)
+        parallel_uploads (int): Parts of a composite upload, uploaded concurrently
+        max_resumes (int): Times a resumable upload is resumed after transient errors
+    """
+
+    def __init__(self, bucket_name, client=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 composite_threshold=0, parallel_uploads=4, max_resumes=5):
+        self.bucket_name = bucket_name
+        self.client = client if client is not None else storage.Client()
+        self.bucket = self.client.bucket(bucket_name)
+        self.chunk_size = max(CHUNK_ALIGNMENT, chunk_size // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT)
+        self.composite_threshold = composite_threshold
+        self.parallel_uploads = max(1, min(parallel_uploads, MAX_COMPOSE_SOURCES))
+        self.max_resumes = max_resumes
+
+    @property
+    def transport(self):
+        """Authorized HTTP session of the client, used for resumable sessions"""
+        return self.client._http
+
+    def upload(self, name, data, content_type=None, content_encoding=None):
+        """
+        Store an object, replacing any object with the same name
+
+        Args:
+            name (str): Object name
+            data (bytes): Object contents
+            content_type (str): Content-Type
+            content_encoding (str): Content-Encoding, or None
+
+        Raises:
+            Exception: If the upload fails (google.api_core, requests or
+                RuntimeError for a resumable session that gave up)
+        """
+        if self.composite_threshold and len(data) >= self.composite_threshold \
+                and self.parallel_uploads > 1:
+            self._upload_composite(name, data, content_type, content_encoding)
+        elif len(data) > self.chunk_size:
+            self._upload_resumable(name, data, content_type, content_encoding)
+        else:
+            blob = self.bucket.blob(name)
+            blob.content_encoding = content_encoding
+            blob.upload_from_string(data, content_type=content_type)
+
+    def _upload_resumable(self, name, data, content_type, content_encoding):
+        """Send data through a resumable session, resuming it after transient errors"""
+        blob = self.bucket.blob(name)
+        blob.content_encoding = content_encoding
+        size = len(data)
+        url = blob.create_resumable_upload_session(content_type=content_type, size=size)
+        view = memoryview(data)
+        offset = 0  # None: unknown after a failure, asked from the session
+        resumes = 0
+        while True:
+            if offset is None:
+                chunk, content_range = b'', f"bytes */{size}"
+            else:
+                end = min(offset + self.chunk_size, size)
+                chunk, content_range = bytes(view[offset:end]), f"bytes {offset}-{end - 1}/{size}"
+            try:
+                response = self.transport.put(url, data=chunk,
+                                              headers={'Content-Range': content_range})
+                status = response.status_code
+            except requests.exceptions.RequestException as e:
+                response, status = e, None
+            if status in (200, 201):
+                return
+            if status == 308:
+                offset = _committed_bytes(response)
+                continue
+            if status is not None and status not in RESUMABLE_RETRY_STATUSES:
+                raise RuntimeError(f"Upload of {name} failed with HTTP {status}")
+            resumes += 1
+            if resumes > self.max_resumes:
+                raise RuntimeError(f"Upload of {name} failed after {self.max_resumes} resumes: "
+                                   f"{status or response}")
+            time.sleep(RESUME_BACKOFF_SECONDS * 2 ** (resumes - 1))
+            offset = None
+
+    def _upload_composite(self, name, data, content_type, content_encoding):
+        """Upload parts concurrently as temporary objects and compose them into name"""
+        part_size = math.ceil(len(data) / self.parallel_uploads)
+        token = uuid.uuid4().hex[:12]
+        view = memoryview(data)
+        parts = [
+            (f"{name}.part-{token}-{i:02d}", bytes(view[start:start + part_size]))
+            for i, start in enumerate(range(0, len(data), part_size))
+        ]
+        try:
+            with ThreadPoolExecutor(len(parts), thread_name_prefix="upload") as executor:
+                futures = [executor.submit(self._upload_part, part_name, part, content_type)
+                           for part_name, part in parts]
+                for future in futures:
+                    future.result()
+            blob = self.bucket.blob(name)
+            blob.content_type = content_type
+            blob.content_encoding = content_encoding
+            blob.compose([self.bucket.blob(part_name) for part_name, _ in parts])
+        finally:
+            for part_name, _ in parts:
+                try:
+                    self.bucket.blob(part_name).delete()
+                except Exception:
+                    pass  # a part that failed to upload does not exist
+
+    def _upload_part(self, name, data, content_type):
+        if len(data) > self.chunk_size:
+            self._upload_resumable(name, data, content_type, None)
+        else:
+            self.bucket.blob(name).upload_from_string(data, content_type=content_type)
+
+    def download(self, name):
+        """
+        Read an object as stored (without decompressing it)
+
+        Raises:
+            FileNotFoundError: If there is no such object
+        """
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return self.bucket.blob(name).download_as_bytes(raw_download=True)
+        except NotFound:
+            raise FileNotFoundError(f"{self} has no object {name}") from None
+
+    def exists(self, name):
+        """Whether an object exists"""
+        return self.bucket.blob(name).exists()
+
+    def list(self, prefix=''):
+        """Yield the names of the objects starting with prefix"""
+        for blob in self.client.list_blobs(self.bucket_name, prefix=prefix):
+            yield blob.name
+
+    def __str__(self):
+        return f"gs://{self.bucket_name}"
+
+
+def _committed_bytes(response):
+    """Bytes a resumable session has committed, from its 308 Range header"""
+    committed = response.headers.get('Range')  # 'bytes=0-<last byte>'
+    return int(committed.rsplit('-', 1)[1]) + 1 if committed else 0
+
+
+class LocalBackend:
+    """
+    Objects stored as files under a directory
+
+    Args:
+        root (Path): Directory standing in for the bucket
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _path(self, name):
+        path = (self.root / name).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise ValueError(f"Object name '{name}' is outside {self.root}")
+        return path
+
+    def upload(self, name, data, content_type=None, content_encoding=None):
+        path = self._path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Replace atomically, like a GCS upload
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+
+    def download(self, name):
+        return self._path(name).read_bytes()
+
+    def exists(self, name):
+        return self._path(name).is_file()
+
+    def list(self, prefix=''):
+        if not self.root.is_dir():
+            return
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            relative = Path(dirpath).relative_to(self.root)
+            for filename in sorted(filenames):
+                name = (relative / filename).as_posix()
+                if name.startswith(prefix) and not filename.endswith('.tmp'):
+                    yield name
+
+    def __str__(self):
+        return f"file://{self.root.resolve()}"
+
+
+class MemoryBackend:
+    """Objects kept in memory: {name: {'data', 'content_type', 'content_encoding'}}"""
+
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def upload(self, name, data, content_type=None, content_encoding=None):
+        with self._lock:
+            self.objects[name] = {'data': bytes(data), 'content_type': content_type,
+                                  'content_encoding': content_encoding}
+
+    def download(self, name):
+        with self._lock:
+            if name not in self.objects:
+                raise FileNotFoundError(f"{self} has no object {name}")
+            return self.objects[name]['data']
+
+    def exists(self, name):
+        with self._lock:
+            return name in self.objects
+
+    def list(self, prefix=''):
+        with self._lock:
+            names = sorted(name for name in self.objects if name.startswith(prefix))
+        yield from names
+
+    def __str__(self):
+        return "memory://"
+
+
+def open_backend(kind, bucket_name, local_root=None, **gcs_options):
+    """
+    Create the storage backend for a STORAGE_BACKEND value
+
+    Args:
+        kind (str): 'gcs', 'local' or 'memory'
+        bucket_name (str): GCS bucket; for 'local', the directory under local_root
+        local_root (Path): Root directory of the 'local' backend
+        **gcs_options: GcsBackend upload options (chunk_size, composite_threshold,
+            parallel_uploads, max_resumes)
+
+    Returns:
+        GcsBackend, LocalBackend or MemoryBackend
+
+    Raises:
+        ValueError: If the kind is unknown
+        Exception: If the GCS client cannot be created (e.g. no credentials)
+    """
+    if kind == 'gcs':
+        backend = GcsBackend(bucket_name, **gcs_options)
+        if os.getenv('STORAGE_EMULATOR_HOST') and not backend.bucket.exists():
+            backend.client.create_bucket(bucket_name)
+        return backend
+    if kind == 'local':
+        return LocalBackend(Path(local_root or 'storage') / bucket_name)
+    if kind == 'memory':
+        return MemoryBackend()
+    raise ValueError(f"Unknown storage backend '{kind}', expected one of {list(BACKENDS)}")
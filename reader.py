@@ -0,0 +1,143 @@
+"""
+Parallel reader of stored snapshots into one Arrow table
+
+read_snapshots decodes many full snapshots (local paths or gs:// URIs, any
+codec) across worker processes. Each worker parses its share of the JSON,
+converts the trains to the typed columnar schema (see columnar.py) and sends
+back a single uncompressed Arrow IPC stream, a flat buffer that crosses the
+process boundary as one memory copy instead of millions of pickled dicts.
+The parent maps the buffers without copying and concatenates them in input
+order, so JSON parsing, the CPU-bound part, scales with the worker count.
+
+Every row carries its snapshot's cycle time (from the file name) in
+'fetched_at'. Deltas and unchanged markers are skipped: rebuild delta chains
+with snapshots.reconstruct or replay.py.
+
+Snapshots in a local snapshot store (written with LOCAL_STORE, see store.py)
+are read by the per-cycle name they would have next to it, e.g.
+data/_store/general-prenfe_20261017_080000.json; store.snapshot_names()
+lists them.
+
+Requires the pyarrow package (pip install prenfe-scraper[columnar]).
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from google.cloud import storage
+
+import columnar
+import serialization
+import snapshots
+import store
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # optional dependency
+    pyarrow = None
+
+# Snapshots decoded per task
+DEFAULT_CHUNK_SIZE = 8
+
+# One GCS client per process, created on first use
+_gcs = {'client': None}
+
+
+def read_uri(uri):
+    """
+    Read the stored bytes of a local path or gs://<bucket>/<object> URI
+
+    GCS objects are downloaded as stored (compressed), like local files. A
+    path under a snapshot store directory that is not a file names one of the
+    store's snapshots.
+
+    Args:
+        uri (str or Path): Path or URI
+
+    Returns:
+        bytes: The object's contents
+    """
+    uri = str(uri)
+    if not uri.startswith('gs://'):
+        path = Path(uri)
+        if path.parent.name == store.STORE_SUBDIR and not path.is_file():
+            return store.read_named(path.parent, path.name)
+        return path.read_bytes()
+    if _gcs['client'] is None:
+        _gcs['client'] = storage.Client()
+    bucket_name, _, name = uri[len('gs://'):].partition('/')
+    return _gcs['client'].bucket(bucket_name).blob(name).download_as_bytes(raw_download=True)
+
+
+def decode_to_table(uri):
+    """
+    Decode one full snapshot into a columnar table
+
+    Args:
+        uri (str or Path): Snapshot path or gs:// URI
+
+    Returns:
+        pyarrow.Table: One row per train, or None for deltas, unchanged
+        markers and names that are not snapshot names
+    """
+    basename = str(uri).rsplit('/', 1)[-1]
+    parsed = snapshots.parse_snapshot_name(basename)
+    if parsed is None or parsed['delta'] or parsed['unchanged'] \
+            or not basename.endswith(snapshots.JSON_EXTENSIONS):
+        return None
+    payload = serialization.decode_snapshot(read_uri(uri),
+                                            serialization.codec_for_filename(basename))
+    trains, _ = snapshots.split_payload(payload)
+    return columnar.trains_to_table(trains, parsed['timestamp'])
+
+
+def decode_chunk(uris):
+    """
+    Decode snapshots into a single Arrow IPC stream (worker side)
+
+    Args:
+        uris (list): Snapshot paths or gs:// URIs
+
+    Returns:
+        bytes: Uncompressed IPC stream of their rows, in input order
+    """
+    tables = [table for table in map(decode_to_table, uris) if table is not None]
+    table = pyarrow.concat_tables(tables) if tables else columnar.schema().empty_table()
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def read_snapshots(uris, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Decode many snapshots in parallel into one Arrow table
+
+    Args:
+        uris (list): Snapshot paths or gs:// URIs; rows keep this order
+        workers (int): Worker processes (None = CPU count, 1 = this process)
+        chunk_size (int): Snapshots per task
+
+    Returns:
+        pyarrow.Table: Every train of every full snapshot, with its fetched_at
+
+    Raises:
+        ValueError: If pyarrow is not installed or a snapshot cannot be decoded
+        OSError: If a snapshot cannot be read
+    """
+    if pyarrow is None:
+        raise ValueError("Reading snapshots into Arrow requires the pyarrow package")
+
+    uris = [str(uri) for uri in uris]
+    chunks = [uris[i:i + chunk_size] for i in range(0, len(uris), chunk_size)]
+    if workers == 1:
+        buffers = map(decode_chunk, chunks)
+        tables = [pyarrow.ipc.open_stream(data).read_all() for data in buffers]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            tables = [pyarrow.ipc.open_stream(data).read_all()
+                      for data in executor.map(decode_chunk, chunks)]
+    if not tables:
+        return columnar.schema().empty_table()
+    return pyarrow.concat_tables(tables)
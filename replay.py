@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Replay stored snapshots through the flow pipeline (backfill)
+
+Reads the stored history of one flow (by default general-prenfe) from a local
+directory or a GCS prefix: per-cycle keyframes and deltas, hourly archives
+(archive/<flow>_<YYYYMMDD>_<HH>.tar.gz) and JSONL batch objects
+(flow=<flow>/date=.../part-*.jsonl[.gz|.zst]). Every cycle is rebuilt in time
+order, run through flows.evaluate_flows with the given line filter or flow
+registry, and each derived flow is written as a full snapshot named like the
+live ones, plus one line per cycle and flow in replay-summary.jsonl.
+A local directory's snapshot store (<dir>/_store, written with LOCAL_STORE,
+see store.py) is read too, its snapshots listed as _store/<per-cycle name>.
+
+Delta chains only depend on their keyframe, so the timeline is cut at
+keyframes (and batch objects) into tasks replayed by a process pool; the
+summary is still written in time order. Hourly archives are downloaded once,
+by a pool process that unpacks them into a temporary spool directory; only
+names go back and forth between the processes. Unchanged markers are skipped, as in
+snapshots.reconstruct, and so are columnar files and Parquet batches.
+
+Usage:
+    python replay.py --source data --out replay
+    python replay.py --source data --cat-filter 'R*,RG1,RL*,RT*' --out replay
+    python replay.py --source gs://beta-tests/prenfe-data --flows flows.toml \\
+        --since 2026-06-01 --until 2026-10-01 --out replay --workers 8
+"""
+
+import argparse
+import os
+import re
+import sys
+import tarfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+
+from google.cloud import storage
+
+import analytics
+import flows
+import records
+import serialization
+import snapshots
+import store
+
+SUMMARY_FILE = 'replay-summary.jsonl'
+
+# Hourly archives written by scraper.compact_snapshots
+ARCHIVE_NAME_RE = snapshots.ARCHIVE_NAME_RE
+
+# JSONL batch objects written by batching.BatchWriter
+BATCH_NAME_RE = re.compile(
+    r'(?:^|/)flow=(?P<flow>[^/]+)/date=[^/]+/(?:hour=\d{2}/)?'
+    r'part-(?P<first>\d{8}T\d{6})\.jsonl(?:\.gz|\.zst)?$'
+)
+
+# Cycles per task; a batch object is always a task of its own
+DEFAULT_CHUNK_SIZE = 64
+
+
+class LocalSource:
+    """
+    Stored snapshots under a local directory, including its snapshot store
+
+    Other directories starting with '_' (write-ahead logs) are skipped.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def names(self):
+        """Yield every object name, relative to the root"""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('_'))
+            relative = Path(dirpath).relative_to(self.root)
+            for filename in filenames:
+                yield (relative / filename).as_posix()
+        for name in store.snapshot_names(self.root / store.STORE_SUBDIR):
+            yield f"{store.STORE_SUBDIR}/{name}"
+
+    def read(self, name):
+        directory, _, basename = name.rpartition('/')
+        if directory == store.STORE_SUBDIR:
+            return store.read_named(self.root / directory, basename)
+        return (self.root / name).read_bytes()
+
+    def __str__(self):
+        return str(self.root)
+
+
+class GcsSource:
+    """Stored snapshots under a gs://<bucket>/<prefix> URL"""
+
+    def __init__(self, url):
+        bucket_name, _, prefix = url[len('gs://'):].partition('/')
+        self.bucket_name = bucket_name
+        self.prefix = f"{prefix.strip('/')}/" if prefix.strip('/') else ''
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        # One client per process: clients are not shared with pool workers
+        if self._bucket is None:
+            self._bucket = storage.Client().bucket(self.bucket_name)
+        return self._bucket
+
+    def names(self):
+        """Yield every object name, relative to the prefix"""
+        for blob in self.bucket.list_blobs(prefix=self.prefix):
+            yield blob.name[len(self.prefix):]
+
+    def read(self, name):
+        # Stored bytes as uploaded: compressed snapshots are decoded by extension
+        return self.bucket.blob(self.prefix + name).download_as_bytes(raw_download=True)
+
+    def __getstate__(self):
+        return {**self.__dict__, '_bucket': None}
+
+    def __str__(self):
+        return f"gs://{self.bucket_name}/{self.prefix}"
+
+
+def open_source(spec):
+    """Return the source for a local directory or a gs:// URL"""
+    return GcsSource(spec) if spec.startswith('gs://') else LocalSource(spec)
+
+
+def build_registry(cat_filter=None, flows_path=None):
+    """
+    Build the flow registry to replay through
+
+    Args:
+        cat_filter (str): prenfe-cat line filter for the built-in flows
+            (default: flows.DEFAULT_CAT_LINE_FILTER, as in the scraper)
+        flows_path (str): TOML flow registry, used instead when given
+
+    Returns:
+        list: Flow objects
+
+    Raises:
+        ValueError: If the filter or registry is invalid
+    """
+    if flows_path:
+        return flows.load_flows(flows_path)
+    return flows.default_flows(cat_filter or flows.DEFAULT_CAT_LINE_FILTER)
+
+
+def catalogue(source, flow, map_archives=None):
+    """
+    List a flow's stored cycles as replay units in time order
+
+    A unit is a delta chain (a keyframe and the deltas applied on top of it)
+    or a batch object. Entries are (timestamp, name, archive member or None).
+
+    Args:
+        source (LocalSource or GcsSource): Where the snapshots are stored
+        flow (str): Stored flow to replay, e.g. 'general-prenfe'
+        map_archives (callable): Maps unpack_archive over archive names, e.g. a
+            process pool's map (default: the built-in map, in this process,
+            which must have run init_worker)
+
+    Returns:
+        tuple: (list of ('chain' or 'batch', entries) units, number of deltas
+        without a keyframe to apply them to)
+    """
+    found = []
+    archives = []
+    for name in source.names():
+        basename = name.rsplit('/', 1)[-1]
+        batch = BATCH_NAME_RE.search(name)
+        if batch is not None:
+            if batch['flow'] == flow:
+                found.append((datetime.strptime(batch['first'], '%Y%m%dT%H%M%S'), 'batch',
+                              name, None))
+            continue
+        archive = ARCHIVE_NAME_RE.match(basename)
+        if archive is not None:
+            if archive['flow'] == flow:
+                archives.append(name)
+            continue
+        if basename.endswith(snapshots.JSON_EXTENSIONS):
+            found.append(_snapshot_entry(basename, flow, name, None))
+    for name, members in zip(archives, (map_archives or map)(unpack_archive, archives)):
+        found.extend(_snapshot_entry(member, flow, name, member) for member in members)
+
+    # Keyframes before the deltas of the same second; batches are independent
+    kinds = {'keyframe': 0, 'delta': 1, 'batch': 0}
+    found = sorted((entry for entry in found if entry is not None),
+                   key=lambda entry: (entry[0], kinds[entry[1]]))
+
+    units = []
+    orphans = 0
+    chain = None
+    previous = None
+    for timestamp, kind, name, member in found:
+        # A cycle stored twice (e.g. imported into the store and still on disk) is
+        # replayed once
+        if kind != 'batch' and (timestamp, kind) == previous:
+            continue
+        previous = (timestamp, kind)
+        if kind == 'batch':
+            units.append(('batch', [(timestamp, name, None)]))
+            chain = None
+        elif kind == 'keyframe':
+            chain = [(timestamp, name, member)]
+            units.append(('chain', chain))
+        elif chain is None:
+            orphans += 1
+        else:
+            chain.append((timestamp, name, member))
+    return units, orphans
+
+
+def _snapshot_entry(basename, flow, name, member):
+    parsed = snapshots.parse_snapshot_name(basename.rsplit('/', 1)[-1])
+    if parsed is None or parsed['flow'] != flow or parsed['unchanged'] \
+            or not basename.endswith(snapshots.JSON_EXTENSIONS):
+        return None
+    return (parsed['timestamp'], 'delta' if parsed['delta'] else 'keyframe', name, member)
+
+
+def plan_tasks(units, chunk_size=DEFAULT_CHUNK_SIZE, since=None, until=None):
+    """
+    Group consecutive units into tasks of about chunk_size cycles
+
+    Units entirely outside [since, until] are dropped.
+
+    Returns:
+        list: Tasks, each a list of units
+    """
+    tasks = []
+    current = []
+    size = 0
+    for unit in units:
+        kind, entries = unit
+        if until is not None and entries[0][0] > until:
+            continue
+        if since is not None and kind == 'chain' and entries[-1][0] < since:
+            continue
+        if kind == 'batch':
+            if current:
+                tasks.append(current)
+                current = []
+                size = 0
+            tasks.append([unit])
+            continue
+        current.append(unit)
+        size += len(entries)
+        if size >= chunk_size:
+            tasks.append(current)
+            current = []
+            size = 0
+    if current:
+        tasks.append(current)
+    return tasks
+
+
+# Per-process replay settings, set by init_worker
+_worker = {}
+
+
+def init_worker(source, cat_filter, flows_path, out_dir, codec, only, since, until,
+                with_metrics, spool_dir):
+    """Prepare a (pool) process to replay tasks with the given settings"""
+    registry = build_registry(cat_filter, flows_path)
+    _worker.clear()
+    _worker.update(
+        source=source,
+        registry=registry,
+        outputs=[flow for flow in registry if flow.name in only],
+        out_dir=Path(out_dir),
+        codec=codec,
+        since=since,
+        until=until,
+        with_metrics=with_metrics,
+        spool_dir=Path(spool_dir),
+    )
+
+
+def unpack_archive(name):
+    """
+    Download an hourly archive and unpack its files into the spool directory
+
+    Runs in a pool process, so archives are downloaded in parallel and once
+    each; _read then reads the members from the shared spool directory.
+
+    Args:
+        name (str): Archive object name
+
+    Returns:
+        list: Names of the unpacked members
+    """
+    directory = _worker['spool_dir'] / name
+    directory.mkdir(parents=True, exist_ok=True)
+    members = []
+    with tarfile.open(fileobj=BytesIO(_worker['source'].read(name)), mode='r:gz') as tar:
+        for member in tar.getmembers():
+            if not member.isfile():
+                continue
+            member_name = Path(member.name).name  # archives are flat; never leave the spool
+            (directory / member_name).write_bytes(tar.extractfile(member).read())
+            members.append(member_name)
+    return members
+
+
+def _read(name, member):
+    """Read an object, or a member of an archive unpacked by unpack_archive"""
+    if member is None:
+        return _worker['source'].read(name)
+    return (_worker['spool_dir'] / name / member).read_bytes()
+
+
+def _decode(name, member, data):
+    filename = (member or name).replace('.jsonl', '.json')
+    return serialization.decode_snapshot(data, serialization.codec_for_filename(filename))
+
+
+def iter_cycles(kind, entries):
+    """
+    Rebuild the payload of every cycle of a unit
+
+    Trains are held as records.TrainRecords, so a long delta chain's index
+    costs about a third of the memory of dicts.
+
+    Yields:
+        tuple: (timestamp, payload)
+
+    Raises:
+        ValueError: If a delta does not chain onto the previous snapshot
+    """
+    if kind == 'batch':
+        _, name, _ = entries[0]
+        raw = serialization.decompress(
+            _read(name, None),
+            serialization.codec_for_filename(name.replace('.jsonl', '.json')),
+        )
+        for line in raw.splitlines():
+            if not line.strip():
+                continue
+            record = serialization.loads(line)
+            if 'payload' in record:
+                yield (datetime.fromisoformat(record['fetched_at']),
+                       records.parse_payload(record['payload']))
+        return
+
+    timestamp, name, member = entries[0]
+    trains, meta = snapshots.split_payload(
+        records.parse_payload(_decode(name, member, _read(name, member))))
+    index, unkeyed = snapshots.index_trains(trains)
+    base = (member or name).rsplit('/', 1)[-1]
+    yield timestamp, snapshots.build_payload(index, unkeyed, meta)
+
+    for timestamp, name, member in entries[1:]:
+        delta = _decode(name, member, _read(name, member))
+        if not isinstance(delta, dict) or delta.get('base') != base:
+            raise ValueError(f"{member or name} does not apply on top of {base}")
+        for part in ('added', 'changed'):
+            delta[part] = dict(zip(delta[part], records.parse_trains(delta[part].values())))
+        index = snapshots.apply_delta(index, delta)
+        unkeyed = records.parse_trains(delta['unkeyed'])
+        meta = delta['meta']
+        base = (member or name).rsplit('/', 1)[-1]
+        yield timestamp, snapshots.build_payload(index, unkeyed, meta)
+
+
+def derive(timestamp, payload):
+    """
+    Run one cycle through the flows and write the derived snapshots
+
+    Returns:
+        list: Summary rows, one per written flow snapshot
+    """
+    results = flows.evaluate_flows(_worker['registry'], payload)
+    fleet = analytics.FleetColumns.from_payload(payload) if _worker['with_metrics'] else None
+    rows = []
+    for flow in _worker['outputs']:
+        result = results[flow.name]
+        if flow.skip_empty and not result['payload']:
+            continue
+        codec = flow.codec or _worker['codec']
+        filename = (f"{flow.name}_{timestamp:%Y%m%d_%H%M%S}"
+                    f"{serialization.CODECS[codec]['extension']}")
+        (_worker['out_dir'] / filename).write_bytes(
+            serialization.encode_snapshot(result['payload'], codec)
+        )
+        row = {
+            'timestamp': timestamp.isoformat(timespec='seconds'),
+            'flow': flow.name,
+            'file': filename,
+            **result['analysis'],
+        }
+        if fleet is not None:
+            row['metrics'] = fleet.summarize(result['rows'])
+        rows.append(row)
+    return rows
+
+
+def replay_task(task):
+    """
+    Replay the units of a task in time order
+
+    Returns:
+        tuple: (cycles replayed, summary rows, error messages of units that
+        could not be replayed to the end)
+    """
+    since, until = _worker['since'], _worker['until']
+    cycles = 0
+    rows = []
+    errors = []
+    for kind, entries in task:
+        try:
+            for timestamp, payload in iter_cycles(kind, entries):
+                if since is not None and timestamp < since:
+                    continue
+                if until is not None and timestamp > until:
+                    break
+                rows.extend(derive(timestamp, payload))
+                cycles += 1
+        except (OSError, KeyError, ValueError, tarfile.TarError) as e:
+            errors.append(f"{entries[0][1]}: {e}")
+    return cycles, rows, errors
+
+
+def replay(source, out_dir, flow='general-prenfe', cat_filter=None, flows_path=None, only=None,
+           codec='json', since=None, until=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+           with_metrics=False):
+    """
+    Replay a stored flow and write the derived flows
+
+    Args:
+        source (str): Local directory or gs://<bucket>/<prefix>
+        out_dir (Path): Directory for derived snapshots and the summary
+        flow (str): Stored flow to replay
+        cat_filter (str): prenfe-cat line filter for the built-in flows
+            (default: the scraper's default regional lines)
+        flows_path (str): TOML flow registry, used instead of cat_filter
+        only (list): Flow names to write (defaults to every flow but 'flow')
+        codec (str): Codec of the derived snapshots, unless a flow sets its own
+        since (datetime): First cycle to replay
+        until (datetime): Last cycle to replay
+        workers (int): Pool processes; 1 replays in this process
+        chunk_size (int): Cycles per task
+        with_metrics (bool): Add analytics metrics to the summary (needs numpy)
+
+    Returns:
+        dict: 'cycles', 'snapshots' written, 'orphans' (deltas without
+        keyframe) and 'errors' (messages)
+
+    Raises:
+        ValueError: If the filter, registry, codec or output flows are invalid
+    """
+    registry = build_registry(cat_filter, flows_path)
+    names = [f.name for f in registry]
+    only = list(only) if only else [name for name in names if name != flow]
+    unknown = [name for name in only if name not in names]
+    if unknown:
+        raise ValueError(f"Unknown flows {unknown}, expected some of {names}")
+    if codec not in serialization.available_codecs():
+        raise ValueError(f"Codec '{codec}' is not available")
+    if with_metrics and not analytics.available():
+        raise ValueError("Metrics require the numpy package")
+
+    source = open_source(str(source))
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    spool = tempfile.TemporaryDirectory(prefix='replay-archives-')
+    settings = (source, cat_filter, flows_path, out_dir, codec, only, since, until, with_metrics,
+                spool.name)
+    if workers == 1:
+        init_worker(*settings)
+        executor = None
+        map_tasks = map
+    else:
+        executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=settings)
+        map_tasks = executor.map
+    try:
+        units, orphans = catalogue(source, flow, map_tasks)
+        tasks = plan_tasks(units, chunk_size, since, until)
+        stats = {'cycles': 0, 'snapshots': 0, 'orphans': orphans, 'errors': []}
+        with open(out_dir / SUMMARY_FILE, 'wb') as summary:
+            for cycles, rows, errors in map_tasks(replay_task, tasks):
+                for row in rows:
+                    summary.write(serialization.dumps(row) + b'\n')
+                stats['cycles'] += cycles
+                stats['snapshots'] += len(rows)
+                stats['errors'].extend(errors)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        spool.cleanup()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--source', required=True,
+                        help="Snapshot directory or gs://<bucket>/<prefix>")
+    parser.add_argument('--out', type=Path, required=True, help="Directory for derived output")
+    parser.add_argument('--flow', default='general-prenfe', help="Stored flow to replay")
+    registry = parser.add_mutually_exclusive_group()
+    registry.add_argument('--cat-filter',
+                          help="prenfe-cat line filter, e.g. 'R*,RG1' (default: the scraper's)")
+    registry.add_argument('--flows', help="TOML flow registry (see flows.example.toml)")
+    parser.add_argument('--only', nargs='+', help="Flows to write (default: all but --flow)")
+    parser.add_argument('--codec', default='json', help="Codec of the derived snapshots")
+    parser.add_argument('--since', type=datetime.fromisoformat, help="e.g. 2026-06-01")
+    parser.add_argument('--until', type=datetime.fromisoformat, help="e.g. 2026-10-01T00:00")
+    parser.add_argument('--workers', type=int, help="Processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Cycles per task")
+    parser.add_argument('--metrics', action='store_true',
+                        help="Add delay/station metrics to the summary (needs numpy)")
+    args = parser.parse_args()
+
+    started = datetime.now()
+    try:
+        stats = replay(args.source, args.out, args.flow, args.cat_filter, args.flows, args.only,
+                       args.codec, args.since, args.until, args.workers, args.chunk_size,
+                       args.metrics)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    for error in stats['errors']:
+        print(f"Skipped {error}", file=sys.stderr)
+    if stats['orphans']:
+        print(f"Skipped {stats['orphans']} deltas without a keyframe", file=sys.stderr)
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"Replayed {stats['cycles']} cycles of {args.flow} into {stats['snapshots']} "
+          f"snapshots in {elapsed:.1f}s ({args.out})", file=sys.stderr)
+    return 1 if stats['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Retries with capped, jittered exponential backoff and a circuit breaker
+
+Used around the flota.json fetch so a transient blip does not drop a cycle,
+while an upstream outage fails fast instead of spending every trigger
+waiting on timeouts:
+
+    policy = resilience.RetryPolicy(max_attempts=3, deadline=25)
+    breaker = resilience.CircuitBreaker(failure_threshold=3, reset_timeout=300)
+    if breaker.allow():
+        try:
+            response = policy.call(lambda timeout: session.get(url, timeout=timeout),
+                                   retryable=is_transient)
+        except Exception:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+Breaker state lives in the process; each Cloud Run instance keeps its own.
+"""
+
+import random
+import threading
+import time
+
+# An attempt is not started with less time than this left before the deadline
+MIN_ATTEMPT_SECONDS = 1.0
+
+
+class RetryPolicy:
+    """
+    Retry a call within a deadline, sleeping a "full jitter" backoff between attempts
+
+    The delay before retry n (from 1) is uniform in [0, min(max_delay,
+    base_delay * 2 ** (n - 1))], which spreads out clients that failed together.
+
+    Args:
+        max_attempts (int): Attempts in total, including the first
+        base_delay (float): Backoff cap of the first retry, in seconds
+        max_delay (float): Backoff cap of any retry, in seconds
+        deadline (float): Seconds the attempts and sleeps may take together
+        timeout (float): Upper bound passed to each attempt, in seconds
+        rng (random.Random): Source of jitter (default: a new Random)
+        clock (callable): Monotonic clock, in seconds
+        sleep (callable): Sleeps for a number of seconds
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=4, deadline=25, timeout=10,
+                 rng=None, clock=time.monotonic, sleep=time.sleep):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.timeout = timeout
+        self.rng = rng or random.Random()
+        self.clock = clock
+        self.sleep = sleep
+
+    def backoff(self, retry):
+        """Jittered delay in seconds before retry number retry (from 1)"""
+        cap = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return self.rng.uniform(0, cap)
+
+    def call(self, func, retryable, on_retry=None):
+        """
+        Call func(timeout) until it succeeds, fails permanently or time runs out
+
+        Args:
+            func (callable): Attempt, called with the seconds it may take
+            retryable (callable): Whether an exception raised by func is transient
+            on_retry (callable): Called with (retry number, exception, delay)
+                before sleeping
+
+        Returns:
+            The result of the first successful attempt
+
+        Raises:
+            Exception: The last exception of func, when it is not retryable,
+                the attempts are exhausted or the deadline leaves no room for
+                another attempt
+        """
+        deadline = self.clock() + self.deadline
+        attempt = 1
+        while True:
+            timeout = min(self.timeout, max(deadline - self.clock(), MIN_ATTEMPT_SECONDS))
+            try:
+                return func(timeout)
+            except Exception as e:
+                if not retryable(e) or attempt >= self.max_attempts:
+                    raise
+                delay = self.backoff(attempt)
+                if self.clock() + delay + MIN_ATTEMPT_SECONDS > deadline:
+                    raise
+                if on_retry is not None:
+                    on_retry(attempt, e, delay)
+                self.sleep(delay)
+                attempt += 1
+
+
+class CircuitBreaker:
+    """
+    Fail fast while a dependency is unhealthy
+
+    Closed: calls go through. After failure_threshold consecutive failures the
+    breaker opens and rejects calls for reset_timeout seconds, then lets one
+    trial call through (half-open): its success closes the breaker, its
+    failure opens it again.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open the breaker
+            (0 = never open)
+        reset_timeout (float): Seconds to stay open before a trial call
+        clock (callable): Monotonic clock, in seconds
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=3, reset_timeout=300, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Close the breaker and forget past failures"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = None
+
+    @property
+    def state(self):
+        """'closed', 'open' or 'half_open'"""
+        with self._lock:
+            return self._state
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a trial call through (0 when not open)"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - self.clock())
+
+    def allow(self):
+        """
+        Whether a call may go ahead now
+
+        Returns:
+            bool: True when closed, or for the single trial call once the
+            reset timeout has passed
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and \
+                    self.clock() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        """Close the breaker after a successful call"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        """
+        Count a failed call, opening the breaker at the threshold or after a failed trial
+
+        Returns:
+            bool: Whether this failure opened the breaker
+        """
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                    self.failure_threshold and self._failures >= self.failure_threshold
+                    and self._state == self.CLOSED):
+                self._state = self.OPEN
+                self._opened_at = self.clock()
+                return True
+            return False
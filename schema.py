@@ -0,0 +1,197 @@
+"""
+Strict, schema-validated decoding of flota.json
+
+decode_flota parses the response bytes straight into typed Train structs
+(msgspec), validating every train against the declared schema in the same
+C-level pass. A train that does not match (wrong field type, missing
+codComercial, not an object) is rejected on its own: the rest of the fleet is
+still returned, together with one error message per rejected train, so a
+change in the RENFE feed format shows up as a rejection count instead of
+silently skipped records.
+
+The schema accepts what the feed is known to send: codes as strings or
+numbers (codLinea only as a string: the line filters compare it as text),
+positions as numbers, 'accesible' as a boolean and 'time' as epoch
+milliseconds; any field may be null or absent except codComercial.
+
+A train carrying fields outside the schema is not rejected and keeps them:
+its known fields are validated as usual and it is returned as a plain dict
+with the extra fields included, and the extra field names are reported as
+schema drift.
+
+Train structs support the same read-only dict protocol as TrainRecord
+(get, [], in, keys, to_dict), so every processing stage accepts them.
+
+Requires the msgspec package (pip install prenfe-scraper[schema]).
+"""
+
+try:
+    import msgspec
+    from msgspec import UNSET, UnsetType
+except ImportError:  # optional dependency
+    msgspec = None
+
+
+def available():
+    """Return True if msgspec is installed"""
+    return msgspec is not None
+
+
+if msgspec is not None:
+    _Code = str | int | None | UnsetType
+    _Number = float | None | UnsetType
+
+    class Train(msgspec.Struct, omit_defaults=True, forbid_unknown_fields=True):
+        """One validated train of the fleet (see the module docstring)"""
+
+        codComercial: str | int
+        codProducto: _Code = UNSET
+        codLinea: str | None | UnsetType = UNSET
+        nucleo: _Code = UNSET
+        codEstOrig: _Code = UNSET
+        codEstDest: _Code = UNSET
+        codEstAct: _Code = UNSET
+        codEstSig: _Code = UNSET
+        horaLlegadaSigEst: str | None | UnsetType = UNSET
+        latitud: _Number = UNSET
+        longitud: _Number = UNSET
+        ultRetraso: _Code = UNSET
+        accesible: bool | None | UnsetType = UNSET
+        via: _Code = UNSET
+        nextVia: _Code = UNSET
+        time: int | None | UnsetType = UNSET
+        mat: _Code = UNSET
+
+        def to_dict(self):
+            """Return the train as a plain dict without its absent fields"""
+            result = {}
+            for name in self.__struct_fields__:
+                value = getattr(self, name)
+                if value is not UNSET:
+                    result[name] = value
+            return result
+
+        def get(self, key, default=None):
+            value = getattr(self, key, UNSET) if key in _FIELD_SET else UNSET
+            return default if value is UNSET else value
+
+        def keys(self):
+            return self.to_dict().keys()
+
+        def __getitem__(self, key):
+            value = self.get(key, UNSET)
+            if value is UNSET:
+                raise KeyError(key)
+            return value
+
+        def __contains__(self, key):
+            return self.get(key, UNSET) is not UNSET
+
+        def __eq__(self, other):
+            if isinstance(other, Train):
+                return msgspec.structs.astuple(self) == msgspec.structs.astuple(other)
+            if isinstance(other, dict):
+                return self.to_dict() == other
+            if hasattr(other, 'to_dict'):  # TrainRecord
+                return self.to_dict() == other.to_dict()
+            return NotImplemented
+
+    _FIELD_SET = frozenset(Train.__struct_fields__)
+    _envelope_decoder = msgspec.json.Decoder(dict[str, msgspec.Raw])
+    _trains_decoder = msgspec.json.Decoder(list[Train])
+    _raw_list_decoder = msgspec.json.Decoder(list[msgspec.Raw])
+    _train_decoder = msgspec.json.Decoder(Train)
+    _raw_object_decoder = msgspec.json.Decoder(dict[str, msgspec.Raw])
+
+    # Train types decode_flota produces, for isinstance checks
+    STRUCT_TYPES = (Train,)
+else:
+    STRUCT_TYPES = ()
+
+
+def _decode_train_with_extras(item, unknown):
+    """
+    Validate the known fields of a train that also has fields outside the schema
+
+    Returns:
+        dict: The validated train plus its extra fields, or None if the train
+        has no extra fields (its validation error stands)
+    """
+    try:
+        fields = _raw_object_decoder.decode(item)
+    except msgspec.ValidationError:
+        return None
+    extras = {key: value for key, value in fields.items() if key not in _FIELD_SET}
+    if not extras:
+        return None
+    known = msgspec.json.encode({key: value for key, value in fields.items()
+                                 if key in _FIELD_SET})
+    train = _train_decoder.decode(known).to_dict()
+    for key, value in extras.items():
+        train[key] = msgspec.json.decode(value)
+        unknown[key] = unknown.get(key, 0) + 1
+    return train
+
+
+def _decode_trains(raw, unknown):
+    """Decode a JSON trains array, rejecting invalid trains one by one"""
+    try:
+        return _trains_decoder.decode(raw), []
+    except msgspec.ValidationError:
+        pass
+    # Slow path: at least one train is invalid or has extra fields
+    trains = []
+    rejected = []
+    for position, item in enumerate(_raw_list_decoder.decode(raw)):
+        try:
+            trains.append(_train_decoder.decode(item))
+        except msgspec.ValidationError as e:
+            error = e
+            try:
+                train = _decode_train_with_extras(item, unknown)
+            except msgspec.ValidationError as known_error:
+                error = known_error
+                train = None
+            if train is None:
+                rejected.append(f"trenes[{position}]: {error}")
+            else:
+                trains.append(train)
+    return trains, rejected
+
+
+def decode_flota(data):
+    """
+    Decode and validate a flota.json response
+
+    Args:
+        data (bytes): Response body, a JSON object with a 'trenes' array or a
+            bare trains array
+
+    Returns:
+        tuple: (payload, rejected, unknown) - the payload in the same shape
+            with Train structs in place of the trains (dicts for trains with
+            extra fields), the error message of every rejected train, and the
+            number of trains carrying each field outside the schema
+
+    Raises:
+        RuntimeError: If msgspec is not installed
+        ValueError: If the body is not JSON or not shaped like flota.json
+    """
+    if msgspec is None:
+        raise RuntimeError("Strict schema decoding requires msgspec (pip install msgspec)")
+    unknown = {}
+    if bytes(data[:64]).lstrip()[:1] == b'[':
+        trains, rejected = _decode_trains(data, unknown)
+        return trains, rejected, unknown
+
+    document = _envelope_decoder.decode(data)
+    if 'trenes' not in document:
+        raise ValueError("flota.json object has no 'trenes' array")
+    payload = {}
+    rejected = []
+    for key, value in document.items():
+        if key == 'trenes':
+            payload[key], rejected = _decode_trains(value, unknown)
+        else:
+            payload[key] = msgspec.json.decode(value)
+    return payload, rejected, unknown
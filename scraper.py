@@ -2,10 +2,14 @@
 """
 RENFE Real-time Train Scraper - Cloud Run HTTP Server
 
-Fetches train fleet data from RENFE API and processes two data flows:
+Fetches train fleet data from RENFE API and processes its data flows, by default:
 - general-prenfe: All trains (uploaded to GCS)
 - prenfe-cat: Regional trains - all R* + RG1 + RL* + RT* (uploaded to GCS)
 
+Further flows (e.g. Madrid Cercanías, AVE only) can be declared in a TOML
+flow registry pointed to by FLOWS_CONFIG (see flows.py); all flows are
+selected in a single pass over the fleet.
+
 Deployment: Cloud Run service triggered by Cloud Scheduler at intervals:
 - 05:00-05:59 CET: Every 5 minutes
 - 06:00-09:59 CET: Every 2 minutes
@@ -13,34 +17,192 @@ Deployment: Cloud Run service triggered by Cloud Scheduler at intervals:
 - 16:00-18:59 CET: Every 2 minutes
 - 19:00-23:59 CET: Every 5 minutes
 - 00:00-04:59 CET: Sleep (no queries)
+
+On-prem: `python scraper.py --poll` (or RUN_MODE=poll) runs the same schedule
+in-process, tightening the interval while the fleet changes quickly and
+backing off while it is static (see AdaptiveScheduler).
 """
 
 import requests
+import argparse
+import hashlib
 import json
 import os
+import signal
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 import logging
 from pathlib import Path
-from google.cloud import storage
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from flask import Flask
 
+import analytics
+import batching
+import columnar
+import flows
+import line_filter
+import metrics
+import object_storage
+import records
+import resilience
+import schema
+import serialization
+import snapshots
+import store
+
 # Configuration
 BASE_URL = "https://tiempo-real.renfe.com"
 FLOTA_ENDPOINT = "/renfe-visor/flota.json"
 FULL_URL = BASE_URL + FLOTA_ENDPOINT
 INTERVAL_SECONDS = 60  # 1 minute
+
+# Append the legacy cache-busting 'v' parameter to every fetch. Off by default:
+# conditional requests (ETag/Last-Modified) let RENFE answer 304 when unchanged.
+FETCH_CACHE_BUST = os.getenv('FETCH_CACHE_BUST', 'false').lower() in ('1', 'true', 'yes')
+
+# Fetch retries: connection errors, timeouts and FETCH_RETRY_STATUSES are retried
+# up to FETCH_MAX_ATTEMPTS times with jittered exponential backoff (capped at
+# FETCH_BACKOFF_MAX_SECONDS), all within FETCH_DEADLINE_SECONDS
+FETCH_TIMEOUT_SECONDS = float(os.getenv('FETCH_TIMEOUT_SECONDS', 10))
+FETCH_DEADLINE_SECONDS = float(os.getenv('FETCH_DEADLINE_SECONDS', 25))
+FETCH_MAX_ATTEMPTS = int(os.getenv('FETCH_MAX_ATTEMPTS', 3))
+FETCH_BACKOFF_BASE_SECONDS = float(os.getenv('FETCH_BACKOFF_BASE_SECONDS', 0.5))
+FETCH_BACKOFF_MAX_SECONDS = float(os.getenv('FETCH_BACKOFF_MAX_SECONDS', 4))
+FETCH_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# After FETCH_BREAKER_THRESHOLD consecutive failed fetches (0 = never), skip
+# fetching for FETCH_BREAKER_COOLDOWN_SECONDS, then try once to close the breaker
+FETCH_BREAKER_THRESHOLD = int(os.getenv('FETCH_BREAKER_THRESHOLD', 3))
+FETCH_BREAKER_COOLDOWN_SECONDS = float(os.getenv('FETCH_BREAKER_COOLDOWN_SECONDS', 300))
 OUTPUT_DIR = Path("data")
 LOGS_DIR = Path("logs")
 OUTPUT_DIR.mkdir(exist_ok=True)
 LOGS_DIR.mkdir(exist_ok=True)
 
+# Polling schedule (Europe/Paris local time), mirroring the Cloud Scheduler jobs:
+# (start hour, end hour, interval in seconds or None to sleep)
+SCHEDULE_TIMEZONE = "Europe/Paris"
+SCHEDULE_WINDOWS = [
+    (0, 5, None),   # Overnight sleep
+    (5, 6, 300),    # Low morning traffic
+    (6, 10, 120),   # High morning demand
+    (10, 16, 600),  # Off-peak midday
+    (16, 19, 120),  # High evening demand
+    (19, 24, 300),  # Low evening traffic
+]
+
+# Adaptive polling: the window interval is scaled between POLL_MIN_INTERVAL_SECONDS
+# and POLL_MAX_BACKOFF times the window interval, depending on how much of the
+# fleet changed station or delay (POLL_CHANGE_FIELDS) since the previous cycle
+POLL_MIN_INTERVAL_SECONDS = float(os.getenv('POLL_MIN_INTERVAL_SECONDS', 30))
+POLL_MAX_BACKOFF = float(os.getenv('POLL_MAX_BACKOFF', 2))
+POLL_TIGHTEN_RATIO = 0.2  # tighten when at least this share of trains changed
+POLL_BACKOFF_RATIO = 0.02  # back off when at most this share of trains changed
+POLL_CHANGE_FIELDS = ('codEstAct', 'codEstSig', 'ultRetraso')
+POLL_SLEEP_RECHECK_SECONDS = 60  # how often to re-check the schedule while sleeping
+# In polling mode, also serve /metrics and /health on this port (0 = off)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+
 # Log retention: 2.5 hours = 150 minutes
 LOG_RETENTION_SECONDS = 2.5 * 3600  # 9000 seconds
 
+# Snapshot retention for OUTPUT_DIR: files are evicted oldest-first once they
+# are older than OUTPUT_RETENTION_SECONDS or the directory exceeds OUTPUT_MAX_BYTES
+OUTPUT_RETENTION_SECONDS = float(os.getenv('OUTPUT_RETENTION_SECONDS', 7 * 24 * 3600))
+OUTPUT_MAX_BYTES = int(os.getenv('OUTPUT_MAX_BYTES', 1024 ** 3))  # 1 GiB
+
+# Roll per-cycle snapshots older than this into hourly .tar.gz archives (0 disables)
+ARCHIVE_AFTER_SECONDS = float(os.getenv('ARCHIVE_AFTER_SECONDS', 0))
+ARCHIVE_SUBDIR = snapshots.ARCHIVE_SUBDIR
+
+# Number of flows encoded and uploaded concurrently per cycle (1 = sequential)
+PIPELINE_CONCURRENCY = int(os.getenv('PIPELINE_CONCURRENCY', 2))
+
+# Minimum time between two background maintenance runs (log cleanup + OUTPUT_DIR)
+OUTPUT_MAINTENANCE_INTERVAL_SECONDS = 300
+
+
 # Cloud Storage configuration
 GCS_BUCKET_NAME = "beta-tests"
 GCS_FOLDER_NAME = "prenfe-data"
 GCS_ENABLED = True  # Set to False to disable cloud uploads
+# Upload backend: 'gcs' (GCS_BUCKET_NAME, or the emulator at STORAGE_EMULATOR_HOST),
+# 'local' (files under STORAGE_LOCAL_DIR/<bucket>/) or 'memory' (see object_storage.py)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'gcs')
+STORAGE_LOCAL_DIR = Path(os.getenv('STORAGE_LOCAL_DIR', 'storage'))
+# GCS uploads larger than UPLOAD_CHUNK_SIZE go through a resumable session that
+# survives transient errors; from UPLOAD_COMPOSITE_THRESHOLD (0 = never), they are
+# split into UPLOAD_PARALLELISM parts uploaded concurrently and composed
+UPLOAD_OPTIONS = {
+    'chunk_size': int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 ** 2)),  # 8 MiB
+    'composite_threshold': int(os.getenv('UPLOAD_COMPOSITE_THRESHOLD', 32 * 1024 ** 2)),
+    'parallel_uploads': int(os.getenv('UPLOAD_PARALLELISM', 4)),
+}
+
+# JSON library used to parse flota.json and encode snapshots: 'auto' (orjson,
+# then msgspec, then the stdlib json module), 'orjson', 'msgspec' or 'stdlib'
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+
+# Validate flota.json against the declared schema while parsing it, rejecting
+# malformed trains (see schema.py; needs msgspec)
+STRICT_SCHEMA = os.getenv('STRICT_SCHEMA', 'false').lower() in ('1', 'true', 'yes')
+
+# Compute per-flow delay distributions and station occupancy every cycle
+# (see analytics.py; needs numpy)
+FLEET_ANALYTICS = os.getenv('FLEET_ANALYTICS', 'false').lower() in ('1', 'true', 'yes')
+
+# Busiest stations listed in each flow's log line when FLEET_ANALYTICS is on
+ANALYTICS_TOP_STATIONS = 5
+
+# Snapshot codec: json (indent=2), json-compact, gzip or zstd (see serialization.py)
+OUTPUT_CODEC = os.getenv('OUTPUT_CODEC', 'json')
+# 0 = codec default; a level outside the codec's range stops the service at boot
+OUTPUT_CODEC_LEVEL = int(os.getenv('OUTPUT_CODEC_LEVEL', 0)) or None
+
+# Also store general-prenfe as a typed columnar file next to the JSON snapshot:
+# '' (off), 'parquet' or 'arrow' (see columnar.py; needs pyarrow)
+COLUMNAR_FORMAT = os.getenv('COLUMNAR_FORMAT', '')
+
+# Batch cycles into time-partitioned objects instead of one object per cycle:
+# '' (off), 'hour' or 'day' partitions, written as 'jsonl' (compressed with
+# OUTPUT_CODEC) or 'parquet'. Cycles are buffered in a local write-ahead log
+# under OUTPUT_DIR/WAL_SUBDIR until their partition is over (see batching.py).
+# Local disks only: on Cloud Run the WAL lives in memory and is lost with the
+# instance, taking the buffered cycles with it
+BATCH_GRANULARITY = os.getenv('BATCH_GRANULARITY', '')
+BATCH_FORMAT = os.getenv('BATCH_FORMAT', 'jsonl')
+WAL_SUBDIR = "_wal"
+
+# Snapshot mode: 'full' stores every cycle in full; 'delta' stores a full keyframe
+# every DELTA_KEYFRAME_INTERVAL cycles and only changed trains in between
+SNAPSHOT_MODE = os.getenv('SNAPSHOT_MODE', 'full')
+DELTA_KEYFRAME_INTERVAL = int(os.getenv('DELTA_KEYFRAME_INTERVAL', 30))
+
+# Skip storing a flow when its trains are identical to the last stored snapshot,
+# writing a small <flow>_<ts>.unchanged.json marker instead (opt-in: readers of
+# the per-cycle files must follow the marker's same_as to the stored snapshot)
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# Persist the last hashes (to GCS, or data/ when uploads are off) across restarts
+DEDUP_PERSIST = os.getenv('DEDUP_PERSIST', 'false').lower() in ('1', 'true', 'yes')
+DEDUP_STATE_NAME = "_state/dedup.json"
+
+# Also write uploaded snapshots to OUTPUT_DIR (on-prem). Snapshots are always
+# written locally when the upload is disabled or fails.
+KEEP_LOCAL_COPY = os.getenv('KEEP_LOCAL_COPY', 'false').lower() in ('1', 'true', 'yes')
+# Append local snapshot copies to one data file per flow with a time index under
+# OUTPUT_DIR/STORE_SUBDIR (see store.py), instead of writing one file per cycle
+LOCAL_STORE = os.getenv('LOCAL_STORE', 'false').lower() in ('1', 'true', 'yes')
+STORE_SUBDIR = store.STORE_SUBDIR
+
+# Regional lines kept by the prenfe-cat flow (default: flows.DEFAULT_CAT_LINE_FILTER)
+DEFAULT_CAT_LINE_FILTER = flows.DEFAULT_CAT_LINE_FILTER
+CAT_LINE_FILTER = os.getenv('CAT_LINE_FILTER', DEFAULT_CAT_LINE_FILTER)
+
+# TOML flow registry replacing the built-in general-prenfe/prenfe-cat flows
+# (see flows.py and flows.example.toml); unset keeps the built-in flows
+FLOWS_CONFIG = os.getenv('FLOWS_CONFIG')
 
 
 def setup_logger(name, log_file):
@@ -85,45 +247,303 @@ def setup_logger(name, log_file):
 general_logger = setup_logger('general-prenfe', LOGS_DIR / 'general-prenfe.log')
 cat_logger = setup_logger('prenfe-cat', LOGS_DIR / 'prenfe-cat.log')
 
+# Compile the CAT line filter once at startup
+try:
+    cat_line_matcher = line_filter.compile_line_filter(CAT_LINE_FILTER)
+except ValueError as e:
+    general_logger.error(f"Invalid CAT_LINE_FILTER: {e}. Using the default regional lines.")
+    CAT_LINE_FILTER = DEFAULT_CAT_LINE_FILTER
+    cat_line_matcher = line_filter.compile_line_filter(DEFAULT_CAT_LINE_FILTER)
+
+try:
+    serialization.set_json_backend(JSON_BACKEND)
+except ValueError as e:
+    general_logger.warning(f"{e}. Using '{serialization.set_json_backend()}'.")
+
+if STRICT_SCHEMA and not schema.available():
+    general_logger.warning("STRICT_SCHEMA needs msgspec, which is not installed. Disabled.")
+    STRICT_SCHEMA = False
+
+if FLEET_ANALYTICS and not analytics.available():
+    general_logger.warning("FLEET_ANALYTICS needs numpy, which is not installed. Disabled.")
+    FLEET_ANALYTICS = False
+
+if OUTPUT_CODEC_LEVEL is not None:
+    try:
+        serialization.check_level(OUTPUT_CODEC, OUTPUT_CODEC_LEVEL)
+    except ValueError as e:
+        general_logger.error(f"Invalid OUTPUT_CODEC_LEVEL: {e}")
+        raise SystemExit(1)
+
+if OUTPUT_CODEC not in serialization.available_codecs():
+    general_logger.warning(f"Output codec '{OUTPUT_CODEC}' is not available. Using 'json'.")
+    OUTPUT_CODEC = 'json'
+    OUTPUT_CODEC_LEVEL = None
+
+if COLUMNAR_FORMAT and (COLUMNAR_FORMAT not in columnar.FORMATS or not columnar.available()):
+    general_logger.warning(f"Columnar format '{COLUMNAR_FORMAT}' is not available. Disabled.")
+    COLUMNAR_FORMAT = ''
+
+batch_writer = None
+if BATCH_GRANULARITY:
+    try:
+        batch_writer = batching.BatchWriter(
+            OUTPUT_DIR / WAL_SUBDIR, BATCH_GRANULARITY, BATCH_FORMAT, OUTPUT_CODEC
+        )
+    except ValueError as e:
+        general_logger.error(f"Invalid batch configuration: {e}. Storing one object per cycle.")
+    if batch_writer is not None and os.getenv('K_SERVICE'):
+        general_logger.warning(
+            "BATCH_GRANULARITY buffers cycles in a write-ahead log under "
+            f"{OUTPUT_DIR / WAL_SUBDIR}, which Cloud Run keeps in memory: buffered cycles "
+            "are lost when the instance shuts down"
+        )
+
+# Flow registry, evaluated in order every cycle
+flow_registry = flows.default_flows(CAT_LINE_FILTER, COLUMNAR_FORMAT or None)
+if FLOWS_CONFIG:
+    try:
+        flow_registry = flows.load_flows(FLOWS_CONFIG)
+        general_logger.info(f"Loaded {len(flow_registry)} flows from {FLOWS_CONFIG}")
+    except ValueError as e:
+        general_logger.error(f"Invalid FLOWS_CONFIG: {e}. Using the built-in flows.")
+
+for _flow in flow_registry:
+    if _flow.codec is not None and _flow.codec not in serialization.available_codecs():
+        general_logger.warning(
+            f"Codec '{_flow.codec}' of flow {_flow.name} is not available. Using OUTPUT_CODEC."
+        )
+        _flow.codec = None
+    if _flow.columnar is not None and not columnar.available():
+        general_logger.warning(f"Columnar output of flow {_flow.name} needs pyarrow. Disabled.")
+        _flow.columnar = None
+
+# Per-flow loggers; flows beyond the built-in two log to logs/<flow>.log
+flow_loggers = {'general-prenfe': general_logger, 'prenfe-cat': cat_logger}
+
+
+def get_flow_logger(flow_name):
+    """Return the logger of a flow, creating it on first use"""
+    logger = flow_loggers.get(flow_name)
+    if logger is None:
+        logger = setup_logger(flow_name, LOGS_DIR / f'{flow_name}.log')
+        flow_loggers[flow_name] = logger
+    return logger
+
 # Session for connection pooling
 session = requests.Session()
 session.headers.update({
     'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36'
 })
 
-# Initialize Cloud Storage client (will use Application Default Credentials)
+# Initialize the upload backend: a Cloud Storage client (using Application Default
+# Credentials) or, with STORAGE_BACKEND=local/memory, an offline stand-in
 gcs_client = None
+storage_backend = None
 if GCS_ENABLED:
     try:
-        gcs_client = storage.Client()
-        gcs_bucket = gcs_client.bucket(GCS_BUCKET_NAME)
-        general_logger.info(f"Cloud Storage initialized: gs://{GCS_BUCKET_NAME}/{GCS_FOLDER_NAME}")
+        _backend = object_storage.open_backend(STORAGE_BACKEND, GCS_BUCKET_NAME, STORAGE_LOCAL_DIR,
+                                               **UPLOAD_OPTIONS)
+        if isinstance(_backend, object_storage.GcsBackend):
+            gcs_client = _backend.client
+        else:
+            storage_backend = _backend
+        general_logger.info(f"Cloud Storage initialized: {_backend}/{GCS_FOLDER_NAME}")
     except Exception as e:
         general_logger.warning(f"Failed to initialize Cloud Storage: {e}. Uploads disabled.")
         GCS_ENABLED = False
 
 
+def get_storage_backend():
+    """
+    Return the backend uploads go to
+
+    Returns:
+        object_storage backend: storage_backend, or GCS through gcs_client;
+        None when uploads are disabled
+    """
+    if not GCS_ENABLED:
+        return None
+    if storage_backend is not None:
+        return storage_backend
+    if gcs_client is not None:
+        return object_storage.GcsBackend(GCS_BUCKET_NAME, gcs_client, **UPLOAD_OPTIONS)
+    return None
+
+
+# Returned by fetch_flota_data when flota.json has not changed since the last fetch
+NOT_MODIFIED = object()
+
+# Validators of the last successfully fetched flota.json
+_fetch_validators = {'etag': None, 'last_modified': None, 'body_hash': None}
+
+fetch_retry_policy = resilience.RetryPolicy(
+    max_attempts=FETCH_MAX_ATTEMPTS, base_delay=FETCH_BACKOFF_BASE_SECONDS,
+    max_delay=FETCH_BACKOFF_MAX_SECONDS, deadline=FETCH_DEADLINE_SECONDS,
+    timeout=FETCH_TIMEOUT_SECONDS)
+fetch_breaker = resilience.CircuitBreaker(FETCH_BREAKER_THRESHOLD, FETCH_BREAKER_COOLDOWN_SECONDS)
+
+
+# Trains rejected by the strict schema in the last cycle and since startup
+schema_rejections = {'cycle': 0, 'total': 0}
+
+# Prometheus metrics served on /metrics (see metrics.py)
+stage_seconds = metrics.Histogram(
+    'prenfe_stage_seconds', "Duration of cycle stages: cycle, fetch, parse, partition, maintenance",
+    ('stage',))
+flow_stage_seconds = metrics.Histogram(
+    'prenfe_flow_stage_seconds', "Duration of per-flow stages: encode, encode_columnar, upload",
+    ('flow', 'stage'))
+fetch_bytes = metrics.Histogram(
+    'prenfe_fetch_bytes', "Size of flota.json response bodies", (),
+    buckets=[2 ** power for power in range(14, 25)])
+fetch_results = metrics.Counter(
+    'prenfe_fetch_total', "flota.json fetches by result: ok, not_modified, error, circuit_open",
+    ('result',))
+fetch_retries = metrics.Counter(
+    'prenfe_fetch_retries_total', "flota.json attempts retried after a transient failure")
+fetch_circuit_open = metrics.Gauge(
+    'prenfe_fetch_circuit_open', "1 while the fetch circuit breaker is open")
+schema_rejected_trains = metrics.Counter(
+    'prenfe_schema_rejected_trains_total', "Trains rejected by STRICT_SCHEMA")
+schema_unknown_fields = metrics.Counter(
+    'prenfe_schema_unknown_fields_total',
+    "Trains carrying a field outside the STRICT_SCHEMA schema, by field", ('field',))
+last_success = metrics.Gauge(
+    'prenfe_last_success_timestamp_seconds', "Unix time of the last successful cycle")
+
+
+def record_schema_rejections(rejected, unknown=None):
+    """
+    Count and log the trains the strict schema rejected in this cycle, and schema drift
+
+    Args:
+        rejected (list): One error message per rejected train
+        unknown (dict): Field outside the schema -> number of trains carrying
+            it (they are kept with the field)
+    """
+    schema_rejections['cycle'] = len(rejected)
+    schema_rejections['total'] += len(rejected)
+    schema_rejected_trains.inc(len(rejected))
+    if rejected:
+        general_logger.warning(
+            f"Schema: rejected {len(rejected)} trains, feed format may have changed "
+            f"(first: {rejected[0]})"
+        )
+    for field, trains in (unknown or {}).items():
+        schema_unknown_fields.inc(trains, field=field)
+    if unknown:
+        fields = ', '.join(f"{field} ({trains} trains)"
+                           for field, trains in sorted(unknown.items()))
+        general_logger.warning(f"Schema drift: fields outside the schema, kept as sent: {fields}")
+
+
+def _is_transient_fetch_error(error):
+    """Whether a failed flota.json request is worth retrying"""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code in FETCH_RETRY_STATUSES
+
+
+def _log_fetch_retry(attempt, error, delay):
+    fetch_retries.inc()
+    general_logger.warning(
+        f"flota.json attempt {attempt} failed ({error}), retrying in {delay:.1f}s")
+
+
+def _get_flota(params, headers):
+    """GET flota.json with retries; raises RequestException once they are exhausted"""
+    def attempt(timeout):
+        response = session.get(FULL_URL, params=params, headers=headers, timeout=timeout)
+        if response.status_code in FETCH_RETRY_STATUSES:
+            raise requests.exceptions.HTTPError(
+                f"{response.status_code} from {FULL_URL}", response=response)
+        response.raise_for_status()  # other 4xx/5xx are not retried
+        return response
+
+    return fetch_retry_policy.call(attempt, _is_transient_fetch_error, _log_fetch_retry)
+
+
 def fetch_flota_data():
     """
     Fetch the flota.json payload from RENFE
 
+    Sends If-None-Match/If-Modified-Since with the validators of the previous
+    response. A 304 answer, or a body identical to the previous one when the
+    server ignores the validators, short-circuits to NOT_MODIFIED.
+
+    Transient failures are retried within FETCH_DEADLINE_SECONDS. Any fetch
+    that does not end in a payload or NOT_MODIFIED, including unexpected
+    exceptions (re-raised), counts as a circuit breaker failure; while the
+    breaker is open after repeated failures, returns None without a request.
+
     Returns:
-        dict: The JSON payload or None if request fails
+        dict: The JSON payload, NOT_MODIFIED if unchanged, or None if request fails
     """
+    if not fetch_breaker.allow():
+        general_logger.warning(f"flota.json circuit open, skipping fetch "
+                               f"(next try in {fetch_breaker.retry_in():.0f}s)")
+        fetch_results.inc(result='circuit_open')
+        return None
+    healthy = False
     try:
-        # Add cache-busting parameter with current timestamp
-        params = {'v': int(datetime.now().timestamp() * 1000)}
-        response = session.get(FULL_URL, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        headers = {}
+        if _fetch_validators['etag']:
+            headers['If-None-Match'] = _fetch_validators['etag']
+        if _fetch_validators['last_modified']:
+            headers['If-Modified-Since'] = _fetch_validators['last_modified']
+        params = None
+        if FETCH_CACHE_BUST:
+            params = {'v': int(datetime.now().timestamp() * 1000)}
+
+        with stage_seconds.timer(stage='fetch'):
+            response = _get_flota(params, headers)
+        if response.status_code == 304:
+            general_logger.info("flota.json not modified (304)")
+            fetch_results.inc(result='not_modified')
+            healthy = True
+            return NOT_MODIFIED
+        fetch_bytes.observe(len(response.content))
+
+        body_hash = hashlib.blake2b(response.content, digest_size=16).digest()
+        if body_hash == _fetch_validators['body_hash']:
+            general_logger.info("flota.json body unchanged since last fetch")
+            fetch_results.inc(result='not_modified')
+            healthy = True
+            return NOT_MODIFIED
+
+        with stage_seconds.timer(stage='parse'):
+            if STRICT_SCHEMA:
+                data, rejected, unknown = schema.decode_flota(response.content)
+                record_schema_rejections(rejected, unknown)
+            else:
+                data = serialization.loads(response.content)
+        _fetch_validators.update({
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'body_hash': body_hash,
+        })
         general_logger.info(f"Successfully fetched flota.json - {len(data)} items")
+        fetch_results.inc(result='ok')
+        healthy = True
         return data
     except requests.exceptions.RequestException as e:
         general_logger.error(f"Failed to fetch flota.json: {e}")
+        fetch_results.inc(result='error')
         return None
-    except json.JSONDecodeError as e:
+    except ValueError as e:
         general_logger.error(f"Failed to parse JSON: {e}")
+        fetch_results.inc(result='error')
         return None
+    finally:
+        # Also settles a half-open trial that raised, so the breaker cannot get stuck
+        if healthy:
+            fetch_breaker.record_success()
+        elif fetch_breaker.record_failure():
+            general_logger.error(f"flota.json circuit opened for "
+                                 f"{FETCH_BREAKER_COOLDOWN_SECONDS:.0f}s")
+        fetch_circuit_open.set(int(fetch_breaker.state == fetch_breaker.OPEN))
 
 
 def filter_cat_trains(data):
@@ -134,6 +554,8 @@ def filter_cat_trains(data):
     - RL3, RL4: Lleida regional (Rodalies Lleida)
     - RT1, RT2: Tarragona regional (Tram)
 
+    The line set comes from CAT_LINE_FILTER, compiled into cat_line_matcher.
+
     Args:
         data (list or dict): The flota data
 
@@ -147,12 +569,10 @@ def filter_cat_trains(data):
     trains_list = data.get('trenes', []) if isinstance(data, dict) and 'trenes' in data else data
 
     if isinstance(trains_list, list):
+        matcher = cat_line_matcher
         return [
             item for item in trains_list
-            if isinstance(item, dict) and item.get('codLinea', '').upper() in (
-                'R1', 'R2', 'R2N', 'R2S', 'R3', 'R4', 'R7', 'R8', 'R11', 'R13', 'R14', 'R15', 'R16', 'R17',
-                'RG1', 'RL3', 'RL4', 'RT1', 'RT2'
-            )
+            if isinstance(item, records.TRAIN_TYPES) and matcher(item.get('codLinea', ''))
         ]
 
     return data
@@ -183,98 +603,533 @@ def analyze_flota_data(data):
         analysis['total_trains'] = len(trains_list)
         # Count trains by line code
         for item in trains_list:
-            if isinstance(item, dict):
+            if isinstance(item, records.TRAIN_TYPES):
                 line_code = item.get('codLinea', 'UNKNOWN').upper()
                 analysis['line_counts'][line_code] = analysis['line_counts'].get(line_code, 0) + 1
 
     return analysis
 
 
-def process_general_flow(data):
+def partition_flota_data(data):
+    """
+    Split flota data into the registered flows in a single pass
+
+    The trenes list is walked once: every train is classified against all
+    flows of flow_registry (see flows.evaluate_flows), then appended to and
+    counted for each flow it belongs to. With FLEET_ANALYTICS the fleet is
+    then converted to column arrays once and every flow also gets 'metrics'
+    computed over its rows (see analytics.FleetColumns.summarize).
+
+    Args:
+        data (dict or list): The flota data
+
+    Returns:
+        dict: Per-flow results keyed by flow name, each with 'payload' and 'analysis'
+    """
+    results = flows.evaluate_flows(flow_registry, data)
+    if FLEET_ANALYTICS:
+        fleet = analytics.FleetColumns.from_payload(data)
+        for result in results.values():
+            result['metrics'] = fleet.summarize(result['rows'])
+    return results
+
+
+def encode_payload(payload, codec=None):
+    """
+    Serialize a flow payload with the configured OUTPUT_CODEC
+
+    The result is used as the upload body (and local copy) as-is, so each
+    flow is serialized exactly once per cycle.
+
+    Args:
+        payload (dict or list): The flow payload
+        codec (str): Codec overriding OUTPUT_CODEC (a flow's codec)
+
+    Returns:
+        bytes: The encoded payload
+    """
+    if codec is None or codec == OUTPUT_CODEC:
+        return serialization.encode_snapshot(payload, OUTPUT_CODEC, OUTPUT_CODEC_LEVEL)
+    return serialization.encode_snapshot(payload, codec)
+
+
+def snapshot_filename(flow_name, timestamp, delta=False, codec=None):
+    """Build the snapshot file name for a flow, with the codec's extension"""
+    marker = snapshots.DELTA_MARKER if delta else ''
+    extension = serialization.CODECS[codec or OUTPUT_CODEC]['extension']
+    return f"{flow_name}_{timestamp}{marker}{extension}"
+
+
+# Previous cycle per flow for delta mode: {'index', 'filename', 'deltas'}
+_delta_state = {}
+
+
+def prepare_snapshot(flow_name, payload, timestamp, codec=None):
+    """
+    Encode a flow payload as a full snapshot or, in delta mode, as a delta
+
+    In delta mode a keyframe is stored on the first cycle of an instance and
+    then every DELTA_KEYFRAME_INTERVAL cycles; other cycles store the trains
+    added, removed or changed since the previous cycle (see snapshots.py).
+
+    Args:
+        flow_name (str): Flow name
+        payload (dict or list): The flow payload
+        timestamp (str): Cycle timestamp (YYYYMMDD_HHMMSS)
+        codec (str): Codec overriding OUTPUT_CODEC
+
+    Returns:
+        tuple: (encoded bytes, snapshot file name)
+    """
+    if SNAPSHOT_MODE != 'delta':
+        return encode_payload(payload, codec), snapshot_filename(flow_name, timestamp, codec=codec)
+
+    state = _delta_state.get(flow_name)
+    try:
+        if state is not None and state['deltas'] < DELTA_KEYFRAME_INTERVAL - 1:
+            filename = snapshot_filename(flow_name, timestamp, delta=True, codec=codec)
+            delta, index = snapshots.compute_delta(state['index'], payload, state['filename'])
+            _delta_state[flow_name] = {
+                'index': index, 'filename': filename, 'deltas': state['deltas'] + 1,
+            }
+            return encode_payload(delta, codec), filename
+
+        filename = snapshot_filename(flow_name, timestamp, codec=codec)
+        index, _ = snapshots.index_trains(snapshots.split_payload(payload)[0])
+        _delta_state[flow_name] = {'index': index, 'filename': filename, 'deltas': 0}
+        return encode_payload(payload, codec), filename
+    except ValueError as e:
+        general_logger.warning(f"Cannot compute delta for {flow_name}, storing full snapshot: {e}")
+        _delta_state.pop(flow_name, None)
+        return encode_payload(payload, codec), snapshot_filename(flow_name, timestamp, codec=codec)
+
+
+def format_line_summary(analysis):
+    """Format line counts as 'CODE:count' pairs sorted by line code"""
+    return ', '.join([f"{code}:{count}" for code, count in sorted(analysis['line_counts'].items())])
+
+
+def format_metrics_summary(metrics):
+    """Format a flow's delay distribution and busiest stations for its log line"""
+    delay = metrics['delay']
+    if delay['count']:
+        summary = (f"Delay (min): mean {delay['mean']:.1f} | p50 {delay['p50']:g} | "
+                   f"p95 {delay['p95']:g}")
+    else:
+        summary = "Delay (min): n/a"
+    busiest = list(metrics['station_counts'].items())[:ANALYTICS_TOP_STATIONS]
+    stations = ', '.join([f"{code}:{count}" for code, count in busiest]) or 'n/a'
+    return f"{summary} | Busiest stations: {stations}"
+
+
+def get_flow(flow_name):
+    """Return a flow of flow_registry by name, or its built-in definition"""
+    for flow in flow_registry:
+        if flow.name == flow_name:
+            return flow
+    for flow in flows.default_flows(CAT_LINE_FILTER, COLUMNAR_FORMAT or None):
+        if flow.name == flow_name:
+            return flow
+    raise KeyError(flow_name)
+
+
+def process_flow(flow, result):
+    """
+    Log and store one flow's result for the current cycle
+
+    Args:
+        flow (flows.Flow): The flow
+        result (dict): The flow's 'payload' and 'analysis' from partition_flota_data
+    """
+    logger = get_flow_logger(flow.name)
+    payload = result['payload']
+
+    if flow.skip_empty and not payload:
+        logger.warning(f"No trains matched flow {flow.name} in current data")
+        return
+
+    analysis = result['analysis']
+    logger.info(
+        f"Total trains: {analysis['total_trains']} | Lines: {format_line_summary(analysis)}"
+    )
+    if 'metrics' in result:
+        logger.info(format_metrics_summary(result['metrics']))
+
+    store_flow_snapshot(flow, payload, logger)
+
+
+def process_general_flow(data, flow=None):
     """
     Process data for general-prenfe flow (all trains)
 
     Args:
         data (dict): The flota data
+        flow (dict): Precomputed result from partition_flota_data (optional)
     """
     if data is None:
         return
 
-    # Perform analysis
-    analysis = analyze_flota_data(data)
-    line_summary = ', '.join([f"{code}:{count}" for code, count in sorted(analysis['line_counts'].items())])
-    general_logger.info(f"Total trains: {analysis['total_trains']} | Lines: {line_summary}")
+    definition = get_flow('general-prenfe')
+    if flow is None:
+        flow = flows.evaluate_flows([definition], data)['general-prenfe']
+    process_flow(definition, flow)
+
+
+def process_cat_flow(data, flow=None):
+    """
+    Process data for prenfe-cat flow (Regional trains R1, R14, R15, R16, etc.)
+
+    Args:
+        data (dict): The flota data
+        flow (dict): Precomputed result from partition_flota_data (optional)
+    """
+    if data is None:
+        return
+
+    definition = get_flow('prenfe-cat')
+    if flow is None:
+        flow = flows.evaluate_flows([definition], data)['prenfe-cat']
+    process_flow(definition, flow)
+
+
+# Last stored snapshot per flow: {flow: {'hash', 'filename'}}; None until loaded
+_dedup_state = None
+_dedup_lock = threading.Lock()
+
+
+def load_dedup_state():
+    """
+    Return the dedup state, loading the persisted copy on first use
+
+    Returns:
+        dict: Last stored hash and file name per flow
+    """
+    global _dedup_state
+
+    with _dedup_lock:
+        if _dedup_state is not None:
+            return _dedup_state
+
+        state = {}
+        if DEDUP_PERSIST:
+            try:
+                backend = get_storage_backend()
+                if backend is not None:
+                    name = f"{GCS_FOLDER_NAME}/{DEDUP_STATE_NAME}"
+                    if backend.exists(name):
+                        state = json.loads(backend.download(name))
+                else:
+                    state_path = OUTPUT_DIR / DEDUP_STATE_NAME
+                    if state_path.exists():
+                        state = json.loads(state_path.read_bytes())
+            except Exception as e:
+                general_logger.warning(f"Failed to load dedup state, starting empty: {e}")
+
+        _dedup_state = state
+        return _dedup_state
+
+
+def record_dedup_state(flow_name, fingerprint, filename):
+    """
+    Remember the last stored snapshot of a flow, persisting it if configured
+
+    Args:
+        flow_name (str): Flow name
+        fingerprint (str): Hash from snapshots.payload_fingerprint
+        filename (str): Name of the stored snapshot
+    """
+    state = load_dedup_state()
+    with _dedup_lock:
+        state[flow_name] = {'hash': fingerprint, 'filename': filename}
+        if DEDUP_PERSIST:
+            save_dedup_state(state)
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = OUTPUT_DIR / f"general-prenfe_{timestamp}.json"
 
+def save_dedup_state(state):
+    """Persist the dedup state (called with _dedup_lock held)"""
+    encoded = json.dumps(state).encode('utf-8')
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        general_logger.debug(f"Data saved to {filename}")
+        backend = get_storage_backend()
+        if backend is not None:
+            backend.upload(f"{GCS_FOLDER_NAME}/{DEDUP_STATE_NAME}", encoded,
+                           content_type=serialization.CONTENT_TYPE)
+        else:
+            state_path = OUTPUT_DIR / DEDUP_STATE_NAME
+            state_path.parent.mkdir(exist_ok=True)
+            state_path.write_bytes(encoded)
+    except Exception as e:
+        general_logger.warning(f"Failed to persist dedup state: {e}")
 
-        # Upload to Cloud Storage
-        upload_to_cloud_storage(filename, "general-prenfe")
-    except IOError as e:
-        general_logger.error(f"Failed to save data: {e}")
 
+def store_flow_snapshot(flow, payload, logger):
+    """
+    Store a flow payload for the current cycle, skipping unchanged payloads
 
-def process_cat_flow(data):
+    When DEDUP_ENABLED is set and the payload's trains hash to the same value
+    as the last stored snapshot, only an unchanged marker recording the cycle
+    timestamp and the snapshot it repeats is stored. In batch mode the payload
+    or marker is appended to the write-ahead log instead (see flush_batches).
+
+    Args:
+        flow (flows.Flow): The flow, giving its name, codec and destination
+        payload (dict or list): The flow payload
+        logger (logging.Logger): Flow logger
     """
-    Process data for prenfe-cat flow (Regional trains R1, R14, R15, R16, etc.)
+    flow_name = flow.name
+    now = datetime.now()
+    timestamp = now.strftime("%Y%m%d_%H%M%S")
+
+    fingerprint = None
+    if DEDUP_ENABLED:
+        try:
+            fingerprint = snapshots.payload_fingerprint(payload)
+        except ValueError:
+            pass
+        previous = load_dedup_state().get(flow_name)
+        if fingerprint is not None and previous and previous['hash'] == fingerprint:
+            marker = {
+                'unchanged': True,
+                'timestamp': now.isoformat(timespec='seconds'),
+                'hash': fingerprint,
+                'same_as': previous['filename'],
+            }
+            logger.info(f"{flow_name} unchanged since {previous['filename']}, storing marker")
+            if batch_writer is not None:
+                del marker['timestamp']  # the WAL record carries fetched_at
+                batch_writer.append(flow_name, now, marker)
+                return
+            filename = f"{flow_name}_{timestamp}{snapshots.UNCHANGED_MARKER}.json"
+            encoded = serialization.encode_snapshot(marker, 'json-compact')
+            store_snapshot(encoded, filename, flow_name, logger, codec='json-compact',
+                           folder=flow.destination)
+            return
+
+    if batch_writer is not None:
+        batch_writer.append(flow_name, now, {'payload': payload})
+        filename = f"{flow_name}_{timestamp}"  # the cycle, within its batch
+    else:
+        with flow_stage_seconds.timer(flow=flow_name, stage='encode'):
+            encoded, filename = prepare_snapshot(flow_name, payload, timestamp, flow.codec)
+        store_snapshot(encoded, filename, flow_name, logger, codec=flow.codec,
+                       folder=flow.destination)
+
+        if flow.columnar:
+            store_columnar_snapshot(flow, payload, now, timestamp, logger)
+
+    if fingerprint is not None:
+        record_dedup_state(flow_name, fingerprint, filename)
+
+
+def store_columnar_snapshot(flow, payload, fetched_at, timestamp, logger):
+    """
+    Store a flow payload as a columnar file next to its JSON snapshot
+
+    Columnar files are always full snapshots (also in delta mode), named
+    <flow>_<YYYYMMDD>_<HHMMSS>.parquet or .arrow.
 
     Args:
-        data (dict): The flota data
+        flow (flows.Flow): The flow, with its columnar format
+        payload (dict or list): The flow payload
+        fetched_at (datetime): Cycle time, stored in the fetched_at column
+        timestamp (str): Cycle timestamp (YYYYMMDD_HHMMSS)
+        logger (logging.Logger): Flow logger
     """
-    if data is None:
+    fmt = columnar.FORMATS[flow.columnar]
+    try:
+        with flow_stage_seconds.timer(flow=flow.name, stage='encode_columnar'):
+            encoded = columnar.encode_columnar(payload, fetched_at, flow.columnar)
+    except Exception as e:
+        logger.error(f"Failed to encode {flow.name} as {flow.columnar}: {e}")
         return
+    filename = f"{flow.name}_{timestamp}{fmt['extension']}"
+    store_snapshot(encoded, filename, flow.name, logger, folder=flow.destination,
+                   content_type=fmt['content_type'])
 
-    # Filter for regional trains
-    filtered_data = filter_cat_trains(data)
 
-    if not filtered_data or len(filtered_data) == 0:
-        cat_logger.warning("No regional trains (R*) found in current data")
+def store_snapshot(encoded, filename, file_type, logger, codec=None, folder=None,
+                   content_type=None):
+    """
+    Upload an encoded snapshot and keep a local copy when needed
+
+    The encoded bytes are uploaded straight from memory. A copy is written to
+    OUTPUT_DIR only when KEEP_LOCAL_COPY is set or the upload did not happen,
+    so Cloud Run instances no longer accumulate snapshots on their in-memory
+    filesystem. With LOCAL_STORE set, JSON snapshots and markers are appended
+    to the flow's local store instead of a file.
+
+    Args:
+        encoded (bytes): The encoded snapshot
+        filename (str): Snapshot file name (also used as the blob name)
+        file_type (str): Flow name, used in log messages
+        logger (logging.Logger): Flow logger
+        codec (str): Codec the snapshot was encoded with (defaults to OUTPUT_CODEC)
+        folder (str): GCS folder (defaults to GCS_FOLDER_NAME)
+        content_type (str): Content-Type of a non-JSON body (uploaded without
+            Content-Encoding); JSON snapshots leave it unset
+    """
+    upload_type, content_encoding = content_type, None
+    if content_type is None:
+        upload_codec = serialization.CODECS[codec or OUTPUT_CODEC]
+        upload_type = upload_codec['content_type']
+        content_encoding = upload_codec['content_encoding']
+    uploaded = upload_to_cloud_storage(encoded, filename, file_type, content_encoding, folder,
+                                       upload_type)
+    if uploaded and not KEEP_LOCAL_COPY:
+        return
+
+    if LOCAL_STORE and content_type is None and \
+            append_to_local_store(encoded, filename, codec or OUTPUT_CODEC, logger):
         return
 
-    # Perform analysis on filtered data
-    analysis = analyze_flota_data(filtered_data)
-    line_summary = ', '.join([f"{code}:{count}" for code, count in sorted(analysis['line_counts'].items())])
-    cat_logger.info(f"Regional trains filtered: {analysis['total_trains']} trains | {line_summary}")
+    local_path = OUTPUT_DIR / filename
+    try:
+        local_path.write_bytes(encoded)
+        logger.debug(f"Data saved to {local_path}")
+    except IOError as e:
+        logger.error(f"Failed to save {file_type} data: {e}")
+
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = OUTPUT_DIR / f"prenfe-cat_{timestamp}.json"
+_local_stores = {}
+_local_stores_lock = threading.Lock()
+
+
+def get_local_store(flow_name):
+    """
+    Return the local snapshot store of a flow, opening it on first use
+
+    Args:
+        flow_name (str): Flow name
+
+    Returns:
+        store.SnapshotStore: The flow's store under OUTPUT_DIR/STORE_SUBDIR, opened
+            as its writer and rotated daily so output retention can delete old days
+    """
+    directory = OUTPUT_DIR / STORE_SUBDIR
+    with _local_stores_lock:
+        key = (directory, flow_name)
+        if key not in _local_stores:
+            _local_stores[key] = store.SnapshotStore(directory, flow_name, writable=True,
+                                                     rotate_daily=True)
+        return _local_stores[key]
 
+
+def append_to_local_store(encoded, filename, codec, logger):
+    """
+    Append an encoded snapshot to its flow's local store
+
+    Args:
+        encoded (bytes): The encoded snapshot or unchanged marker
+        filename (str): Per-cycle snapshot name, giving the flow, time and kind
+        codec (str): Codec the snapshot was encoded with
+        logger (logging.Logger): Flow logger
+
+    Returns:
+        bool: True once appended; False to write a file instead
+    """
+    parsed = snapshots.parse_snapshot_name(filename)
+    if parsed is None:
+        return False
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(filtered_data, f, indent=2, ensure_ascii=False)
-        cat_logger.debug(f"CAT data saved to {filename}")
+        local_store = get_local_store(parsed['flow'])
+        local_store.append(parsed['timestamp'], encoded, codec, store.snapshot_kind(parsed))
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to append {filename} to the local store: {e}. Writing a file.")
+        return False
+    logger.debug(f"Data appended to {local_store.data_path}")
+    return True
 
-        # Upload to Cloud Storage
-        upload_to_cloud_storage(filename, "prenfe-cat")
-    except IOError as e:
-        cat_logger.error(f"Failed to save CAT data: {e}")
 
+def store_batch(flow_name, object_name, encoded, content_type, content_encoding):
+    """
+    Upload a batch object, or write it under OUTPUT_DIR when uploads are off
+
+    Args:
+        flow_name (str): Flow name, giving the destination folder
+        object_name (str): Partitioned object name (flow=.../date=.../part-...)
+        encoded (bytes): The encoded batch
+        content_type (str): Content-Type of the batch
+        content_encoding (str): Content-Encoding of the batch, or None
 
-def upload_to_cloud_storage(local_file_path, file_type):
+    Returns:
+        bool: True once the batch is persisted; False keeps it in the WAL
     """
-    Upload a file to Google Cloud Storage.
+    try:
+        folder = get_flow(flow_name).destination
+    except KeyError:
+        folder = None
+
+    if get_storage_backend() is not None:
+        uploaded = upload_to_cloud_storage(encoded, object_name, flow_name, content_encoding,
+                                           folder, content_type)
+        if not uploaded or not KEEP_LOCAL_COPY:
+            return uploaded
+
+    local_path = OUTPUT_DIR / object_name
+    try:
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        local_path.write_bytes(encoded)
+        return True
+    except OSError as e:
+        general_logger.error(f"Failed to save {flow_name} batch {object_name}: {e}")
+        return False
+
+
+def flush_batches():
+    """
+    Store every completed batch partition from the write-ahead log
+
+    Returns:
+        int: Number of batches stored
+    """
+    if batch_writer is None:
+        return 0
+    try:
+        stored = batch_writer.flush(store_batch, datetime.now())
+    except Exception as e:
+        general_logger.error(f"Failed to flush batches: {e}", exc_info=True)
+        return 0
+    if stored:
+        general_logger.info(f"Stored {stored} batch(es)")
+    return stored
+
+
+def upload_to_cloud_storage(encoded, filename, file_type, content_encoding=None, folder=None,
+                            content_type=None):
+    """
+    Upload an in-memory snapshot to Google Cloud Storage.
+
+    Compressed snapshots are stored with Content-Type application/json and a
+    Content-Encoding header, so GCS serves gzip objects decompressed to
+    clients that do not accept gzip. The upload goes through
+    get_storage_backend(), i.e. to a local or in-memory stand-in when
+    STORAGE_BACKEND selects one.
 
     Args:
-        local_file_path (Path): Path to the local file
+        encoded (bytes): The encoded snapshot, used directly as the upload body
+        filename (str): Blob name within the folder
         file_type (str): Type of file ('general' or 'cat')
+        content_encoding (str): Content-Encoding of the body ('gzip' or None)
+        folder (str): GCS folder (defaults to GCS_FOLDER_NAME)
+        content_type (str): Content-Type (defaults to serialization.CONTENT_TYPE)
+
+    Returns:
+        bool: True if the snapshot was uploaded
     """
-    if not GCS_ENABLED or gcs_client is None:
-        return
+    backend = get_storage_backend()
+    if backend is None:
+        return False
 
     try:
-        bucket = gcs_client.bucket(GCS_BUCKET_NAME)
-        blob_name = f"{GCS_FOLDER_NAME}/{local_file_path.name}"
-        blob = bucket.blob(blob_name)
-
-        blob.upload_from_filename(str(local_file_path))
-        general_logger.debug(f"Uploaded {file_type} file to gs://{GCS_BUCKET_NAME}/{blob_name}")
+        blob_name = f"{folder or GCS_FOLDER_NAME}/{filename}"
+        with flow_stage_seconds.timer(flow=file_type, stage='upload'):
+            backend.upload(blob_name, encoded,
+                           content_type=content_type or serialization.CONTENT_TYPE,
+                           content_encoding=content_encoding)
+        general_logger.debug(f"Uploaded {file_type} file to {backend}/{blob_name}")
+        return True
     except Exception as e:
         general_logger.error(f"Failed to upload {file_type} file to Cloud Storage: {e}")
+        return False
 
 
 def cleanup_old_logs():
@@ -294,39 +1149,431 @@ def cleanup_old_logs():
             general_logger.error(f"Failed to delete log file {log_file.name}: {e}")
 
 
+def compact_snapshots(now=None):
+    """
+    Roll old per-cycle snapshots into compressed hourly archives
+
+    Snapshots older than ARCHIVE_AFTER_SECONDS are grouped by flow and hour and
+    stored unmodified in OUTPUT_DIR/archive/<flow>_<YYYYMMDD>_<HH>.tar.gz.
+    Snapshots arriving for an hour that is already archived are merged into
+    the existing archive.
+
+    Args:
+        now (datetime): Reference time (defaults to the current time)
+
+    Returns:
+        int: Number of snapshots archived
+    """
+    if ARCHIVE_AFTER_SECONDS <= 0:
+        return 0
+
+    now = now or datetime.now()
+    cutoff = (now - timedelta(seconds=ARCHIVE_AFTER_SECONDS)).timestamp()
+
+    groups = {}
+    with os.scandir(OUTPUT_DIR) as entries:
+        for entry in entries:
+            match = snapshots.SNAPSHOT_NAME_RE.match(entry.name)
+            if match is None or not entry.is_file() or entry.stat().st_mtime >= cutoff:
+                continue
+            key = f"{match['flow']}_{match['date']}_{match['time'][:2]}"
+            groups.setdefault(key, []).append(Path(entry.path))
+
+    if not groups:
+        return 0
+
+    archive_dir = OUTPUT_DIR / ARCHIVE_SUBDIR
+    archive_dir.mkdir(exist_ok=True)
+
+    archived = 0
+    for key, files in sorted(groups.items()):
+        archive_path = archive_dir / f"{key}.tar.gz"
+        tmp_path = archive_dir / f"{key}.tar.gz.tmp"
+        try:
+            with tarfile.open(tmp_path, 'w:gz') as tar:
+                if archive_path.exists():
+                    with tarfile.open(archive_path, 'r:gz') as existing:
+                        for member in existing.getmembers():
+                            tar.addfile(member, existing.extractfile(member))
+                for file in sorted(files):
+                    tar.add(file, arcname=file.name)
+            tmp_path.replace(archive_path)
+        except (OSError, tarfile.TarError) as e:
+            general_logger.error(f"Failed to archive snapshots into {archive_path.name}: {e}")
+            tmp_path.unlink(missing_ok=True)
+            continue
+
+        for file in files:
+            file.unlink(missing_ok=True)
+        archived += len(files)
+        general_logger.debug(f"Archived {len(files)} snapshots into {archive_path.name}")
+
+    return archived
+
+
+def enforce_output_retention(now=None):
+    """
+    Compact and evict snapshots in OUTPUT_DIR
+
+    Runs compact_snapshots, then deletes snapshots, archives, local batch
+    objects (flow=<flow>/... partitions) and rotated local store segments older
+    than OUTPUT_RETENTION_SECONDS, then deletes the oldest remaining ones until
+    the directory fits in OUTPUT_MAX_BYTES. The current local store files count
+    towards OUTPUT_MAX_BYTES but are never deleted, and neither are batches
+    still in the write-ahead log.
+
+    Args:
+        now (datetime): Reference time (defaults to the current time)
+
+    Returns:
+        dict: Number of snapshots 'archived' and files 'deleted'
+    """
+    now = now or datetime.now()
+    archived = compact_snapshots(now)
+    cutoff = (now - timedelta(seconds=OUTPUT_RETENTION_SECONDS)).timestamp()
+
+    # (mtime, size, paths deleted together); a store segment's .dat and .idx go as one
+    files = []
+    segments = {}
+    total_bytes = 0
+    store_dir = OUTPUT_DIR / STORE_SUBDIR
+    for directory in (OUTPUT_DIR, OUTPUT_DIR / ARCHIVE_SUBDIR, store_dir):
+        if not directory.is_dir():
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.endswith('.tmp'):
+                    continue
+                if directory == OUTPUT_DIR and not snapshots.SNAPSHOT_NAME_RE.match(entry.name):
+                    continue
+                stat = entry.stat()
+                total_bytes += stat.st_size
+                if directory != store_dir:
+                    files.append((stat.st_mtime, stat.st_size, [Path(entry.path)]))
+                    continue
+                segment = store.SEGMENT_RE.match(entry.name)
+                if segment:
+                    mtime, size, paths = segments.get(entry.name[:-4], (0, 0, []))
+                    segments[entry.name[:-4]] = (max(mtime, stat.st_mtime),
+                                                 size + stat.st_size, paths + [Path(entry.path)])
+
+    files.extend(segments.values())
+    batch_dirs = [path for path in OUTPUT_DIR.glob('flow=*') if path.is_dir()]
+    for batch_dir in batch_dirs:
+        for dirpath, _, filenames in os.walk(batch_dir):
+            for filename in filenames:
+                if filename.startswith('part-') and not filename.endswith('.tmp'):
+                    path = Path(dirpath) / filename
+                    stat = path.stat()
+                    total_bytes += stat.st_size
+                    files.append((stat.st_mtime, stat.st_size, [path]))
+    files.sort()
+    deleted = 0
+    for mtime, size, paths in files:
+        if mtime >= cutoff and total_bytes <= OUTPUT_MAX_BYTES:
+            break
+        try:
+            for path in paths:
+                path.unlink()
+            total_bytes -= size
+            deleted += len(paths)
+        except OSError as e:
+            general_logger.error(f"Failed to delete snapshot {path.name}: {e}")
+
+    # Drop the date=/hour= partition directories left empty
+    for batch_dir in batch_dirs:
+        for dirpath, _, _ in os.walk(batch_dir, topdown=False):
+            if Path(dirpath) != batch_dir and not os.listdir(dirpath):
+                try:
+                    os.rmdir(dirpath)
+                except OSError:
+                    pass  # a batch was just written into it
+
+    if archived or deleted:
+        general_logger.info(f"Output retention: archived {archived}, deleted {deleted} files")
+    return {'archived': archived, 'deleted': deleted}
+
+
+_maintenance_lock = threading.Lock()
+_last_maintenance = None
+_maintenance_thread = None
+
+
+def schedule_output_maintenance():
+    """
+    Run flush_batches, cleanup_old_logs and enforce_output_retention in a background thread
+
+    Returns immediately, so the flows' uploads are not held up. At most one run
+    is in flight, and runs are spaced by OUTPUT_MAINTENANCE_INTERVAL_SECONDS.
+    The HTTP trigger waits for the run before responding (see
+    wait_for_output_maintenance).
+
+    Returns:
+        threading.Thread: The started thread, or None if no run was scheduled
+    """
+    global _last_maintenance, _maintenance_thread
+
+    now = time.monotonic()
+    if _last_maintenance is not None and \
+            now - _last_maintenance < OUTPUT_MAINTENANCE_INTERVAL_SECONDS:
+        return None
+    if not _maintenance_lock.acquire(blocking=False):
+        return None
+    _last_maintenance = now
+
+    def run():
+        try:
+            with stage_seconds.timer(stage='maintenance'):
+                flush_batches()
+                cleanup_old_logs()
+                enforce_output_retention()
+        except Exception as e:
+            general_logger.error(f"Maintenance failed: {e}", exc_info=True)
+        finally:
+            _maintenance_lock.release()
+
+    thread = threading.Thread(target=run, name="maintenance", daemon=True)
+    _maintenance_thread = thread
+    thread.start()
+    return thread
+
+
+def wait_for_output_maintenance(timeout=None):
+    """
+    Wait for the background maintenance run in flight, if any
+
+    Cloud Run throttles the CPU of an instance once it has responded (unless
+    the service keeps CPU always allocated), so the HTTP trigger calls this
+    before responding rather than leave the run to a throttled instance.
+
+    Args:
+        timeout (float): Seconds to wait at most (None = until it finishes)
+    """
+    thread = _maintenance_thread
+    if thread is not None:
+        thread.join(timeout)
+
+
+# Worker threads that encode and upload the flows of a cycle concurrently
+_flow_executor = ThreadPoolExecutor(
+    max_workers=max(PIPELINE_CONCURRENCY, 1), thread_name_prefix="flow"
+)
+
+
 def save_flota_data(data):
     """
-    Save flota data to both flows
-    
+    Save flota data to every registered flow
+
+    The flows are encoded and uploaded concurrently on _flow_executor (up to
+    PIPELINE_CONCURRENCY at a time); completed batches are flushed, and log
+    cleanup and snapshot retention run, in the background after the flows
+    complete.
+
     Args:
         data (dict): The flota data to save
     """
     if data is None:
         return
     
-    # Process general flow
-    process_general_flow(data)
-    
-    # Process CAT flow
-    process_cat_flow(data)
-    
-    # Cleanup old logs periodically
-    cleanup_old_logs()
+    # Partition and analyze all flows in one pass over the trains
+    with stage_seconds.timer(stage='partition'):
+        results = partition_flota_data(data)
+
+    if PIPELINE_CONCURRENCY <= 1:
+        for flow in flow_registry:
+            process_flow(flow, results[flow.name])
+    else:
+        futures = [
+            _flow_executor.submit(process_flow, flow, results[flow.name])
+            for flow in flow_registry
+        ]
+        wait(futures)
+        for future in futures:
+            future.result()  # re-raise the first flow error, if any
+
+    # Flush batches and clean up old logs and snapshots off the request path
+    schedule_output_maintenance()
 
 
-def run_fetch_cycle():
-    """Execute a single fetch/process cycle triggered by Cloud Scheduler HTTP request."""
+def run_fetch_cycle(observer=None):
+    """
+    Execute a single fetch/process cycle triggered by Cloud Scheduler HTTP request.
+
+    Args:
+        observer (callable): Called with the fetch result (payload, NOT_MODIFIED
+            or None), used by the polling scheduler to adapt its interval
+    """
     try:
-        data = fetch_flota_data()
-        if data:
-            save_flota_data(data)
-            return True
-        return False
+        with stage_seconds.timer(stage='cycle'):
+            data = fetch_flota_data()
+            if observer is not None:
+                observer(data)
+            if data is NOT_MODIFIED:
+                general_logger.info("Skipping cycle: flota.json unchanged")
+                schedule_output_maintenance()
+            elif data:
+                save_flota_data(data)
+            else:
+                return False
+        last_success.set(time.time())
+        return True
     except Exception as e:
         general_logger.error(f"Error during fetch cycle: {e}", exc_info=True)
         return False
 
 
+try:
+    schedule_tz = ZoneInfo(SCHEDULE_TIMEZONE)
+except ZoneInfoNotFoundError:
+    general_logger.warning(f"Timezone {SCHEDULE_TIMEZONE} not found, scheduling in local time")
+    schedule_tz = None
+
+
+def get_interval_for_time():
+    """
+    Get the polling interval for the current Paris time
+
+    Returns:
+        int: Interval in seconds, or None during the overnight sleep window
+    """
+    now = datetime.now(schedule_tz)
+    for start_hour, end_hour, interval in SCHEDULE_WINDOWS:
+        if start_hour <= now.hour < end_hour:
+            return interval
+    return None
+
+
+class WindowScheduler:
+    """
+    Poll scheduler that follows SCHEDULE_WINDOWS
+
+    Schedulers are pluggable: run_polling only needs next_interval(), which
+    returns the seconds until the next cycle (None to skip the slot while
+    sleeping), and observe(result), which receives every fetch result.
+    """
+
+    def next_interval(self):
+        return get_interval_for_time()
+
+    def observe(self, result):
+        pass
+
+
+class AdaptiveScheduler(WindowScheduler):
+    """
+    Window scheduler that tightens while the fleet changes and backs off when static
+
+    After each fetch the share of trains that appeared, disappeared or changed
+    any of POLL_CHANGE_FIELDS is compared with the previous fetch. At or above
+    POLL_TIGHTEN_RATIO the interval is halved, at or below POLL_BACKOFF_RATIO
+    (or on a 304) it grows by half, and in between it relaxes towards the
+    window interval.
+    """
+
+    def __init__(self, min_interval=None, max_backoff=None):
+        self.min_interval = POLL_MIN_INTERVAL_SECONDS if min_interval is None else min_interval
+        self.max_backoff = POLL_MAX_BACKOFF if max_backoff is None else max_backoff
+        self.factor = 1.0
+        self.previous = None
+
+    def next_interval(self):
+        base = get_interval_for_time()
+        if base is None:
+            return None
+        return min(max(base * self.factor, self.min_interval), base * self.max_backoff)
+
+    def observe(self, result):
+        if result is None:
+            return
+        if result is NOT_MODIFIED:
+            ratio = 0.0
+        else:
+            ratio = self.change_ratio(result)
+            if ratio is None:
+                return
+
+        if ratio >= POLL_TIGHTEN_RATIO:
+            self.factor /= 2
+        elif ratio <= POLL_BACKOFF_RATIO:
+            self.factor *= 1.5
+        else:
+            self.factor = (self.factor + 1) / 2
+        # Keep the factor within the range next_interval can actually use
+        self.factor = min(max(self.factor, 1 / 64), self.max_backoff)
+
+    def change_ratio(self, payload):
+        """
+        Share of trains that changed since the previous payload
+
+        Returns:
+            float: Changed share, or None for the first payload seen
+        """
+        try:
+            trains, _ = snapshots.split_payload(payload)
+        except ValueError:
+            return None
+        index, _ = snapshots.index_trains(trains)
+        current = {
+            key: tuple(train.get(field) for field in POLL_CHANGE_FIELDS)
+            for key, train in index.items()
+        }
+        previous, self.previous = self.previous, current
+        if previous is None:
+            return None
+
+        changed = sum(1 for key, state in current.items() if previous.get(key) != state)
+        removed = sum(1 for key in previous if key not in current)
+        return (changed + removed) / max(len(previous), len(current), 1)
+
+
+def run_polling(scheduler=None, stop_event=None, max_cycles=None, clock=time.monotonic):
+    """
+    Run fetch cycles in-process until stopped
+
+    Deadlines are kept on the monotonic clock and advanced by the interval, so
+    cycle duration does not add drift. Cycles never overlap: if a cycle runs
+    past one or more deadlines, the missed slots are skipped rather than
+    run back to back.
+
+    Args:
+        scheduler (WindowScheduler): Interval source (defaults to AdaptiveScheduler)
+        stop_event (threading.Event): Set to stop polling
+        max_cycles (int): Stop after this many cycles (for tests)
+        clock (callable): Monotonic clock
+
+    Returns:
+        int: Number of cycles run
+    """
+    scheduler = scheduler or AdaptiveScheduler()
+    stop_event = stop_event or threading.Event()
+
+    cycles = 0
+    next_run = clock()
+    while not stop_event.is_set() and (max_cycles is None or cycles < max_cycles):
+        delay = next_run - clock()
+        if delay > 0:
+            stop_event.wait(delay)
+            continue
+
+        interval = scheduler.next_interval()
+        if interval is None:
+            next_run += POLL_SLEEP_RECHECK_SECONDS
+            continue
+
+        run_fetch_cycle(observer=scheduler.observe)
+        cycles += 1
+
+        next_run += interval
+        now = clock()
+        if next_run <= now:
+            skipped = int((now - next_run) // interval) + 1
+            next_run += skipped * interval
+            general_logger.warning(f"Cycle overran its slot, skipping {skipped} slot(s)")
+        general_logger.debug(f"Next cycle in {next_run - now:.1f}s (interval {interval:.0f}s)")
+
+    return cycles
+
+
 # Create Flask app for Cloud Run
 app = Flask(__name__)
 
@@ -337,6 +1584,8 @@ def trigger():
     try:
         general_logger.info("Received HTTP trigger from Cloud Scheduler")
         success = run_fetch_cycle()
+        # Flush batches and apply retention while the request still has CPU
+        wait_for_output_maintenance()
         return {'status': 'success', 'message': 'Fetch cycle completed'}, 200
     except Exception as e:
         general_logger.error(f"Error handling trigger: {e}", exc_info=True)
@@ -349,7 +1598,30 @@ def health():
     return {'status': 'ok'}, 200
 
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint: per-stage timings, fetch sizes and results"""
+    return metrics.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RENFE real-time train scraper")
+    parser.add_argument('--poll', action='store_true', default=os.getenv('RUN_MODE') == 'poll',
+                        help="Poll in-process on the adaptive schedule instead of serving HTTP")
+    args = parser.parse_args()
+
+    if args.poll:
+        # On-prem: poll continuously until SIGTERM/SIGINT
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+        if METRICS_PORT:
+            threading.Thread(target=app.run, kwargs={'host': '0.0.0.0', 'port': METRICS_PORT},
+                             name="metrics", daemon=True).start()
+        general_logger.info("Starting continuous polling mode")
+        run_polling(stop_event=stop)
+        raise SystemExit(0)
+
     # Cloud Run: start HTTP server on configured PORT
     port = int(os.getenv('PORT', 8080))
     general_logger.info(f"Starting Cloud Run HTTP server on port {port}")
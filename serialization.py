@@ -0,0 +1,296 @@
+"""
+Snapshot encoding for the RENFE scraper
+
+Output codecs turn a flow payload into the bytes that are uploaded to GCS and
+written to data/, and back. Every codec produces JSON; the compressed ones
+wrap compact JSON in gzip or zstd. gzip objects are uploaded with
+Content-Encoding: gzip, which GCS decompresses for clients that do not
+accept it. GCS transcodes no other encoding, so zstd objects are uploaded as
+Content-Type: application/zstd without a Content-Encoding, and readers
+decompress them themselves (decode_snapshot does).
+
+Codecs:
+- json: Pretty-printed JSON (indent=2), the historical format
+- json-compact: JSON without whitespace
+- gzip: Compact JSON, gzip-compressed (levels 1-9)
+- zstd: Compact JSON, zstd-compressed (levels 1-22, needs the zstandard package)
+
+JSON itself is produced and parsed by a pluggable backend working on bytes:
+orjson or msgspec when installed, else the stdlib json module (see
+set_json_backend). Backends emit the same JSON documents; only the spelling
+of floats in exponent notation differs (1e-05 vs 0.00001).
+"""
+
+import gzip
+import json
+
+import records
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # optional dependency
+    msgspec = None
+
+CONTENT_TYPE = 'application/json'
+
+# Codec name -> file extension, Content-Encoding, Content-Type replacing the
+# body's JSON type (None: keep it), default and valid compression levels
+CODECS = {
+    'json': {'extension': '.json', 'content_encoding': None, 'content_type': None,
+             'default_level': None, 'levels': None},
+    'json-compact': {'extension': '.json', 'content_encoding': None, 'content_type': None,
+                     'default_level': None, 'levels': None},
+    'gzip': {'extension': '.json.gz', 'content_encoding': 'gzip', 'content_type': None,
+             'default_level': 6, 'levels': range(1, 10)},
+    'zstd': {'extension': '.json.zst', 'content_encoding': None,
+             'content_type': 'application/zstd', 'default_level': 3, 'levels': range(1, 23)},
+}
+
+
+def _stdlib_dumps(obj, pretty=False, sort_keys=False):
+    if pretty:
+        return json.dumps(obj, indent=2, ensure_ascii=False, sort_keys=sort_keys,
+                          default=records.json_default).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys,
+                      default=records.json_default).encode('utf-8')
+
+
+def _stdlib_loads(data):
+    if isinstance(data, memoryview):  # json.loads only takes bytes and str
+        data = bytes(data)
+    return json.loads(data)
+
+
+def _orjson_dumps(obj, pretty=False, sort_keys=False):
+    option = (orjson.OPT_INDENT_2 if pretty else 0) | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return orjson.dumps(obj, default=records.json_default, option=option)
+
+
+def _make_msgspec_dumps():
+    encoder = msgspec.json.Encoder(enc_hook=records.json_default)
+    try:
+        sorted_encoder = msgspec.json.Encoder(enc_hook=records.json_default, order='sorted')
+    except TypeError:  # msgspec < 0.18 cannot sort keys
+        sorted_encoder = None
+
+    def dumps(obj, pretty=False, sort_keys=False):
+        if sort_keys and sorted_encoder is None:
+            return _stdlib_dumps(obj, pretty, sort_keys)
+        encoded = (sorted_encoder if sort_keys else encoder).encode(obj)
+        return msgspec.json.format(encoded, indent=2) if pretty else encoded
+
+    return dumps
+
+
+def _json_backends():
+    backends = {}
+    if orjson is not None:
+        backends['orjson'] = {'dumps': _orjson_dumps, 'loads': orjson.loads}
+    if msgspec is not None:
+        backends['msgspec'] = {'dumps': _make_msgspec_dumps(), 'loads': msgspec.json.decode}
+    backends['stdlib'] = {'dumps': _stdlib_dumps, 'loads': _stdlib_loads}
+    return backends
+
+
+# Backend name -> dumps/loads, in 'auto' preference order
+JSON_BACKENDS = _json_backends()
+_json_backend = {'name': None, 'dumps': None, 'loads': None}
+
+
+def set_json_backend(name='auto'):
+    """
+    Select the JSON backend
+
+    Args:
+        name (str): 'auto' (first of orjson, msgspec, stdlib), or a name in JSON_BACKENDS
+
+    Returns:
+        str: The selected backend name
+
+    Raises:
+        ValueError: If the backend is not installed
+    """
+    if name == 'auto':
+        name = next(iter(JSON_BACKENDS))
+    if name not in JSON_BACKENDS:
+        raise ValueError(f"JSON backend '{name}' is not available, expected one of "
+                         f"{['auto', *JSON_BACKENDS]}")
+    _json_backend.update(name=name, **JSON_BACKENDS[name])
+    return name
+
+
+def json_backend():
+    """Return the name of the selected JSON backend"""
+    return _json_backend['name']
+
+
+def dumps(obj, pretty=False, sort_keys=False):
+    """
+    Serialize to UTF-8 JSON bytes with the selected backend
+
+    Args:
+        obj: Value to serialize (TrainRecords included)
+        pretty (bool): Indent by 2 spaces instead of compact separators
+        sort_keys (bool): Sort object keys
+
+    Returns:
+        bytes: The JSON document
+    """
+    return _json_backend['dumps'](obj, pretty, sort_keys)
+
+
+def loads(data):
+    """
+    Parse JSON bytes (or str, or a memoryview) with the selected backend
+
+    Raises:
+        ValueError: If the document is not valid JSON
+    """
+    return _json_backend['loads'](data)
+
+
+set_json_backend()
+
+
+def available_codecs():
+    """
+    List the codecs usable in this environment
+
+    Returns:
+        list: Codec names, excluding zstd when zstandard is not installed
+    """
+    return [name for name in CODECS if name != 'zstd' or zstandard is not None]
+
+
+def check_level(codec, level):
+    """
+    Check that a compression level is valid for a codec
+
+    Args:
+        codec (str): Codec name (see CODECS)
+        level (int): Compression level, or None for the codec default
+
+    Raises:
+        ValueError: If the codec is unknown, or the level is outside the
+            codec's range (the JSON codecs take no level)
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec '{codec}', expected one of {sorted(CODECS)}")
+    if level is None:
+        return
+    levels = CODECS[codec]['levels']
+    if levels is None:
+        raise ValueError(f"Codec '{codec}' takes no compression level")
+    if level not in levels:
+        raise ValueError(f"Codec '{codec}' takes levels {levels.start}-{levels.stop - 1}, "
+                         f"not {level}")
+
+
+def encode_snapshot(payload, codec='json', level=None):
+    """
+    Encode a payload with the given codec
+
+    Args:
+        payload (dict or list): The payload to encode
+        codec (str): Codec name (see CODECS)
+        level (int): Compression level, or None for the codec default
+
+    Returns:
+        bytes: The encoded payload
+
+    Raises:
+        ValueError: If the codec is unknown or not available
+    """
+    if codec == 'json':
+        return dumps(payload, pretty=True)
+
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec '{codec}', expected one of {sorted(CODECS)}")
+
+    return compress(dumps(payload), codec, level)
+
+
+def compress(raw, codec, level=None):
+    """
+    Apply a codec's compression to already serialized bytes
+
+    Args:
+        raw (bytes): Serialized data
+        codec (str): Codec name (see CODECS); JSON codecs return raw unchanged
+        level (int): Compression level, or None for the codec default
+
+    Returns:
+        bytes: The compressed data
+    """
+    if level is None:
+        level = CODECS[codec]['default_level']
+
+    if codec == 'gzip':
+        # mtime=0 keeps the output deterministic for identical payloads
+        return gzip.compress(raw, compresslevel=level, mtime=0)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("Codec 'zstd' requires the zstandard package")
+        return zstandard.ZstdCompressor(level=level).compress(raw)
+    return raw
+
+
+def decompress(data, codec):
+    """
+    Undo compress
+
+    Args:
+        data (bytes): Compressed data
+        codec (str): Codec name (see CODECS)
+
+    Returns:
+        bytes: The serialized data
+    """
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("Codec 'zstd' requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def decode_snapshot(data, codec='json'):
+    """
+    Decode bytes produced by encode_snapshot
+
+    Args:
+        data (bytes): The encoded payload
+        codec (str): Codec name (see CODECS)
+
+    Returns:
+        dict or list: The decoded payload
+    """
+    return loads(decompress(data, codec))
+
+
+def codec_for_filename(filename):
+    """
+    Infer the codec from a snapshot file name
+
+    Args:
+        filename (str): File or blob name
+
+    Returns:
+        str: 'gzip', 'zstd' or 'json' (both JSON codecs decode the same way)
+    """
+    if filename.endswith(CODECS['gzip']['extension']):
+        return 'gzip'
+    if filename.endswith(CODECS['zstd']['extension']):
+        return 'zstd'
+    return 'json'
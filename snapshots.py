@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Snapshot naming, delta encoding and point-in-time reconstruction
+
+In delta mode the scraper stores a full snapshot (keyframe) every few cycles
+and, in between, delta documents holding only the trains that were added,
+removed or changed since the previous cycle. Keyframes are plain snapshots
+with the usual name; deltas are named <flow>_<YYYYMMDD>_<HHMMSS>.delta<ext>:
+
+    {
+        "delta": true,
+        "base": "general-prenfe_20261017_080000.json",  # snapshot this applies to
+        "meta": {"fechaActualizacion": "..."},          # top-level keys besides trenes
+        "added": {"25001": {...}},                      # train key -> full record
+        "changed": {"25002": {...}},                    # train key -> full record
+        "removed": ["25003", ...],                      # train keys
+        "unkeyed": [...]                                # trains without an identifier
+    }
+
+Train keys are the TRAIN_ID_FIELD value, with a '#<n>' suffix for repeats.
+
+Snapshots rolled into hourly archives by the scraper's output retention
+(archive/<flow>_<YYYYMMDD>_<HH>.tar.gz under the snapshot directory) are
+still found by reconstruct, so a chain may start in an archive and continue
+in live files.
+
+Usage:
+    python snapshots.py --dir data --flow general-prenfe --at 2026-10-17T08:15:00 [-o out.json]
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+import tarfile
+from datetime import datetime
+from pathlib import Path
+
+import records
+import serialization
+
+# Field identifying a train across cycles
+TRAIN_ID_FIELD = 'codComercial'
+
+# Per-cycle snapshot names: <flow>_<YYYYMMDD>_<HHMMSS><extension>
+SNAPSHOT_NAME_RE = re.compile(r'^(?P<flow>.+)_(?P<date>\d{8})_(?P<time>\d{6})(?P<ext>\..+)$')
+
+# Hourly archives of old snapshots, in this subdirectory of the snapshot directory
+ARCHIVE_SUBDIR = 'archive'
+ARCHIVE_NAME_RE = re.compile(r'^(?P<flow>.+)_(?P<date>\d{8})_(?P<hour>\d{2})\.tar\.gz$')
+
+DELTA_MARKER = '.delta'
+UNCHANGED_MARKER = '.unchanged'
+
+# Extensions of JSON snapshots (columnar .parquet/.arrow siblings are not replayed)
+JSON_EXTENSIONS = tuple({codec['extension'] for codec in serialization.CODECS.values()})
+
+
+def parse_snapshot_name(name):
+    """
+    Parse a snapshot file name
+
+    Args:
+        name (str): File or blob name (without directories)
+
+    Returns:
+        dict: 'flow', 'timestamp' (datetime), 'delta' and 'unchanged' (bool),
+        or None if the name is not a snapshot name
+    """
+    match = SNAPSHOT_NAME_RE.match(name)
+    if match is None:
+        return None
+    try:
+        timestamp = datetime.strptime(f"{match['date']}_{match['time']}", "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+    return {
+        'flow': match['flow'],
+        'timestamp': timestamp,
+        'delta': match['ext'].startswith(DELTA_MARKER + '.'),
+        'unchanged': match['ext'].startswith(UNCHANGED_MARKER + '.'),
+    }
+
+
+def split_payload(payload):
+    """
+    Separate the trains from the rest of a payload
+
+    Args:
+        payload (dict or list): A snapshot payload
+
+    Returns:
+        tuple: (trains list, dict of other top-level keys or None for list payloads)
+    """
+    if isinstance(payload, dict) and 'trenes' in payload:
+        meta = {key: value for key, value in payload.items() if key != 'trenes'}
+        return payload['trenes'], meta
+    if isinstance(payload, list):
+        return payload, None
+    raise ValueError("Payload is neither a trains list nor a dict with 'trenes'")
+
+
+def payload_fingerprint(payload):
+    """
+    Hash a payload's trains independently of their order
+
+    Each train is canonicalized (sorted keys, compact JSON) and the sorted
+    encodings are hashed, so reordered but otherwise identical fleets match.
+    Top-level metadata such as fechaActualizacion is ignored.
+
+    Args:
+        payload (dict or list): A snapshot payload
+
+    Returns:
+        str: Hex digest
+    """
+    trains, _ = split_payload(payload)
+    canonical = sorted(serialization.dumps(train, sort_keys=True) for train in trains)
+    digest = hashlib.blake2b(digest_size=16)
+    for item in canonical:
+        digest.update(item)
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def index_trains(trains):
+    """
+    Key trains by TRAIN_ID_FIELD, preserving order
+
+    Repeated identifiers get a '#<n>' suffix so no record is lost.
+
+    Args:
+        trains (list): Train records
+
+    Returns:
+        tuple: (dict of key -> record, list of records without an identifier)
+    """
+    index = {}
+    unkeyed = []
+    for item in trains:
+        train_id = item.get(TRAIN_ID_FIELD) if isinstance(item, records.TRAIN_TYPES) else None
+        if train_id is None:
+            unkeyed.append(item)
+            continue
+        key = str(train_id)
+        if key in index:
+            n = 1
+            while f"{key}#{n}" in index:
+                n += 1
+            key = f"{key}#{n}"
+        index[key] = item
+    return index, unkeyed
+
+
+def compute_delta(previous_index, payload, base):
+    """
+    Build the delta document between the previous cycle and a new payload
+
+    Args:
+        previous_index (dict): Key -> record index of the previous cycle
+        payload (dict or list): The new snapshot payload
+        base (str): File name of the previous cycle's snapshot
+
+    Returns:
+        tuple: (delta document, key -> record index of the new payload)
+    """
+    trains, meta = split_payload(payload)
+    index, unkeyed = index_trains(trains)
+
+    added = {}
+    changed = {}
+    for key, record in index.items():
+        previous = previous_index.get(key)
+        if previous is None:
+            added[key] = record
+        elif previous != record:
+            changed[key] = record
+    removed = [key for key in previous_index if key not in index]
+
+    delta = {
+        'delta': True,
+        'base': base,
+        'meta': meta,
+        'added': added,
+        'changed': changed,
+        'removed': removed,
+        'unkeyed': unkeyed,
+    }
+    return delta, index
+
+
+def apply_delta(index, delta):
+    """
+    Apply a delta document to a key -> record index
+
+    Args:
+        index (dict): Index of the snapshot the delta is based on (not modified)
+        delta (dict): Delta document from compute_delta
+
+    Returns:
+        dict: Index of the reconstructed snapshot
+    """
+    result = dict(index)
+    for key in delta['removed']:
+        result.pop(key, None)
+    result.update(delta['changed'])
+    result.update(delta['added'])
+    return result
+
+
+def build_payload(index, unkeyed, meta):
+    """
+    Assemble a snapshot payload from an index
+
+    Args:
+        index (dict): Key -> record index
+        unkeyed (list): Records without an identifier
+        meta (dict): Other top-level keys, or None for list payloads
+
+    Returns:
+        dict or list: The payload, in the same shape as the stored keyframes
+    """
+    trains = list(index.values()) + list(unkeyed)
+    if meta is None:
+        return trains
+    return {**meta, 'trenes': trains}
+
+
+def read_snapshot(path):
+    """
+    Read and decode a snapshot file with the codec matching its extension
+
+    Args:
+        path (Path): Snapshot file
+
+    Returns:
+        dict or list: The decoded document
+    """
+    path = Path(path)
+    return serialization.decode_snapshot(
+        path.read_bytes(), serialization.codec_for_filename(path.name)
+    )
+
+
+def list_snapshots(directory, flow):
+    """
+    List a flow's keyframes and deltas in a directory in time order
+
+    Unchanged markers are skipped: the snapshot they point to still applies.
+    Columnar files are skipped as well.
+
+    Args:
+        directory (Path): Directory holding the snapshots
+        flow (str): Flow name, e.g. 'general-prenfe'
+
+    Returns:
+        list: (timestamp, is_delta, path) tuples sorted by timestamp
+    """
+    found = []
+    for path in Path(directory).iterdir():
+        if not path.name.endswith(JSON_EXTENSIONS):
+            continue
+        parsed = parse_snapshot_name(path.name)
+        if parsed is not None and parsed['flow'] == flow and not parsed['unchanged']:
+            found.append((parsed['timestamp'], parsed['delta'], path))
+    found.sort(key=lambda item: (item[0], item[1]))
+    return found
+
+
+def list_archives(directory, flow):
+    """
+    List a flow's hourly archives in a snapshot directory in time order
+
+    Args:
+        directory (Path): Snapshot directory (archives are in ARCHIVE_SUBDIR)
+        flow (str): Flow name, e.g. 'general-prenfe'
+
+    Returns:
+        list: (start of the hour, path) tuples sorted by time
+    """
+    archive_dir = Path(directory) / ARCHIVE_SUBDIR
+    if not archive_dir.is_dir():
+        return []
+    found = []
+    for path in archive_dir.iterdir():
+        match = ARCHIVE_NAME_RE.match(path.name)
+        if match is None or match['flow'] != flow:
+            continue
+        try:
+            hour = datetime.strptime(f"{match['date']}{match['hour']}", "%Y%m%d%H")
+        except ValueError:
+            continue
+        found.append((hour, path))
+    return sorted(found)
+
+
+def read_archive(path, flow):
+    """
+    Read a flow's keyframes and deltas from an hourly archive
+
+    Returns:
+        list: (timestamp, is_delta, (member name, stored bytes)) tuples sorted
+        by timestamp; unchanged markers and columnar files are skipped
+    """
+    found = []
+    with tarfile.open(path, 'r:gz') as tar:
+        for member in tar.getmembers():
+            parsed = parse_snapshot_name(member.name)
+            if not member.isfile() or not member.name.endswith(JSON_EXTENSIONS) \
+                    or parsed is None or parsed['flow'] != flow or parsed['unchanged']:
+                continue
+            data = tar.extractfile(member).read()
+            found.append((parsed['timestamp'], parsed['delta'], (member.name, data)))
+    found.sort(key=lambda item: (item[0], item[1]))
+    return found
+
+
+def _read_entry(source):
+    """Name and decoded document of a snapshot file or (member name, bytes) archive entry"""
+    if isinstance(source, Path):
+        return source.name, read_snapshot(source)
+    name, data = source
+    return name, serialization.decode_snapshot(data, serialization.codec_for_filename(name))
+
+
+def reconstruct(directory, flow, at):
+    """
+    Reconstruct a flow's snapshot as of a point in time
+
+    Starts from the latest keyframe at or before 'at' and applies the deltas
+    that follow it up to 'at'. When the live files hold no such keyframe, the
+    flow's hourly archives up to 'at' are searched too, newest first.
+
+    Args:
+        directory (Path): Directory holding keyframes and deltas
+        flow (str): Flow name, e.g. 'general-prenfe'
+        at (datetime): Point in time
+
+    Returns:
+        tuple: (payload, timestamp of the last snapshot applied)
+
+    Raises:
+        LookupError: If there is no keyframe at or before 'at'
+        ValueError: If a delta does not chain onto the previous snapshot
+    """
+    candidates = [item for item in list_snapshots(directory, flow) if item[0] <= at]
+    archives = [path for hour, path in list_archives(directory, flow) if hour <= at]
+    while archives and all(is_delta for _, is_delta, _ in candidates):
+        archived = [item for item in read_archive(archives.pop(), flow) if item[0] <= at]
+        candidates = sorted(archived + candidates, key=lambda item: (item[0], item[1]))
+    keyframes = [i for i, (_, is_delta, _) in enumerate(candidates) if not is_delta]
+    if not keyframes:
+        raise LookupError(f"No {flow} keyframe at or before {at.isoformat()}")
+
+    start = keyframes[-1]
+    timestamp, _, source = candidates[start]
+    base, payload = _read_entry(source)
+    trains, meta = split_payload(payload)
+    index, unkeyed = index_trains(trains)
+
+    for timestamp, _, source in candidates[start + 1:]:
+        name, delta = _read_entry(source)
+        if delta.get('base') != base:
+            raise ValueError(f"{name} is based on {delta.get('base')}, expected {base}")
+        index = apply_delta(index, delta)
+        unkeyed = delta['unkeyed']
+        meta = delta['meta']
+        base = name
+
+    return build_payload(index, unkeyed, meta), timestamp
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruct a snapshot from keyframes and deltas")
+    parser.add_argument('--dir', type=Path, default=Path('data'), help="Snapshot directory")
+    parser.add_argument('--flow', default='general-prenfe', help="Flow name")
+    parser.add_argument('--at', required=True, type=datetime.fromisoformat,
+                        help="Point in time, e.g. 2026-10-17T08:15:00")
+    parser.add_argument('-o', '--output', type=Path, help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    try:
+        payload, timestamp = reconstruct(args.dir, args.flow, args.at)
+    except (LookupError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    encoded = json.dumps(payload, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(encoded, encoding='utf-8')
+    else:
+        print(encoded)
+    print(f"Reconstructed {args.flow} as of {timestamp.isoformat()}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,612 @@
+#!/usr/bin/env python3
+"""
+Append-only local snapshot store with a memory-mapped time index
+
+Instead of one file per flow per cycle, a flow's snapshots are appended to a
+single data file, and a fixed-width index maps each cycle time to the
+snapshot's offset and length:
+
+    <directory>/<flow>.dat   encoded snapshots, back to back, as stored
+    <directory>/<flow>.idx   8-byte header, then one 24-byte entry per snapshot
+
+Index entry (little endian): cycle time as a YYYYMMDDHHMMSS integer (int64),
+data offset (uint64), length (uint32), kind (uint8: full, delta or
+unchanged marker), codec (uint8, position in CODEC_IDS) and 2 padding bytes.
+Entries are appended in time order, so the snapshot at or nearest to a time,
+or the snapshots in a time range, are found by binary search over the
+memory-mapped index. read() returns a memoryview of the memory-mapped data
+file, without copying.
+
+One process writes a store, any number read it. The writer appends under an
+exclusive lock on <flow>.lock, writing and fsyncing the data before its index
+entry, so readers never see an entry whose data is missing. When the writer
+opens the store, under the same lock, it drops a partial index entry and
+truncates data past the last indexed snapshot (left by a crash between the
+two writes). Readers open the files read-only and never change them.
+
+With rotate_daily, the writer starts new files on the first full snapshot of
+a day; the previous files are kept as a segment, <flow>.<first cycle
+YYYYMMDDHHMMSS>.dat and .idx, so old days can be deleted (scraper.py's
+output retention does) while the current files keep growing. open_at()
+opens the segment covering a point in time.
+
+snapshot_names() and read_named() address a directory's snapshots, current
+files and segments alike, by the per-cycle file name they would have outside
+the store (e.g. general-prenfe_20261017_080000.json), which is how replay.py
+and reader.py find them under <output dir>/_store.
+
+Usage:
+    python store.py --dir data/_store --flow general-prenfe --import data
+    python store.py --dir data/_store --flow general-prenfe --at 2026-10-17T08:15:00 [-o out.json]
+"""
+
+import argparse
+import bisect
+import glob
+import io
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no locking, a single writer process is assumed
+    fcntl = None
+
+import serialization
+import snapshots
+
+INDEX_MAGIC = b'PRSIDX01'
+INDEX_ENTRY = struct.Struct('<qQIBB2x')
+
+DATA_EXTENSION = '.dat'
+INDEX_EXTENSION = '.idx'
+LOCK_EXTENSION = '.lock'
+
+# Store directory under the scraper's OUTPUT_DIR
+STORE_SUBDIR = '_store'
+
+# <flow>.<first cycle>.dat / .idx of a rotated store
+SEGMENT_RE = re.compile(r'^(?P<flow>.+)\.(?P<start>\d{14})\.(?P<ext>dat|idx)$')
+
+# Codec of each entry, by position; only ever append to this tuple
+CODEC_IDS = ('json', 'json-compact', 'gzip', 'zstd')
+
+KIND_FULL = 0
+KIND_DELTA = 1
+KIND_UNCHANGED = 2
+KINDS = {KIND_FULL: 'full', KIND_DELTA: 'delta', KIND_UNCHANGED: 'unchanged'}
+
+
+def encode_time(when):
+    """Index key of a cycle time: the YYYYMMDDHHMMSS integer"""
+    return int(when.strftime('%Y%m%d%H%M%S'))
+
+
+def decode_time(key):
+    """Cycle time of an index key"""
+    return datetime.strptime(str(key), '%Y%m%d%H%M%S')
+
+
+class _IndexKeys:
+    """Read-only sequence of the index keys, for bisect"""
+
+    def __init__(self, index, count):
+        self._index = index
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, position):
+        return INDEX_ENTRY.unpack_from(self._index, len(INDEX_MAGIC)
+                                       + position * INDEX_ENTRY.size)[0]
+
+
+class SnapshotStore:
+    """
+    A flow's snapshots in one data file, located through a time index
+
+    Opened read-only by default. Readers in other processes may use a store
+    while its writer appends to it; the maps are refreshed when the files
+    have changed.
+
+    Args:
+        directory (Path): Store directory, created by the writer when missing
+        flow (str): Flow name, e.g. 'general-prenfe'
+        writable (bool): Open as the writer: create the files, recover a torn
+            append and allow append()
+        rotate_daily (bool): For the writer, keep each day's snapshots in a
+            segment of their own (see the module docstring)
+        segment (int): Open this rotated segment (its first cycle, as
+            YYYYMMDDHHMMSS) instead of the current files; read-only
+
+    Raises:
+        FileNotFoundError: If a reader opens a store that does not exist
+        ValueError: If the index file is not a snapshot store index
+    """
+
+    def __init__(self, directory, flow, writable=False, rotate_daily=False, segment=None):
+        if writable and segment is not None:
+            raise ValueError("Rotated segments are read-only")
+        self.directory = Path(directory)
+        self.flow = flow
+        self.writable = writable
+        self.rotate_daily = rotate_daily
+        stem = flow if segment is None else f"{flow}.{segment}"
+        self.data_path = self.directory / f"{stem}{DATA_EXTENSION}"
+        self.index_path = self.directory / f"{stem}{INDEX_EXTENSION}"
+        self.lock_path = self.directory / f"{flow}{LOCK_EXTENSION}"
+        self._lock = threading.Lock()
+        self._data = self._index = None
+        self._count = 0
+        # (inode, size) of the mapped files: rotation replaces them with new inodes
+        self._index_id = self._data_id = None
+        if writable:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with self._exclusive():
+                self._recover()
+        else:
+            with open(self.index_path, 'rb') as index:
+                if index.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                    raise ValueError(f"{self.index_path} is not a snapshot store index")
+
+    def _exclusive(self):
+        """Context manager holding the writer lock of the store across processes"""
+        return _FileLock(self.lock_path)
+
+    def _recover(self):
+        """Create the files, or drop a torn last append; writer only, under the lock"""
+        with open(self.index_path, 'a+b') as index:
+            size = index.seek(0, os.SEEK_END)
+            if size == 0:
+                index.write(INDEX_MAGIC)
+                size = len(INDEX_MAGIC)
+            index.seek(0)
+            if index.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError(f"{self.index_path} is not a snapshot store index")
+            count = (size - len(INDEX_MAGIC)) // INDEX_ENTRY.size
+            data_size = os.path.getsize(self.data_path) if self.data_path.exists() else 0
+            end = 0
+            while count:
+                index.seek(len(INDEX_MAGIC) + (count - 1) * INDEX_ENTRY.size)
+                _, offset, length, _, _ = INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size))
+                if offset + length <= data_size:
+                    end = offset + length
+                    break
+                count -= 1
+            index.truncate(len(INDEX_MAGIC) + count * INDEX_ENTRY.size)
+            index.flush()
+            os.fsync(index.fileno())
+        with open(self.data_path, 'a+b') as data:
+            data.truncate(end)
+
+    def refresh(self):
+        """
+        Re-map the files if the writer has appended to or rotated them
+
+        Returns:
+            int: Number of snapshots
+        """
+        stat = os.stat(self.index_path)
+        if (stat.st_ino, stat.st_size) != self._index_id:
+            self._index, self._index_id = self._map(self.index_path)
+            self._count = (self._index_id[1] - len(INDEX_MAGIC)) // INDEX_ENTRY.size
+        stat = os.stat(self.data_path)
+        if (stat.st_ino, stat.st_size) != self._data_id:
+            # Old maps stay valid for memoryviews still referring to them
+            self._data, self._data_id = self._map(self.data_path)
+        return self._count
+
+    @staticmethod
+    def _map(path):
+        """Map a file read-only; returns (map, (inode, size)) of the file actually mapped"""
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size == 0:
+                return b'', (stat.st_ino, 0)
+            return (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ),
+                    (stat.st_ino, stat.st_size))
+
+    def __len__(self):
+        return self.refresh()
+
+    def append(self, when, encoded, codec='json', kind=KIND_FULL):
+        """
+        Durably append an encoded snapshot
+
+        Args:
+            when (datetime): Cycle time; not earlier than the last snapshot's
+            encoded (bytes): The snapshot, as encoded by serialization.encode_snapshot
+            codec (str): Codec it was encoded with (see CODEC_IDS)
+            kind (int): KIND_FULL, KIND_DELTA or KIND_UNCHANGED
+
+        Returns:
+            int: Position of the new snapshot
+
+        Raises:
+            ValueError: If the codec or kind is unknown or 'when' is out of order
+        """
+        if codec not in CODEC_IDS:
+            raise ValueError(f"Unknown codec '{codec}'")
+        if kind not in KINDS:
+            raise ValueError(f"Unknown snapshot kind {kind}")
+        if not self.writable:
+            raise io.UnsupportedOperation(f"{self.flow} store was opened read-only")
+        key = encode_time(when)
+        with self._lock, self._exclusive():
+            count = self.refresh()
+            if count and key < _IndexKeys(self._index, count)[count - 1]:
+                raise ValueError(f"{self.flow} snapshot at {when.isoformat()} is older than "
+                                 f"the last stored snapshot")
+            if self.rotate_daily and count and kind == KIND_FULL and \
+                    decode_time(_IndexKeys(self._index, count)[0]).date() < when.date():
+                self._rotate(_IndexKeys(self._index, count)[0])
+                count = self.refresh()
+            with open(self.data_path, 'ab') as data:
+                offset = data.tell()
+                data.write(encoded)
+                data.flush()
+                os.fsync(data.fileno())
+            entry = INDEX_ENTRY.pack(key, offset, len(encoded), kind, CODEC_IDS.index(codec))
+            with open(self.index_path, 'ab') as index:
+                index.write(entry)
+                index.flush()
+                os.fsync(index.fileno())
+            return count
+
+    def _rotate(self, first_key):
+        """Keep the current files as a segment and start empty ones, under the lock"""
+        segment = self.directory / f"{self.flow}.{first_key}"
+        # Link the segment names first, then swap in empty files: a reader sees
+        # either the old files or an empty index, never a missing file. A link
+        # left by a rotation that crashed before the swap names the same files,
+        # so it is replaced rather than failing every later rotation.
+        for path, extension in ((self.data_path, DATA_EXTENSION),
+                                (self.index_path, INDEX_EXTENSION)):
+            target = segment.with_name(segment.name + extension)
+            target.unlink(missing_ok=True)
+            os.link(path, target)
+        for path, content in ((self.index_path, INDEX_MAGIC), (self.data_path, b'')):
+            tmp_path = path.with_name(path.name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            tmp_path.replace(path)
+
+    def entry(self, position, refresh=True):
+        """
+        Index entry of a snapshot
+
+        Args:
+            position (int): Snapshot position (negative counts from the end)
+            refresh (bool): Re-map grown files first
+
+        Returns:
+            dict: 'timestamp', 'kind' (KINDS value), 'codec', 'offset', 'end'
+        """
+        if refresh or self._index is None:
+            self.refresh()
+        if position < 0:
+            position += self._count
+        if not 0 <= position < self._count:
+            raise IndexError(f"{self.flow} store has no snapshot {position}")
+        key, offset, length, kind, codec = INDEX_ENTRY.unpack_from(
+            self._index, len(INDEX_MAGIC) + position * INDEX_ENTRY.size)
+        return {'timestamp': decode_time(key), 'kind': KINDS[kind], 'codec': CODEC_IDS[codec],
+                'offset': offset, 'end': offset + length}
+
+    def name(self, position):
+        """Per-cycle file name the snapshot would have outside the store"""
+        entry = self.entry(position)
+        marker = {'delta': snapshots.DELTA_MARKER, 'unchanged': snapshots.UNCHANGED_MARKER}
+        extension = serialization.CODECS[entry['codec']]['extension']
+        return (f"{self.flow}_{entry['timestamp']:%Y%m%d_%H%M%S}"
+                f"{marker.get(entry['kind'], '')}{extension}")
+
+    def read(self, position):
+        """
+        Stored bytes of a snapshot, without copying
+
+        Returns:
+            memoryview: A view of the memory-mapped data file
+        """
+        entry = self.entry(position)
+        return memoryview(self._data)[entry['offset']:entry['end']]
+
+    def decode(self, position):
+        """Decoded document of a snapshot"""
+        return serialization.decode_snapshot(self.read(position),
+                                             self.entry(position, refresh=False)['codec'])
+
+    def locate(self, when):
+        """
+        Position of the last snapshot at or before a time
+
+        Returns:
+            int: Position, or None if every snapshot is later
+        """
+        count = self.refresh()
+        position = bisect.bisect_right(_IndexKeys(self._index, count), encode_time(when))
+        return position - 1 if position else None
+
+    def nearest(self, when):
+        """
+        Position of the snapshot closest in time (the earlier one on a tie)
+
+        Returns:
+            int: Position, or None if the store is empty
+        """
+        count = self.refresh()
+        if not count:
+            return None
+        keys = _IndexKeys(self._index, count)
+        after = bisect.bisect_left(keys, encode_time(when))
+        candidates = [position for position in (after - 1, after) if 0 <= position < count]
+        return min(candidates, key=lambda position: abs(decode_time(keys[position]) - when))
+
+    def between(self, since=None, until=None):
+        """
+        Positions of the snapshots in a time range
+
+        Args:
+            since (datetime): Earliest cycle time (inclusive), None for the first
+            until (datetime): Latest cycle time (inclusive), None for the last
+
+        Returns:
+            range: Snapshot positions, in time order
+        """
+        count = self.refresh()
+        keys = _IndexKeys(self._index, count)
+        start = bisect.bisect_left(keys, encode_time(since)) if since else 0
+        stop = bisect.bisect_right(keys, encode_time(until)) if until else count
+        return range(start, max(start, stop))
+
+    def reconstruct(self, when):
+        """
+        Reconstruct the flow's payload as of a time, like snapshots.reconstruct
+
+        Returns:
+            tuple: (payload, timestamp of the last snapshot applied)
+
+        Raises:
+            LookupError: If there is no full snapshot at or before 'when'
+            ValueError: If a delta does not chain onto the previous snapshot
+        """
+        last = self.locate(when)
+        start = last
+        while start is not None and start >= 0 and self.entry(start)['kind'] != 'full':
+            start -= 1
+        if start is None or start < 0:
+            raise LookupError(f"No {self.flow} keyframe at or before {when.isoformat()}")
+
+        trains, meta = snapshots.split_payload(self.decode(start))
+        index, unkeyed = snapshots.index_trains(trains)
+        base = self.name(start)
+        timestamp = self.entry(start)['timestamp']
+        for position in range(start + 1, last + 1):
+            entry = self.entry(position)
+            if entry['kind'] != 'delta':
+                continue
+            delta = self.decode(position)
+            if delta.get('base') != base:
+                raise ValueError(f"{self.name(position)} is based on {delta.get('base')}, "
+                                 f"expected {base}")
+            index = snapshots.apply_delta(index, delta)
+            unkeyed = delta['unkeyed']
+            meta = delta['meta']
+            base = self.name(position)
+            timestamp = entry['timestamp']
+        return snapshots.build_payload(index, unkeyed, meta), timestamp
+
+
+class _FileLock:
+    """Exclusive flock on a lock file, held for a with block"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def segments(directory, flow):
+    """
+    Rotated segments of a flow's store
+
+    Returns:
+        list: (first cycle time, segment) tuples, oldest first; open one with
+        SnapshotStore(directory, flow, segment=segment)
+    """
+    found = []
+    for path in Path(directory).glob(f"{glob.escape(flow)}.*{INDEX_EXTENSION}"):
+        match = SEGMENT_RE.match(path.name)
+        if match and match['flow'] == flow:
+            found.append((decode_time(int(match['start'])), int(match['start'])))
+    return sorted(found)
+
+
+def open_at(directory, flow, when):
+    """
+    Open (read-only) the store or rotated segment holding a flow's snapshots at a time
+
+    Returns:
+        SnapshotStore: The last segment starting at or before 'when', or the
+        current store when it does (or when there are no earlier segments)
+    """
+    current = SnapshotStore(directory, flow)
+    if len(current) and current.entry(0)['timestamp'] <= when:
+        return current
+    earlier = [segment for start, segment in segments(directory, flow) if start <= when]
+    return SnapshotStore(directory, flow, segment=earlier[-1]) if earlier else current
+
+
+def snapshot_names(directory):
+    """
+    Yield the per-cycle names of every snapshot in a store directory
+
+    Flows are listed in name order, each from its oldest segment to the
+    current files.
+
+    Args:
+        directory (Path): Store directory
+
+    Yields:
+        str: Snapshot names, e.g. 'general-prenfe_20261017_080000.json'
+    """
+    directory = Path(directory)
+    if not directory.is_dir():
+        return
+    flows = set()
+    for path in directory.glob(f"*{INDEX_EXTENSION}"):
+        match = SEGMENT_RE.match(path.name)
+        flows.add(match['flow'] if match else path.name[:-len(INDEX_EXTENSION)])
+    for flow in sorted(flows):
+        for segment in [segment for _, segment in segments(directory, flow)] + [None]:
+            try:
+                reader = _reader(directory, flow, segment)
+            except FileNotFoundError:
+                continue  # no current files, or a segment deleted by retention meanwhile
+            for position in range(len(reader)):
+                yield reader.name(position)
+
+
+def read_named(directory, name):
+    """
+    Stored bytes of a snapshot, by the per-cycle name snapshot_names() gives it
+
+    Args:
+        directory (Path): Store directory
+        name (str): Snapshot name
+
+    Returns:
+        bytes: The snapshot as stored (see its name's extension for the codec)
+
+    Raises:
+        FileNotFoundError: If the store holds no snapshot with that name
+    """
+    parsed = snapshots.parse_snapshot_name(name)
+    if parsed is None:
+        raise FileNotFoundError(f"{name} is not a snapshot name")
+    flow, when = parsed['flow'], parsed['timestamp']
+    earlier = [segment for start, segment in segments(directory, flow) if start <= when]
+    for segment in [None] + earlier[::-1]:
+        try:
+            reader = _reader(directory, flow, segment)
+        except FileNotFoundError:
+            continue
+        position = reader.locate(when)
+        while position is not None and position >= 0 \
+                and reader.entry(position)['timestamp'] == when:
+            if reader.name(position) == name:
+                return bytes(reader.read(position))
+            position -= 1
+    raise FileNotFoundError(f"{directory} has no snapshot {name}")
+
+
+# Read-only stores opened by snapshot_names() and read_named(), per process
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def _reader(directory, flow, segment=None):
+    """Cached read-only store (current files refresh themselves after a rotation)"""
+    key = (str(directory), flow, segment)
+    with _readers_lock:
+        if key not in _readers:
+            _readers[key] = SnapshotStore(directory, flow, segment=segment)
+        return _readers[key]
+
+
+def snapshot_kind(parsed):
+    """Store kind of a parsed snapshot name (see snapshots.parse_snapshot_name)"""
+    if parsed['unchanged']:
+        return KIND_UNCHANGED
+    return KIND_DELTA if parsed['delta'] else KIND_FULL
+
+
+def import_directory(store, directory):
+    """
+    Append a directory's per-cycle snapshot files of the store's flow
+
+    Only snapshots later than the store's last one are imported, so an import
+    can be repeated. The files are left in place.
+
+    Args:
+        store (SnapshotStore): Destination store
+        directory (Path): Directory holding <flow>_<YYYYMMDD>_<HHMMSS><ext> files
+
+    Returns:
+        int: Number of snapshots imported
+    """
+    last = store.entry(-1)['timestamp'] if len(store) else None
+    found = []
+    for path in Path(directory).iterdir():
+        if not path.name.endswith(snapshots.JSON_EXTENSIONS):
+            continue
+        parsed = snapshots.parse_snapshot_name(path.name)
+        if parsed is None or parsed['flow'] != store.flow:
+            continue
+        if last is None or parsed['timestamp'] > last:
+            found.append((parsed['timestamp'], snapshot_kind(parsed), path))
+    found.sort(key=lambda item: (item[0], item[1]))
+    for timestamp, kind, path in found:
+        store.append(timestamp, path.read_bytes(), serialization.codec_for_filename(path.name),
+                     kind)
+    return len(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or fill a local snapshot store")
+    parser.add_argument('--dir', type=Path, default=Path('data/_store'), help="Store directory")
+    parser.add_argument('--flow', default='general-prenfe', help="Flow name")
+    parser.add_argument('--import', dest='source', type=Path,
+                        help="Append the flow's snapshot files from this directory")
+    parser.add_argument('--at', type=datetime.fromisoformat,
+                        help="Point in time to reconstruct, e.g. 2026-10-17T08:15:00")
+    parser.add_argument('-o', '--output', type=Path, help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    if args.source:
+        store = SnapshotStore(args.dir, args.flow, writable=True)
+        imported = import_directory(store, args.source)
+        print(f"Imported {imported} {args.flow} snapshots into {store.data_path}", file=sys.stderr)
+    if args.at is None:
+        return 0
+
+    try:
+        payload, timestamp = open_at(args.dir, args.flow, args.at).reconstruct(args.at)
+    except (OSError, LookupError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    encoded = json.dumps(payload, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(encoded, encoding='utf-8')
+    else:
+        print(encoded)
+    print(f"Reconstructed {args.flow} as of {timestamp.isoformat()}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for vectorized fleet analytics
+"""
+
+import pytest
+
+import flows
+
+numpy = pytest.importorskip('numpy')
+
+import analytics  # noqa: E402
+import records  # noqa: E402
+from benchmarks.synthetic import generate_flota  # noqa: E402
+
+
+def train(code, line, delay, station):
+    return {'codComercial': code, 'codLinea': line, 'ultRetraso': delay, 'codEstAct': station}
+
+
+class TestFleetColumns:
+    """Tests for FleetColumns.summarize"""
+
+    def test_counts_delays_and_stations(self):
+        """Should compute per-line counts, delay distributions and station occupancy"""
+        trains = [
+            train('1', 'R1', '0', '71801'), train('2', 'r1', '4', '71801'),
+            train('3', 'R1', 10, '78805'), train('4', 'C1', 'n/a', '78805'),
+            train('5', None, '2', ''), 'not a train', train('6', 'C1', '6', '71801'),
+        ]
+        metrics = analytics.FleetColumns(trains).summarize()
+
+        assert metrics['line_counts'] == {'R1': 3, 'C1': 2, 'UNKNOWN': 1}
+        assert metrics['delay'] == pytest.approx({'count': 5, 'mean': 4.4, 'p50': 4.0, 'p95': 9.2})
+        assert metrics['line_delays']['R1'] == \
+            pytest.approx({'count': 3, 'mean': 14 / 3, 'p50': 4.0, 'p95': 9.4})
+        assert metrics['line_delays']['C1'] == {'count': 1, 'mean': 6.0, 'p50': 6.0, 'p95': 6.0}
+        assert list(metrics['station_counts'].items()) == [('71801', 3), ('78805', 2)]
+
+    def test_empty_and_no_delays(self):
+        """Should report empty distributions as None"""
+        empty = {'count': 0, 'mean': None, 'p50': None, 'p95': None}
+        assert analytics.FleetColumns([]).summarize()['delay'] == empty
+
+        metrics = analytics.FleetColumns([{'codLinea': 'R1'}]).summarize()
+        assert metrics['line_delays'] == {'R1': empty}
+        assert metrics['station_counts'] == {}
+
+    def test_flow_rows_match_flow_payloads(self):
+        """Should give each flow the metrics of its own trains from one set of columns"""
+        data = records.parse_payload(generate_flota(1, seed=7))
+        fleet = analytics.FleetColumns.from_payload(data)
+        results = flows.evaluate_flows(flows.default_flows('R*,RG1'), data)
+
+        for result in results.values():
+            trains = result['payload']
+            trains = trains['trenes'] if isinstance(trains, dict) else trains
+            metrics = fleet.summarize(result['rows'])
+            expected = analytics.FleetColumns(trains).summarize()
+
+            assert metrics['line_counts'] == result['analysis']['line_counts']
+            assert metrics['delay'] == pytest.approx(expected['delay'])
+            assert metrics['station_counts'] == expected['station_counts']
+            delays = numpy.array([float(t['ultRetraso']) for t in trains])
+            assert metrics['delay']['p95'] == pytest.approx(numpy.percentile(delays, 95))
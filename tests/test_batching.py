@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for time-partitioned batching and the write-ahead log
+"""
+
+import json
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+import batching
+import serialization
+
+
+def cycle(minute, hour=8, trains=None):
+    return datetime(2026, 10, 17, hour, minute), {'payload': trains or [{'codComercial': '1'}]}
+
+
+class Recorder:
+    """store callback keeping every batch in memory"""
+
+    def __init__(self, result=True):
+        self.result = result
+        self.batches = {}
+
+    def __call__(self, flow_name, object_name, encoded, content_type, content_encoding):
+        self.batches[object_name] = (flow_name, encoded, content_type, content_encoding)
+        return self.result
+
+
+class TestBatchWriter:
+    """Tests for BatchWriter"""
+
+    def test_flushes_completed_hours_into_partitioned_objects(self):
+        """Should write one object per flow and hour once the hour is over"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer = batching.BatchWriter(Path(tmpdir), 'hour', 'jsonl', 'gzip')
+            for minute in (2, 4):
+                writer.append('prenfe-cat', *cycle(minute))
+            writer.append('prenfe-cat', *cycle(0, hour=9))
+            store = Recorder()
+
+            assert writer.flush(store, datetime(2026, 10, 17, 9, 2)) == 1
+
+            name = 'flow=prenfe-cat/date=2026-10-17/hour=08/part-20261017T080200.jsonl.gz'
+            flow_name, encoded, content_type, content_encoding = store.batches[name]
+            assert (flow_name, content_type, content_encoding) == \
+                ('prenfe-cat', 'application/x-ndjson', 'gzip')
+            lines = serialization.decompress(encoded, 'gzip').splitlines()
+            assert [json.loads(line)['fetched_at'] for line in lines] == \
+                ['2026-10-17T08:02:00', '2026-10-17T08:04:00']
+            # The 09:00 partition is still open
+            assert [p.name for _, _, p in writer.pending()] == ['2026-10-17T09.jsonl']
+
+    def test_restart_recovers_wal_and_drops_torn_line(self):
+        """Should flush cycles buffered by a previous instance, ignoring a partial write"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            batching.BatchWriter(Path(tmpdir), 'day').append('general-prenfe', *cycle(2))
+            wal = Path(tmpdir) / 'general-prenfe' / '2026-10-17.jsonl'
+            with open(wal, 'ab') as f:
+                f.write(b'{"fetched_at": "2026-10-17T08:04:00", "payl')  # crash mid-write
+
+            restarted = batching.BatchWriter(Path(tmpdir), 'day', 'jsonl', 'json-compact')
+            restarted.append('general-prenfe', *cycle(6))
+            store = Recorder()
+            assert restarted.flush(store, datetime(2026, 10, 18, 0, 2)) == 1
+
+            (name,) = store.batches
+            assert name == 'flow=general-prenfe/date=2026-10-17/part-20261017T080200.jsonl'
+            lines = store.batches[name][1].splitlines()
+            assert [json.loads(line)['fetched_at'] for line in lines] == \
+                ['2026-10-17T08:02:00', '2026-10-17T08:06:00']
+            assert not wal.exists()
+
+    def test_failed_store_keeps_wal(self):
+        """Should keep the WAL file for a retry when storing fails"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer = batching.BatchWriter(Path(tmpdir), 'hour', 'jsonl', 'json')
+            writer.append('prenfe-cat', *cycle(2))
+
+            assert writer.flush(Recorder(result=False)) == 0
+            assert len(writer.pending()) == 1
+            assert writer.flush(Recorder()) == 1
+            assert writer.pending() == []
+
+    def test_parquet_batches_have_one_row_per_train(self):
+        """Should write every train of every cycle with its fetch time"""
+        pytest.importorskip('pyarrow')
+        import columnar
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer = batching.BatchWriter(Path(tmpdir), 'hour', 'parquet')
+            writer.append('prenfe-cat', *cycle(2, trains=[{'codComercial': '1'},
+                                                            {'codComercial': '2'}]))
+            writer.append('prenfe-cat', cycle(4)[0], {'unchanged': True, 'same_as': 'x'})
+            writer.append('prenfe-cat', *cycle(6))
+            store = Recorder()
+            writer.flush(store)
+
+            (name,) = store.batches
+            assert name.endswith('hour=08/part-20261017T080200.parquet')
+            table = columnar.decode_table(store.batches[name][1])
+            assert table.column('codComercial').to_pylist() == ['1', '2', '1']
+
+    def test_rejects_invalid_configuration(self):
+        """Should raise ValueError for unknown granularities and formats"""
+        with pytest.raises(ValueError):
+            batching.BatchWriter(Path('.'), 'minute')
+        with pytest.raises(ValueError):
+            batching.BatchWriter(Path('.'), 'hour', 'csv')
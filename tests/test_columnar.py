@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests for columnar (Parquet / Arrow IPC) snapshots
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+pyarrow = pytest.importorskip('pyarrow')
+
+import columnar  # noqa: E402
+
+FETCHED_AT = datetime(2026, 10, 17, 8, 0, tzinfo=timezone.utc)
+
+
+class TestEncodeColumnar:
+    """Tests for encode_columnar and decode_table"""
+
+    @pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+    def test_round_trips_with_stable_schema(self, fmt):
+        """Should coerce fields to the schema and add the fetch time"""
+        payload = {'fechaActualizacion': '2026-10-17T08:00:00', 'trenes': [
+            {'codComercial': 25001, 'codLinea': 'R1', 'latitud': '41.38', 'longitud': 2.17,
+             'ultRetraso': '3', 'accesible': True, 'nextVia': 4, 'time': 1792224000000,
+             'extra': 'dropped'},
+            {'codComercial': '25002', 'codLinea': 'C5', 'ultRetraso': 'n/a'},
+            'not a dict',
+        ]}
+        table = columnar.decode_table(columnar.encode_columnar(payload, FETCHED_AT, fmt), fmt)
+
+        assert table.schema.equals(columnar.schema())
+        rows = table.to_pylist()
+        assert len(rows) == 2
+        assert rows[0]['codComercial'] == '25001'
+        assert rows[0]['latitud'] == 41.38
+        assert rows[0]['ultRetraso'] == 3
+        assert rows[0]['nextVia'] == '4'
+        assert rows[0]['time'] == datetime(2026, 10, 17, 8, 0, tzinfo=timezone.utc)
+        assert 'extra' not in rows[0]
+        assert rows[1]['ultRetraso'] is None
+        assert {row['fetched_at'] for row in rows} == {FETCHED_AT}
+
+    def test_empty_fleet_keeps_schema(self):
+        """Should write an empty table with the full schema"""
+        table = columnar.decode_table(columnar.encode_columnar([], FETCHED_AT))
+        assert table.num_rows == 0
+        assert table.schema.equals(columnar.schema())
+
+    def test_rejects_unknown_format(self):
+        """Should raise ValueError for unsupported formats"""
+        with pytest.raises(ValueError):
+            columnar.encode_columnar([], FETCHED_AT, 'orc')
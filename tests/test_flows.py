@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for the declarative flow registry
+"""
+
+import tempfile
+from pathlib import Path
+
+import pytest
+
+import flows
+
+FLEET = {
+    'fechaActualizacion': '2026-10-17T08:00:00',
+    'trenes': [
+        {'codComercial': '1', 'codLinea': 'C1', 'nucleo': '10', 'latitud': 40.4},
+        {'codComercial': '2', 'codLinea': 'C1', 'nucleo': '40', 'latitud': 39.5},
+        {'codComercial': '3', 'codLinea': 'R2N', 'nucleo': '50', 'latitud': 41.4},
+        {'codComercial': '4', 'codLinea': 'AVE', 'latitud': 40.0},
+        {'codComercial': '5', 'nucleo': '10'},
+    ],
+}
+
+
+class TestEvaluateFlows:
+    """Tests for evaluate_flows"""
+
+    def test_selects_projects_and_counts_each_flow(self):
+        """Should apply line filters, field filters and projections in one pass"""
+        registry = [
+            flows.Flow('all', envelope=True),
+            flows.Flow('madrid', lines='C*', match={'nucleo': ['10']}),
+            flows.Flow('ave', lines='AVE', fields=['codComercial', 'latitud'], envelope=True),
+        ]
+        results = flows.evaluate_flows(registry, FLEET)
+
+        assert results['all']['payload'] is FLEET
+        assert results['all']['analysis'] == {
+            'total_trains': 5,
+            'line_counts': {'C1': 2, 'R2N': 1, 'AVE': 1, 'UNKNOWN': 1},
+        }
+        assert results['madrid']['payload'] == [FLEET['trenes'][0]]
+        assert results['madrid']['analysis'] == {'total_trains': 1, 'line_counts': {'C1': 1}}
+        assert results['ave']['payload'] == {
+            'fechaActualizacion': '2026-10-17T08:00:00',
+            'trenes': [{'codComercial': '4', 'latitud': 40.0}],
+        }
+
+    def test_list_line_specs_with_envelope(self):
+        """Should accept line filters given as lists, also for the passthrough check"""
+        registry = [
+            flows.Flow('all', lines=['*'], envelope=True),
+            flows.Flow('regional', lines=['R1', 'R2N'], envelope=True),
+        ]
+        results = flows.evaluate_flows(registry, FLEET)
+
+        assert results['all']['payload'] is FLEET
+        assert results['regional']['payload']['trenes'] == [FLEET['trenes'][2]]
+
+    def test_non_list_payload_passes_through(self):
+        """Should hand unexpected payload shapes to every flow unchanged"""
+        data = {'train1': {'codLinea': 'R1'}}
+        results = flows.evaluate_flows(flows.default_flows('R1'), data)
+        assert results['prenfe-cat']['payload'] is data
+        assert results['prenfe-cat']['analysis']['total_trains'] == 0
+
+
+class TestLoadFlows:
+    """Tests for load_flows"""
+
+    def _write(self, directory, text):
+        path = Path(directory) / 'flows.toml'
+        path.write_text(text, encoding='utf-8')
+        return path
+
+    def test_loads_flow_options(self):
+        """Should build flows with their codec, destination and filters"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = self._write(tmpdir, '''
+[[flows]]
+name = "prenfe-valencia"
+lines = "C*"
+match = { nucleo = ["40"] }
+codec = "gzip"
+destination = "prenfe-valencia"
+skip_empty = true
+''')
+            (flow,) = flows.load_flows(path)
+
+        assert flow.name == 'prenfe-valencia'
+        assert flow.codec == 'gzip'
+        assert flow.destination == 'prenfe-valencia'
+        assert flow.skip_empty is True
+        assert flow.accepts('c3', {'nucleo': 40})
+        assert not flow.accepts('C3', {'nucleo': '10'})
+
+    def test_example_registry_is_valid(self):
+        """Should load the shipped flows.example.toml"""
+        path = Path(__file__).resolve().parent.parent / 'flows.example.toml'
+        names = [flow.name for flow in flows.load_flows(path)]
+        assert names[:2] == ['general-prenfe', 'prenfe-cat']
+
+    @pytest.mark.parametrize('text', [
+        '',
+        '[[flows]]\nname = "x"\nfilter = "R1"\n',
+        '[[flows]]\nname = "x"\ncodec = "brotli"\n',
+        '[[flows]]\nname = "x"\nmatch = { nucleo = "10" }\n',
+        '[[flows]]\nname = "x"\nmatch = "nucleo"\n',
+        '[[flows]]\nname = "x"\n[[flows]]\nname = "x"\n',
+        '[[flows]\n',
+    ])
+    def test_rejects_invalid_registries(self, text):
+        """Should raise ValueError for empty, unknown, duplicate or malformed flows"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = self._write(tmpdir, text)
+            with pytest.raises(ValueError):
+                flows.load_flows(path)
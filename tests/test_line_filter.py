@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tests for compiled line-code filters
+"""
+
+import pytest
+
+import line_filter
+
+
+class TestCompileLineFilter:
+    """Tests for compile_line_filter and LineMatcher"""
+
+    def test_exact_codes_are_case_insensitive(self):
+        """Should match listed codes in any case and nothing else"""
+        matcher = line_filter.compile_line_filter('R1, RG1')
+        assert matcher('r1')
+        assert matcher('Rg1')
+        assert not matcher('R11')
+        assert not matcher('')
+
+    def test_prefixes(self):
+        """Should match every code starting with a prefix pattern"""
+        matcher = line_filter.compile_line_filter(['RL*', 'rt*'])
+        assert matcher('RL3')
+        assert matcher('rt2')
+        assert not matcher('R1')
+
+    def test_regexes(self):
+        """Should match codes against 're:' patterns"""
+        matcher = line_filter.compile_line_filter(r're:^R\d+[NS]?$,AVE')
+        assert matcher('R2N')
+        assert matcher('r16')
+        assert matcher('AVE')
+        assert not matcher('RG1')
+
+    def test_star_matches_everything(self):
+        """Should treat a bare '*' as match-all"""
+        matcher = line_filter.compile_line_filter('*')
+        assert matcher('')
+        assert matcher('ANYTHING')
+
+    def test_results_are_memoized(self):
+        """Should cache the result per line code"""
+        matcher = line_filter.compile_line_filter('R1')
+        matcher('r1')
+        matcher('AVE')
+        assert matcher._cache == {'r1': True, 'AVE': False}
+
+    def test_invalid_regex_raises_value_error(self):
+        """Should reject invalid regex patterns at compile time"""
+        with pytest.raises(ValueError):
+            line_filter.compile_line_filter('re:R(')
+
+    def test_parse_splits_pattern_kinds(self):
+        """Should classify each pattern and skip blanks"""
+        assert line_filter.parse_line_filter('R1, RL*, re:^C\\d+$, ,') == (
+            ['R1'], ['RL'], ['^C\\d+$']
+        )
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus metrics registry
+"""
+
+import pytest
+
+import metrics
+
+
+class TestMetrics:
+    """Tests for Counter, Gauge, Histogram and Registry.render"""
+
+    def test_renders_prometheus_text_format(self):
+        """Should render cumulative buckets, sums, counts and escaped labels"""
+        registry = metrics.Registry()
+        histogram = metrics.Histogram('test_seconds', "Stage duration", ('stage',),
+                                      buckets=(0.1, 1), registry=registry)
+        counter = metrics.Counter('test_total', "Things", ('kind',), registry=registry)
+        gauge = metrics.Gauge('test_last', "Last time", registry=registry)
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value, stage='fetch')
+        counter.inc(kind='a "quoted"\nvalue')
+        counter.inc(2, kind='a "quoted"\nvalue')
+        gauge.set(12.5)
+
+        assert registry.render().splitlines() == [
+            '# HELP test_seconds Stage duration',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{stage="fetch",le="0.1"} 1',
+            'test_seconds_bucket{stage="fetch",le="1.0"} 3',
+            'test_seconds_bucket{stage="fetch",le="+Inf"} 4',
+            'test_seconds_sum{stage="fetch"} 4.05',
+            'test_seconds_count{stage="fetch"} 4',
+            '# HELP test_total Things',
+            '# TYPE test_total counter',
+            'test_total{kind="a \\"quoted\\"\\nvalue"} 3',
+            '# HELP test_last Last time',
+            '# TYPE test_last gauge',
+            'test_last 12.5',
+        ]
+
+    def test_timer_and_label_checks(self):
+        """Should time a block even when it raises, and reject wrong labels"""
+        registry = metrics.Registry()
+        histogram = metrics.Histogram('test_seconds', "Stage duration", ('stage',),
+                                      registry=registry)
+        with pytest.raises(RuntimeError):
+            with histogram.timer(stage='upload'):
+                raise RuntimeError("boom")
+
+        assert histogram.count(stage='upload') == 1
+        with pytest.raises(ValueError):
+            histogram.observe(1, flow='x')
+        with pytest.raises(ValueError):
+            metrics.Counter('test_seconds', "Duplicate", registry=registry)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Tests for the pluggable upload backends
+"""
+
+import tempfile
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+from google.api_core.exceptions import NotFound
+
+import object_storage
+
+
+class TestBackends:
+    """Tests for LocalBackend, MemoryBackend and GcsBackend"""
+
+    @pytest.mark.parametrize('kind', ['local', 'memory'])
+    def test_offline_backends_round_trip(self, kind):
+        """Should store, list, read and replace objects"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            backend = object_storage.open_backend(kind, 'beta-tests', Path(tmpdir))
+            backend.upload('prenfe-data/b.json', b'[1]', 'application/json')
+            backend.upload('prenfe-data/a.json.gz', b'gz', 'application/json', 'gzip')
+            backend.upload('other/c.json', b'[]')
+            backend.upload('prenfe-data/b.json', b'[2]')
+
+            assert list(backend.list('prenfe-data/')) == \
+                ['prenfe-data/a.json.gz', 'prenfe-data/b.json']
+            assert backend.download('prenfe-data/b.json') == b'[2]'
+            assert backend.exists('other/c.json')
+            assert not backend.exists('missing.json')
+            with pytest.raises(FileNotFoundError):
+                backend.download('missing.json')
+            if kind == 'local':
+                assert (Path(tmpdir) / 'beta-tests' / 'other' / 'c.json').read_bytes() == b'[]'
+                with pytest.raises(ValueError):
+                    backend.upload('../escape.json', b'[]')
+
+    def test_gcs_backend_sets_encoding_and_maps_not_found(self):
+        """Should upload with Content-Encoding and raise FileNotFoundError for missing objects"""
+        client = MagicMock()
+        blob = client.bucket.return_value.blob.return_value
+        backend = object_storage.GcsBackend('beta-tests', client)
+
+        backend.upload('prenfe-data/x.json.gz', b'gz', 'application/json', 'gzip')
+        blob.download_as_bytes.side_effect = NotFound('no such object')
+
+        client.bucket.assert_called_once_with('beta-tests')
+        assert blob.content_encoding == 'gzip'
+        blob.upload_from_string.assert_called_once_with(b'gz', content_type='application/json')
+        with pytest.raises(FileNotFoundError):
+            backend.download('prenfe-data/x.json.gz')
+
+    def test_open_backend_creates_bucket_on_emulator(self, monkeypatch):
+        """Should create a missing bucket on STORAGE_EMULATOR_HOST and reject unknown kinds"""
+        monkeypatch.setenv('STORAGE_EMULATOR_HOST', 'http://localhost:4443')
+        with patch('object_storage.storage.Client') as client_class:
+            client = client_class.return_value
+            client.bucket.return_value.exists.return_value = False
+            backend = object_storage.open_backend('gcs', 'beta-tests')
+
+        assert str(backend) == 'gs://beta-tests'
+        client.create_bucket.assert_called_once_with('beta-tests')
+        with pytest.raises(ValueError):
+            object_storage.open_backend('s3', 'beta-tests')
+
+
+class FakeResumableSession:
+    """Transport of a resumable session: commits whole chunks, fails where told to"""
+
+    def __init__(self, fail_at=()):
+        self.data = bytearray()
+        self.fail_at = list(fail_at)  # chunk offsets to fail once
+        self.ranges = []
+
+    def put(self, url, data, headers):
+        content_range = headers['Content-Range']
+        self.ranges.append(content_range)
+        size = int(content_range.rsplit('/', 1)[1])
+        if content_range.startswith('bytes */'):
+            pass  # status query
+        else:
+            start = int(content_range.split()[1].split('-')[0])
+            if start in self.fail_at:
+                self.fail_at.remove(start)
+                # The session keeps half the chunk before the connection drops
+                self.data[start:] = data[:len(data) // 2]
+                raise requests.exceptions.ConnectionError("connection reset")
+            self.data[start:] = data
+        if len(self.data) == size:
+            return MagicMock(status_code=200, headers={})
+        return MagicMock(status_code=308, headers={'Range': f"bytes=0-{len(self.data) - 1}"}
+                         if self.data else {})
+
+
+class TestLargeUploads:
+    """Tests for GcsBackend resumable and composite uploads"""
+
+    def make_backend(self, session, **options):
+        client = MagicMock()
+        client._http = session
+        return object_storage.GcsBackend('beta-tests', client, **options), client
+
+    def test_resumable_upload_resumes_from_committed_offset(self, monkeypatch):
+        """Should resume a chunked upload where the session stopped instead of restarting"""
+        monkeypatch.setattr(object_storage, 'RESUME_BACKOFF_SECONDS', 0)
+        chunk = object_storage.CHUNK_ALIGNMENT
+        data = bytes(range(256)) * (chunk * 3 // 256 + 10)
+        session = FakeResumableSession(fail_at=[chunk])
+        backend, client = self.make_backend(session, chunk_size=chunk + 1)
+        blob = client.bucket.return_value.blob.return_value
+
+        backend.upload('prenfe-data/batch.json.gz', data, 'application/json', 'gzip')
+
+        assert bytes(session.data) == data
+        blob.upload_from_string.assert_not_called()
+        blob.create_resumable_upload_session.assert_called_once_with(
+            content_type='application/json', size=len(data))
+        assert session.ranges[2] == f"bytes */{len(data)}"
+        # Resumed after the half chunk the session committed, not from zero
+        assert session.ranges[3].startswith(f"bytes {chunk + chunk // 2}-")
+
+    def test_resumable_upload_gives_up(self, monkeypatch):
+        """Should raise after max_resumes transient failures and on permanent errors"""
+        monkeypatch.setattr(object_storage, 'RESUME_BACKOFF_SECONDS', 0)
+        data = b'x' * (object_storage.CHUNK_ALIGNMENT * 2)
+        session = MagicMock()
+        session.put.return_value = MagicMock(status_code=503, headers={})
+        backend, _ = self.make_backend(session, chunk_size=1, max_resumes=2)
+        with pytest.raises(RuntimeError, match='after 2 resumes'):
+            backend.upload('prenfe-data/batch.json', data)
+
+        session.put.return_value = MagicMock(status_code=403, headers={})
+        with pytest.raises(RuntimeError, match='HTTP 403'):
+            backend.upload('prenfe-data/batch.json', data)
+
+    def test_composite_upload_composes_parts_in_order(self):
+        """Should upload parts concurrently, compose them in order and delete them"""
+        client = MagicMock()
+        blobs = {}
+        client.bucket.return_value.blob.side_effect = \
+            lambda name: blobs.setdefault(name, MagicMock(name=name))
+        backend = object_storage.GcsBackend('beta-tests', client, composite_threshold=10,
+                                            parallel_uploads=4)
+
+        backend.upload('prenfe-data/day.json.gz', b'0123456789abcdef', 'application/json', 'gzip')
+
+        target = blobs.pop('prenfe-data/day.json.gz')
+        parts = sorted(blobs)
+        assert len(parts) == 4
+        uploaded = b''.join(blobs[name].upload_from_string.call_args.args[0] for name in parts)
+        assert uploaded == b'0123456789abcdef'
+        assert [blobs[name] for name in parts] == target.compose.call_args.args[0]
+        assert target.content_encoding == 'gzip'
+        for name in parts:
+            blobs[name].delete.assert_called_once_with()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the parallel snapshot reader
+"""
+
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+import serialization
+import snapshots
+import store
+
+pytest.importorskip('pyarrow')
+
+import reader  # noqa: E402
+
+
+def write_snapshots(directory):
+    """Three full snapshots in different codecs and shapes, plus a delta and a marker"""
+    files = {
+        'general-prenfe_20261017_080000.json': (
+            'json', {'fechaActualizacion': 'x', 'trenes': [{'codComercial': '1'},
+                                                            {'codComercial': '2'}]}),
+        'general-prenfe_20261017_080200.json.gz': ('gzip', [{'codComercial': '3'}]),
+        'general-prenfe_20261017_080400.delta.json': ('json', {'delta': True, 'added': {}}),
+        'general-prenfe_20261017_080400.unchanged.json': ('json', {'unchanged': True}),
+        'general-prenfe_20261017_080600.json': ('json', {'trenes': [{'codComercial': '4'}]}),
+    }
+    paths = []
+    for name, (codec, payload) in files.items():
+        path = directory / name
+        path.write_bytes(serialization.encode_snapshot(payload, codec))
+        paths.append(path)
+    return paths
+
+
+class TestReadSnapshots:
+    """Tests for read_snapshots"""
+
+    def test_reads_full_snapshots_in_order(self):
+        """Should return every train of the full snapshots with its cycle time"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = write_snapshots(Path(tmpdir))
+            table = reader.read_snapshots(paths, workers=1, chunk_size=2)
+
+            assert table.column('codComercial').to_pylist() == ['1', '2', '3', '4']
+            fetched = table.column('fetched_at').to_pylist()
+            expected = datetime(2026, 10, 17, 8, 2).astimezone(timezone.utc)
+            assert fetched[2] == expected
+
+    def test_process_pool_matches_inline(self):
+        """Should build the same table across worker processes"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = write_snapshots(Path(tmpdir))
+            inline = reader.read_snapshots(paths, workers=1, chunk_size=1)
+            pooled = reader.read_snapshots(paths, workers=2, chunk_size=1)
+
+            assert pooled.equals(inline)
+
+    def test_empty_input_and_unreadable_snapshots(self):
+        """Should return an empty table for no input and raise for broken files"""
+        assert reader.read_snapshots([], workers=1).num_rows == 0
+        with tempfile.TemporaryDirectory() as tmpdir:
+            broken = Path(tmpdir) / 'general-prenfe_20261017_080000.json'
+            broken.write_bytes(b'{broken')
+            with pytest.raises(ValueError):
+                reader.read_snapshots([broken], workers=1)
+
+    def test_reads_snapshots_from_the_local_store(self):
+        """Should read store snapshots by their per-cycle names"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = write_snapshots(Path(tmpdir))
+            directory = Path(tmpdir) / store.STORE_SUBDIR
+            writer = store.SnapshotStore(directory, 'general-prenfe', writable=True)
+            for path in paths:
+                parsed = snapshots.parse_snapshot_name(path.name)
+                writer.append(parsed['timestamp'], path.read_bytes(),
+                              serialization.codec_for_filename(path.name),
+                              store.snapshot_kind(parsed))
+
+            names = list(store.snapshot_names(directory))
+            table = reader.read_snapshots([directory / name for name in names], workers=1)
+
+            assert names == [path.name for path in paths]
+            assert table.equals(reader.read_snapshots(paths, workers=1))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for compact train records
+"""
+
+import json
+import sys
+
+import pytest
+
+import flows
+import records
+import serialization
+import snapshots
+
+TRAIN = {
+    'codComercial': '25001', 'codLinea': 'R1', 'nucleo': '50', 'latitud': 41.38,
+    'ultRetraso': '3', 'accesible': True, 'desEst': 'Estació',
+}
+
+
+class TestTrainRecord:
+    """Tests for TrainRecord"""
+
+    def test_round_trips_known_missing_and_extra_fields(self):
+        """Should keep every value, leave absent fields absent and keep unknown keys"""
+        record = records.TrainRecord.from_dict(TRAIN)
+
+        assert record.to_dict() == TRAIN
+        assert record.codLinea == 'R1'
+        assert record.extra == {'desEst': 'Estació'}
+        assert record.get('codEstAct') is None
+        assert 'codEstAct' not in record
+        assert record['desEst'] == 'Estació'
+        with pytest.raises(KeyError):
+            record['codEstAct']
+
+    def test_equality_and_interning(self):
+        """Should compare by value and share repeated strings"""
+        first = records.TrainRecord.from_dict(json.loads(json.dumps(TRAIN)))
+        second = records.TrainRecord.from_dict(json.loads(json.dumps(TRAIN)))
+
+        assert first == second
+        assert first == TRAIN
+        assert first.codLinea is second.codLinea
+        assert first != records.TrainRecord.from_dict({**TRAIN, 'ultRetraso': '4'})
+
+    def test_smaller_than_dict(self):
+        """Should take less memory than the dict it replaces"""
+        train = {name: None for name in records.FIELDS}
+        record = records.TrainRecord.from_dict(train)
+        assert sys.getsizeof(record) < sys.getsizeof(train) / 2
+
+
+class TestStagesAcceptRecords:
+    """Tests for processing stages fed with TrainRecords"""
+
+    def test_encode_fingerprint_and_flows_match_dicts(self):
+        """Should encode, hash and select records exactly like the dicts they came from"""
+        payload = {'fechaActualizacion': 'x', 'trenes': [TRAIN, {**TRAIN, 'codLinea': 'C1'}]}
+        parsed = records.parse_payload(payload)
+
+        assert all(isinstance(t, records.TrainRecord) for t in parsed['trenes'])
+        assert serialization.encode_snapshot(parsed, 'json-compact') == \
+            serialization.encode_snapshot(payload, 'json-compact')
+        assert snapshots.payload_fingerprint(parsed) == snapshots.payload_fingerprint(payload)
+
+        registry = flows.default_flows('R1')
+        from_records = flows.evaluate_flows(registry, parsed)
+        from_dicts = flows.evaluate_flows(registry, payload)
+        assert from_records['prenfe-cat']['analysis'] == from_dicts['prenfe-cat']['analysis']
+        assert from_records['prenfe-cat']['payload'] == from_dicts['prenfe-cat']['payload']
+
+    def test_delta_between_record_snapshots(self):
+        """Should compute deltas over records"""
+        previous = records.parse_trains([TRAIN])
+        current = records.parse_trains([{**TRAIN, 'ultRetraso': '5'}])
+        index, _ = snapshots.index_trains(previous)
+
+        delta, _ = snapshots.compute_delta(index, current, 'base.json')
+        assert delta['changed'] == {'25001': {**TRAIN, 'ultRetraso': '5'}}
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Tests for the snapshot replay/backfill tool
+"""
+
+import json
+import tarfile
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+import batching
+import flows
+import records
+import replay
+import serialization
+import snapshots
+import store
+
+START = datetime(2026, 10, 17, 8, 0)
+
+
+def fleet(minute):
+    """A payload whose R1 train changes line to R2 at minute 4"""
+    return {
+        'fechaActualizacion': f"2026-10-17T08:{minute:02d}:00",
+        'trenes': [
+            {'codComercial': '1', 'codLinea': 'R1' if minute < 4 else 'R2', 'ultRetraso': '0'},
+            {'codComercial': '2', 'codLinea': 'RL4', 'ultRetraso': str(minute)},
+            {'codComercial': '3', 'codLinea': 'C1', 'ultRetraso': '1'},
+        ],
+    }
+
+
+def write_history(directory, minutes, keyframe_every=3, codec='gzip'):
+    """Store cycles like the scraper in delta mode; returns the file names"""
+    extension = serialization.CODECS[codec]['extension']
+    names = []
+    state = None
+    for i, minute in enumerate(minutes):
+        timestamp = START + timedelta(minutes=minute)
+        payload = fleet(minute)
+        if i % keyframe_every == 0:
+            name = f"general-prenfe_{timestamp:%Y%m%d_%H%M%S}{extension}"
+            document = payload
+            index, _ = snapshots.index_trains(payload['trenes'])
+        else:
+            name = f"general-prenfe_{timestamp:%Y%m%d_%H%M%S}.delta{extension}"
+            document, index = snapshots.compute_delta(state, payload, names[-1])
+        state = index
+        (directory / name).write_bytes(serialization.encode_snapshot(document, codec))
+        names.append(name)
+    return names
+
+
+def read_summary(out_dir):
+    lines = (out_dir / replay.SUMMARY_FILE).read_bytes().splitlines()
+    return [json.loads(line) for line in lines]
+
+
+class TestReplay:
+    """Tests for replay.replay"""
+
+    def test_rederives_cat_history_from_keyframes_and_deltas(self):
+        """Should rebuild every cycle and apply the new line filter"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source, out = Path(tmpdir) / 'data', Path(tmpdir) / 'out'
+            source.mkdir()
+            write_history(source, [0, 2, 4, 6, 8])
+
+            stats = replay.replay(source, out, cat_filter='R2,RL*', workers=1, chunk_size=2)
+
+            assert stats == {'cycles': 5, 'snapshots': 5, 'orphans': 0, 'errors': []}
+            rows = read_summary(out)
+            assert [row['timestamp'][11:16] for row in rows] == \
+                ['08:00', '08:02', '08:04', '08:06', '08:08']
+            assert rows[0]['line_counts'] == {'RL4': 1}
+            assert rows[2]['line_counts'] == {'R2': 1, 'RL4': 1}
+            derived = json.loads((out / 'prenfe-cat_20261017_080600.json').read_bytes())
+            assert derived == [fleet(6)['trenes'][0], fleet(6)['trenes'][1]]
+
+    def test_process_pool_matches_inline_replay(self):
+        """Should produce the same summary with a process pool"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = Path(tmpdir) / 'data'
+            source.mkdir()
+            write_history(source, range(0, 40, 2), keyframe_every=4)
+
+            replay.replay(source, Path(tmpdir) / 'inline', cat_filter='R*', workers=1,
+                          chunk_size=4, with_metrics=False)
+            stats = replay.replay(source, Path(tmpdir) / 'pool', cat_filter='R*', workers=2,
+                                  chunk_size=4)
+
+            assert stats['cycles'] == 20
+            assert read_summary(Path(tmpdir) / 'pool') == read_summary(Path(tmpdir) / 'inline')
+
+    def test_reads_archives_and_batches_within_window(self):
+        """Should replay archived snapshots and batch objects, honoring since/until"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source, out = Path(tmpdir) / 'data', Path(tmpdir) / 'out'
+            archive_dir = source / 'archive'
+            archive_dir.mkdir(parents=True)
+            names = write_history(archive_dir, [0, 2, 4])
+            with tarfile.open(archive_dir / 'general-prenfe_20261017_08.tar.gz', 'w:gz') as tar:
+                for name in names:
+                    tar.add(archive_dir / name, arcname=name)
+                    (archive_dir / name).unlink()
+
+            writer = batching.BatchWriter(Path(tmpdir) / 'wal', 'hour', 'jsonl', 'gzip')
+            for minute in (10, 12):
+                writer.append('general-prenfe', START + timedelta(minutes=minute),
+                              {'payload': fleet(minute)})
+            writer.append('general-prenfe', START + timedelta(minutes=14),
+                          {'unchanged': True, 'same_as': 'x'})
+
+            def store(flow_name, object_name, encoded, content_type, content_encoding):
+                path = source / object_name
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(encoded)
+                return True
+
+            writer.flush(store)
+            stats = replay.replay(source, out, cat_filter='R*', workers=1,
+                                  since=START + timedelta(minutes=2),
+                                  until=START + timedelta(minutes=10))
+
+            assert stats['errors'] == []
+            assert [row['timestamp'][11:16] for row in read_summary(out)] == \
+                ['08:02', '08:04', '08:10']
+
+    def test_chains_hold_compact_train_records(self):
+        """Should rebuild keyframes and deltas as TrainRecords"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = Path(tmpdir)
+            write_history(source, [0, 2, 4])
+            replay.init_worker(replay.LocalSource(source), 'R*', None, tmpdir, 'json', [],
+                               None, None, False, tmpdir)
+            (kind, entries), = replay.catalogue(replay.LocalSource(source), 'general-prenfe')[0]
+
+            payloads = [payload for _, payload in replay.iter_cycles(kind, entries)]
+
+            assert all(isinstance(train, records.TrainRecord)
+                       for payload in payloads for train in payload['trenes'])
+            assert payloads[2] == fleet(4)
+
+    def test_downloads_each_archive_once(self):
+        """Should read an archive once, whether listing its members or replaying them"""
+        reads = []
+
+        class CountingSource(replay.LocalSource):
+            def read(self, name):
+                reads.append(name)
+                return super().read(name)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source, out = Path(tmpdir) / 'data', Path(tmpdir) / 'out'
+            archive_dir = source / 'archive'
+            archive_dir.mkdir(parents=True)
+            names = write_history(archive_dir, [0, 2, 4, 6], keyframe_every=2)
+            with tarfile.open(archive_dir / 'general-prenfe_20261017_08.tar.gz', 'w:gz') as tar:
+                for name in names:
+                    tar.add(archive_dir / name, arcname=name)
+                    (archive_dir / name).unlink()
+
+            with patch.object(replay, 'open_source', CountingSource):
+                stats = replay.replay(source, out, cat_filter='R*', workers=1, chunk_size=2)
+
+            assert stats['cycles'] == 4 and stats['errors'] == []
+            assert reads == ['archive/general-prenfe_20261017_08.tar.gz']
+
+    def test_broken_chain_and_orphans_are_reported(self):
+        """Should skip the rest of a chain whose delta does not apply"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source, out = Path(tmpdir) / 'data', Path(tmpdir) / 'out'
+            source.mkdir()
+            names = write_history(source, [0, 2, 4, 6], keyframe_every=2)
+            (source / names[0]).unlink()  # the first delta has no keyframe now
+            (source / names[3]).write_bytes(serialization.encode_snapshot(
+                {'delta': True, 'base': 'other.json'}, 'gzip'))
+
+            stats = replay.replay(source, out, cat_filter='R*', workers=1)
+
+            assert stats['orphans'] == 1
+            assert stats['cycles'] == 1
+            assert len(stats['errors']) == 1 and 'does not apply' in stats['errors'][0]
+
+    def test_reads_the_local_snapshot_store(self):
+        """Should replay snapshots appended to the store, rotated segments included, once"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source, out = Path(tmpdir) / 'data', Path(tmpdir) / 'out'
+            files = Path(tmpdir) / 'files'
+            files.mkdir()
+            # The keyframe at midnight rotates the first two cycles into a segment
+            names = write_history(files, [0, 2, 960, 962], keyframe_every=2)
+            writer = store.SnapshotStore(source / store.STORE_SUBDIR, 'general-prenfe',
+                                         writable=True, rotate_daily=True)
+            for name in names:
+                parsed = snapshots.parse_snapshot_name(name)
+                writer.append(parsed['timestamp'], (files / name).read_bytes(), 'gzip',
+                              store.snapshot_kind(parsed))
+            (source / names[0]).write_bytes((files / names[0]).read_bytes())  # also on disk
+
+            stats = replay.replay(source, out, cat_filter='R*', workers=1)
+
+            assert len(store.segments(source / store.STORE_SUBDIR, 'general-prenfe')) == 1
+            assert stats == {'cycles': 4, 'snapshots': 4, 'orphans': 0, 'errors': []}
+            assert [row['line_counts'] for row in read_summary(out)][2] == {'R2': 1, 'RL4': 1}
+
+    def test_defaults_to_the_scraper_line_filter(self):
+        """Should replay with its documented defaults, keeping the default regional lines"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source, out = Path(tmpdir) / 'data', Path(tmpdir) / 'out'
+            source.mkdir()
+            write_history(source, [0, 4])
+
+            stats = replay.replay(source, out, workers=1)
+
+            assert stats['cycles'] == 2 and stats['errors'] == []
+            assert [row['line_counts'] for row in read_summary(out)] == \
+                [{'R1': 1, 'RL4': 1}, {'R2': 1, 'RL4': 1}]
+            assert replay.build_registry()[1].lines == flows.DEFAULT_CAT_LINE_FILTER
+
+    def test_rejects_unknown_output_flows(self):
+        """Should raise ValueError before reading anything"""
+        with pytest.raises(ValueError):
+            replay.replay('does-not-exist', 'out', cat_filter='R*', only=['prenfe-madrid'])
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for retries with backoff and the circuit breaker
+"""
+
+import random
+
+import pytest
+
+import resilience
+
+
+class FakeClock:
+    """Monotonic clock advanced by the sleeps it is given"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestRetryPolicy:
+    """Tests for RetryPolicy"""
+
+    def make_policy(self, clock, **options):
+        return resilience.RetryPolicy(rng=random.Random(0), clock=clock, sleep=clock.sleep,
+                                      **options)
+
+    def test_retries_transient_errors_with_capped_jitter(self):
+        """Should retry until success, sleeping at most the capped exponential backoff"""
+        clock = FakeClock()
+        policy = self.make_policy(clock, max_attempts=5, base_delay=1, max_delay=2, deadline=60)
+        outcomes = [ConnectionError(), ConnectionError(), ConnectionError(), 'ok']
+        retries = []
+
+        def attempt(timeout):
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        result = policy.call(attempt, lambda e: True,
+                             lambda n, e, delay: retries.append(n))
+
+        assert result == 'ok'
+        assert retries == [1, 2, 3]
+        assert all(0 <= delay <= cap for cap, delay in zip([1, 2, 2], clock.sleeps))
+        assert len(set(clock.sleeps)) == 3  # jittered
+
+    def test_stops_on_permanent_errors_attempts_and_deadline(self):
+        """Should re-raise permanent errors at once and stop when attempts or time run out"""
+        clock = FakeClock()
+        calls = []
+
+        def failing(timeout):
+            calls.append(timeout)
+            clock.now += timeout
+            raise TimeoutError()
+
+        with pytest.raises(ValueError):
+            self.make_policy(clock).call(lambda t: int('x'), lambda e: False)
+        assert clock.sleeps == []
+
+        with pytest.raises(TimeoutError):
+            self.make_policy(clock, max_attempts=3, deadline=100, timeout=1).call(
+                failing, lambda e: True)
+        assert len(calls) == 3
+
+        # 10s attempts within a 15s deadline: no room for a third attempt
+        calls.clear()
+        with pytest.raises(TimeoutError):
+            self.make_policy(clock, max_attempts=10, base_delay=0.1, deadline=15,
+                             timeout=10).call(failing, lambda e: True)
+        assert calls[0] == 10
+        assert len(calls) == 2 and calls[1] <= 5
+
+
+class TestCircuitBreaker:
+    """Tests for CircuitBreaker"""
+
+    def test_opens_after_threshold_and_recovers_through_trial(self):
+        """Should fail fast once open and close again after a successful trial call"""
+        clock = FakeClock()
+        breaker = resilience.CircuitBreaker(failure_threshold=2, reset_timeout=60, clock=clock)
+
+        assert breaker.allow()
+        assert not breaker.record_failure()
+        breaker.record_success()
+        assert not breaker.record_failure()
+        assert breaker.record_failure()
+        assert breaker.state == breaker.OPEN
+        assert not breaker.allow()
+
+        clock.now += 30
+        assert breaker.retry_in() == 30
+        clock.now += 30
+        assert breaker.allow()
+        assert breaker.state == breaker.HALF_OPEN
+        assert not breaker.allow()  # one trial at a time
+        assert breaker.record_failure()  # failed trial reopens
+        assert not breaker.allow()
+
+        clock.now += 60
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == breaker.CLOSED and breaker.allow()
+
+    def test_zero_threshold_never_opens(self):
+        """Should keep calling through any number of failures when disabled"""
+        breaker = resilience.CircuitBreaker(failure_threshold=0)
+        for _ in range(10):
+            assert not breaker.record_failure()
+        assert breaker.allow()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for strict flota.json schema decoding
+"""
+
+import json
+
+import pytest
+
+import flows
+import records
+import schema
+import serialization
+import snapshots
+
+pytest.importorskip('msgspec')
+
+TRAIN = {
+    'codComercial': '25001', 'codProducto': 11, 'codLinea': 'R1', 'nucleo': '50',
+    'latitud': 41.38, 'longitud': 2.17, 'ultRetraso': '3', 'accesible': True,
+    'via': '4', 'nextVia': 5, 'time': 1792224000000, 'mat': '447-001',
+}
+
+
+def body(trains, **meta):
+    return json.dumps({'fechaActualizacion': '2026-10-17T08:00:00', **meta,
+                       'trenes': trains}).encode('utf-8')
+
+
+class TestDecodeFlota:
+    """Tests for decode_flota"""
+
+    def test_valid_fleet_decodes_to_structs(self):
+        """Should return Train structs and keep the top-level fields"""
+        payload, rejected, unknown = schema.decode_flota(
+            body([TRAIN, {'codComercial': 7}], extra=1))
+
+        assert rejected == [] and unknown == {}
+        assert list(payload) == ['fechaActualizacion', 'extra', 'trenes']
+        assert all(isinstance(t, schema.Train) for t in payload['trenes'])
+        assert payload['trenes'] == [TRAIN, {'codComercial': 7}]
+
+    def test_rejects_invalid_trains_individually(self):
+        """Should drop only the malformed trains, with one message each"""
+        trains = [TRAIN, {**TRAIN, 'latitud': '41,38'}, 'not a train', {'codLinea': 'R2'},
+                  {**TRAIN, 'codComercial': '25002'}]
+        payload, rejected, _ = schema.decode_flota(body(trains))
+
+        assert [t.codComercial for t in payload['trenes']] == ['25001', '25002']
+        assert len(rejected) == 3
+        assert rejected[0].startswith('trenes[1]: ') and '$.latitud' in rejected[0]
+        assert 'codComercial' in rejected[2]
+
+    def test_bare_trains_array(self):
+        """Should accept a trains list as the payload"""
+        payload, rejected, _ = schema.decode_flota(b' [{"codComercial": "1"}, null]')
+        assert payload == [{'codComercial': '1'}]
+        assert len(rejected) == 1
+
+    def test_rejects_non_string_line_codes(self):
+        """Should reject a numeric codLinea instead of failing the line filters later"""
+        payload, rejected, _ = schema.decode_flota(body([TRAIN, {**TRAIN, 'codLinea': 5}]))
+
+        assert len(payload['trenes']) == 1
+        assert len(rejected) == 1 and '$.codLinea' in rejected[0]
+        assert flows.evaluate_flows(flows.default_flows('R*'), payload)['prenfe-cat'][
+            'analysis']['total_trains'] == 1
+
+    def test_keeps_and_reports_unknown_fields(self):
+        """Should keep fields outside the schema and count them as drift"""
+        trains = [TRAIN, {**TRAIN, 'nuevoCampo': {'a': 1}},
+                  {**TRAIN, 'nuevoCampo': 2, 'latitud': 'x'}]
+        payload, rejected, unknown = schema.decode_flota(body(trains))
+
+        assert payload['trenes'][1] == {**TRAIN, 'nuevoCampo': {'a': 1}}
+        assert payload['trenes'][1]['nuevoCampo'] == {'a': 1}
+        assert len(rejected) == 1 and '$.latitud' in rejected[0]
+        assert unknown == {'nuevoCampo': 1}
+
+    def test_unusable_documents_raise_value_error(self):
+        """Should raise ValueError for invalid JSON and payloads without trains"""
+        for data in (b'{invalid', b'{"trenes": 5}', b'{"fechaActualizacion": "x"}'):
+            with pytest.raises(ValueError):
+                schema.decode_flota(data)
+
+
+class TestTrainStruct:
+    """Tests for Train structs in the processing stages"""
+
+    def test_dict_protocol_omits_absent_fields(self):
+        """Should behave like the dict it was decoded from"""
+        (train,), _, _ = schema.decode_flota(b'[{"codComercial": "1", "codLinea": null}]')
+
+        assert train.to_dict() == {'codComercial': '1', 'codLinea': None}
+        assert 'codLinea' in train and 'via' not in train
+        assert train.get('via', 'x') == 'x'
+        with pytest.raises(KeyError):
+            train['via']
+        assert train == records.TrainRecord.from_dict(train.to_dict())
+
+    def test_stages_match_dicts(self):
+        """Should encode, hash and select structs exactly like dicts"""
+        trains = [TRAIN, {**TRAIN, 'codComercial': '25002', 'codLinea': 'C1'}]
+        decoded, _, _ = schema.decode_flota(body(trains))
+        plain = json.loads(body(trains))
+
+        for backend in serialization.JSON_BACKENDS:
+            serialization.set_json_backend(backend)
+            assert serialization.dumps(decoded, pretty=True) == \
+                serialization.dumps(plain, pretty=True)
+        serialization.set_json_backend()
+        assert snapshots.payload_fingerprint(decoded) == snapshots.payload_fingerprint(plain)
+
+        registry = flows.default_flows('R1')
+        assert flows.evaluate_flows(registry, decoded)['prenfe-cat']['payload'] == \
+            flows.evaluate_flows(registry, plain)['prenfe-cat']['payload']
@@ -13,9 +13,23 @@ from unittest.mock import Mock, patch, MagicMock
 import sys
 import requests
 import os
+import threading
+import time
 
 # Import scraper functions
 import scraper
+import object_storage
+import resilience
+import serialization
+import store
+
+
+@pytest.fixture(autouse=True)
+def reset_cycle_state():
+    """Start every test without dedup/delta state from earlier cycles"""
+    with patch.object(scraper, '_dedup_state', None), \
+            patch.object(scraper, '_delta_state', {}):
+        yield
 
 
 class TestFilterCatTrains:
@@ -68,6 +82,33 @@ class TestFilterCatTrains:
         assert len(result) == 3
 
 
+class TestCatLineFilter:
+    """Tests for the configurable CAT line filter"""
+
+    def test_configured_filter_applies_to_filter_and_partition(self):
+        """Should apply the CAT filter in both filter_cat_trains and partition_flota_data"""
+        import flows
+        import line_filter
+
+        data = [{'codLinea': 'R1'}, {'codLinea': 'R50'}, {'codLinea': 'C5'}, {'codLinea': 'rl9'}]
+        spec = r'RL*,re:^R\d{2}$'
+
+        with patch.object(scraper, 'cat_line_matcher', line_filter.compile_line_filter(spec)), \
+                patch.object(scraper, 'flow_registry', flows.default_flows(spec)):
+            filtered = scraper.filter_cat_trains(data)
+            flows = scraper.partition_flota_data(data)
+
+        assert filtered == [{'codLinea': 'R50'}, {'codLinea': 'rl9'}]
+        assert flows['prenfe-cat']['payload'] == filtered
+        assert flows['prenfe-cat']['analysis']['line_counts'] == {'R50': 1, 'RL9': 1}
+
+    def test_default_filter_keeps_documented_regional_lines(self):
+        """Should keep the documented R*/RG1/RL*/RT* lines by default"""
+        data = [{'codLinea': code} for code in ('R2N', 'RG1', 'RL4', 'RT1', 'R5', 'C1')]
+        result = scraper.filter_cat_trains(data)
+        assert [item['codLinea'] for item in result] == ['R2N', 'RG1', 'RL4', 'RT1']
+
+
 class TestAnalyzeFiotaData:
     """Tests for analyze_flota_data function"""
 
@@ -114,6 +155,77 @@ class TestAnalyzeFiotaData:
         assert result['rg1_trains'] == 1
 
 
+class TestPartitionFlotaData:
+    """Tests for partition_flota_data function"""
+
+    def test_partition_splits_flows_in_one_pass(self):
+        """Should keep the full payload for general and only regional trains for CAT"""
+        data = {
+            'trenes': [
+                {'codLinea': 'R2N', 'codComercial': '1'},
+                {'codLinea': 'c1', 'codComercial': '2'},
+                {'codLinea': 'rg1', 'codComercial': '3'},
+                {'codLinea': 'AVE', 'codComercial': '4'},
+            ]
+        }
+        flows = scraper.partition_flota_data(data)
+
+        assert flows['general-prenfe']['payload'] is data
+        assert flows['general-prenfe']['analysis'] == {
+            'total_trains': 4,
+            'line_counts': {'R2N': 1, 'C1': 1, 'RG1': 1, 'AVE': 1},
+        }
+        assert [t['codComercial'] for t in flows['prenfe-cat']['payload']] == ['1', '3']
+        assert flows['prenfe-cat']['analysis'] == {
+            'total_trains': 2,
+            'line_counts': {'R2N': 1, 'RG1': 1},
+        }
+
+    def test_partition_matches_filter_and_analyze(self):
+        """Should agree with filter_cat_trains and analyze_flota_data"""
+        data = [
+            {'codLinea': 'R1'}, {'codLinea': 'R1'}, {'codLinea': 'RT2'},
+            {'nombre': 'no line'}, 'not a dict', {'codLinea': 'MD'},
+        ]
+        flows = scraper.partition_flota_data(data)
+
+        assert flows['general-prenfe']['analysis'] == scraper.analyze_flota_data(data)
+        cat_trains = scraper.filter_cat_trains(data)
+        assert flows['prenfe-cat']['payload'] == cat_trains
+        assert flows['prenfe-cat']['analysis'] == scraper.analyze_flota_data(cat_trains)
+
+    def test_fleet_analytics_adds_metrics_per_flow(self):
+        """Should add each flow's metrics and log them with FLEET_ANALYTICS"""
+        pytest.importorskip('numpy')
+        data = [
+            {'codLinea': 'R1', 'ultRetraso': '2', 'codEstAct': '71801'},
+            {'codLinea': 'C1', 'ultRetraso': '8', 'codEstAct': '71801'},
+        ]
+        with patch.object(scraper, 'FLEET_ANALYTICS', True):
+            results = scraper.partition_flota_data(data)
+
+        assert results['general-prenfe']['metrics']['delay']['mean'] == 5.0
+        assert results['prenfe-cat']['metrics']['line_delays'] == \
+            {'R1': {'count': 1, 'mean': 2.0, 'p50': 2.0, 'p95': 2.0}}
+
+        flow = scraper.get_flow('prenfe-cat')
+        with patch('scraper.store_flow_snapshot'), \
+                patch.object(scraper.cat_logger, 'info') as mock_info:
+            scraper.process_flow(flow, results['prenfe-cat'])
+        mock_info.assert_called_with(
+            "Delay (min): mean 2.0 | p50 2 | p95 2 | Busiest stations: 71801:1"
+        )
+
+    def test_encode_payload_round_trips(self):
+        """Should encode to UTF-8 JSON bytes without escaping accents"""
+        payload = [{'codLinea': 'R1', 'desEst': 'Estació'}]
+        encoded = scraper.encode_payload(payload)
+
+        assert isinstance(encoded, bytes)
+        assert 'Estació'.encode('utf-8') in encoded
+        assert json.loads(encoded) == payload
+
+
 class TestProcessGeneralFlow:
     """Tests for process_general_flow function"""
 
@@ -189,6 +301,273 @@ class TestProcessCatFlow:
                 assert len(files) == 0
 
 
+class TestStoreSnapshot:
+    """Tests for store_snapshot and upload_to_cloud_storage"""
+
+    def test_uploads_from_memory_without_local_copy(self):
+        """Should upload the encoded bytes and skip the local write"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+            client = MagicMock()
+            blob = client.bucket.return_value.blob.return_value
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'GCS_ENABLED', True), \
+                    patch.object(scraper, 'gcs_client', client), \
+                    patch.object(scraper, 'KEEP_LOCAL_COPY', False):
+                scraper.store_snapshot(b'[1]', 'general-prenfe_x.json', 'general-prenfe',
+                                       scraper.general_logger)
+
+            blob.upload_from_string.assert_called_once_with(b'[1]', content_type='application/json')
+            client.bucket.return_value.blob.assert_called_once_with(
+                f"{scraper.GCS_FOLDER_NAME}/general-prenfe_x.json"
+            )
+            assert list(output_dir.iterdir()) == []
+
+    def test_keeps_local_copy_when_configured(self):
+        """Should also write the snapshot locally when KEEP_LOCAL_COPY is set"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'GCS_ENABLED', True), \
+                    patch.object(scraper, 'gcs_client', MagicMock()), \
+                    patch.object(scraper, 'KEEP_LOCAL_COPY', True):
+                scraper.store_snapshot(b'[1]', 'prenfe-cat_x.json', 'prenfe-cat',
+                                       scraper.cat_logger)
+
+            assert (output_dir / 'prenfe-cat_x.json').read_bytes() == b'[1]'
+
+    def test_falls_back_to_local_copy_on_upload_failure(self):
+        """Should write the snapshot locally when the upload fails"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+            client = MagicMock()
+            client.bucket.return_value.blob.return_value.upload_from_string.side_effect = \
+                Exception("503 Service Unavailable")
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'GCS_ENABLED', True), \
+                    patch.object(scraper, 'gcs_client', client), \
+                    patch.object(scraper, 'KEEP_LOCAL_COPY', False):
+                scraper.store_snapshot(b'[1]', 'general-prenfe_x.json', 'general-prenfe',
+                                       scraper.general_logger)
+
+            assert (output_dir / 'general-prenfe_x.json').read_bytes() == b'[1]'
+
+    def test_offline_storage_backend_runs_full_cycle(self):
+        """Should upload every flow and the dedup state to STORAGE_BACKEND=memory"""
+        backend = object_storage.MemoryBackend()
+        data = {'trenes': [{'codComercial': '1', 'codLinea': 'R1'},
+                           {'codComercial': '2', 'codLinea': 'C1'}]}
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                patch.object(scraper, 'OUTPUT_DIR', Path(tmpdir)), \
+                patch.object(scraper, 'GCS_ENABLED', True), \
+                patch.object(scraper, 'storage_backend', backend), \
+                patch.object(scraper, 'KEEP_LOCAL_COPY', False), \
+                patch.object(scraper, 'DEDUP_ENABLED', True), \
+                patch.object(scraper, 'DEDUP_PERSIST', True), \
+                patch.object(scraper, 'schedule_output_maintenance'):
+            scraper.save_flota_data(data)
+            assert list(Path(tmpdir).iterdir()) == []
+
+        folder = scraper.GCS_FOLDER_NAME
+        state, general, cat = backend.list(f"{folder}/")
+        assert state == f"{folder}/{scraper.DEDUP_STATE_NAME}"
+        assert general.startswith(f"{folder}/general-prenfe_")
+        assert cat.startswith(f"{folder}/prenfe-cat_")
+        assert json.loads(backend.download(cat)) == [data['trenes'][0]]
+
+    def test_appends_local_copies_to_store(self):
+        """Should append snapshots to the flow's store instead of writing files"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'GCS_ENABLED', False), \
+                    patch.object(scraper, 'LOCAL_STORE', True):
+                for name in ('general-prenfe_20261017_080000.json',
+                             'general-prenfe_20261017_080200.unchanged.json'):
+                    scraper.store_snapshot(b'[1]', name, 'general-prenfe',
+                                           scraper.general_logger, codec='json')
+
+            assert [path.name for path in output_dir.iterdir()] == [scraper.STORE_SUBDIR]
+            local_store = store.SnapshotStore(output_dir / scraper.STORE_SUBDIR, 'general-prenfe')
+            assert len(local_store) == 2
+            assert local_store.name(1) == 'general-prenfe_20261017_080200.unchanged.json'
+            assert bytes(local_store.read(0)) == b'[1]'
+
+
+class TestSaveFlotaData:
+    """Tests for the concurrent save pipeline"""
+
+    def test_flows_run_concurrently(self):
+        """Should process both flows at the same time"""
+        import threading
+
+        barrier = threading.Barrier(2, timeout=5)
+
+        def flow(definition, result):
+            barrier.wait()  # only passes when both flows are in flight together
+
+        with patch.object(scraper, 'PIPELINE_CONCURRENCY', 2), \
+                patch.object(scraper, 'process_flow', side_effect=flow) as process, \
+                patch.object(scraper, 'schedule_output_maintenance'):
+            scraper.save_flota_data([{'codLinea': 'R1'}])
+
+        names = sorted(call.args[0].name for call in process.call_args_list)
+        assert names == ['general-prenfe', 'prenfe-cat']
+
+    def test_flow_error_propagates_after_both_flows_finish(self):
+        """Should still run the other flow and then re-raise the error"""
+        processed = []
+
+        def flow(definition, result):
+            processed.append(definition.name)
+            if definition.name == 'general-prenfe':
+                raise IOError("disk full")
+
+        with patch.object(scraper, 'PIPELINE_CONCURRENCY', 2), \
+                patch.object(scraper, 'process_flow', side_effect=flow), \
+                patch.object(scraper, 'schedule_output_maintenance'):
+            with pytest.raises(IOError):
+                scraper.save_flota_data([{'codLinea': 'R1'}])
+
+        assert sorted(processed) == ['general-prenfe', 'prenfe-cat']
+
+    def test_log_cleanup_runs_off_the_request_path(self):
+        """Should return before background log cleanup completes"""
+        import threading
+
+        release = threading.Event()
+        with patch.object(scraper, 'process_flow'), \
+                patch.object(scraper, '_last_maintenance', None), \
+                patch.object(scraper, 'enforce_output_retention'), \
+                patch.object(scraper, 'cleanup_old_logs', side_effect=release.wait) as cleanup:
+            scraper.save_flota_data([{'codLinea': 'R1'}])
+            assert not release.is_set()
+            release.set()
+
+            deadline = time.monotonic() + 5
+            while not cleanup.called and time.monotonic() < deadline:
+                time.sleep(0.01)
+            cleanup.assert_called_once()
+
+
+class TestFlowRegistry:
+    """Tests for configured flows in the save pipeline"""
+
+    def test_custom_flows_use_their_codec_and_destination(self):
+        """Should store every registered flow, each with its own codec and GCS folder"""
+        import flows
+
+        registry = [
+            flows.Flow('general-prenfe', envelope=True),
+            flows.Flow('prenfe-madrid', lines='C*', match={'nucleo': ['10']},
+                       fields=['codComercial'], codec='gzip', destination='madrid',
+                       skip_empty=True),
+            flows.Flow('prenfe-ave', lines='AVE', skip_empty=True),
+        ]
+        data = {'trenes': [
+            {'codComercial': '1', 'codLinea': 'C5', 'nucleo': '10'},
+            {'codComercial': '2', 'codLinea': 'C5', 'nucleo': '40'},
+        ]}
+        client = MagicMock()
+        bodies = {}
+
+        def blob(name):
+            uploaded = MagicMock()
+            uploaded.upload_from_string.side_effect = \
+                lambda body, content_type: bodies.__setitem__(name, body)
+            return uploaded
+
+        client.bucket.return_value.blob.side_effect = blob
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                patch.object(scraper, 'flow_registry', registry), \
+                patch.object(scraper, 'LOGS_DIR', Path(tmpdir)), \
+                patch.object(scraper, 'flow_loggers', dict(scraper.flow_loggers)), \
+                patch.object(scraper, 'OUTPUT_CODEC', 'json'), \
+                patch.object(scraper, 'GCS_ENABLED', True), \
+                patch.object(scraper, 'gcs_client', client), \
+                patch.object(scraper, 'KEEP_LOCAL_COPY', False), \
+                patch.object(scraper, 'schedule_output_maintenance'):
+            scraper.save_flota_data(data)
+
+        general = [name for name in bodies if name.startswith(f"{scraper.GCS_FOLDER_NAME}/")]
+        madrid = [name for name in bodies if name.startswith('madrid/prenfe-madrid_')]
+        assert len(general) == 1 and general[0].endswith('.json')
+        assert len(madrid) == 1 and madrid[0].endswith('.json.gz')
+        assert serialization.decode_snapshot(bodies[madrid[0]], 'gzip') == [{'codComercial': '1'}]
+        assert len(bodies) == 2  # prenfe-ave matched nothing
+
+
+    def test_general_flow_emits_columnar_snapshot(self):
+        """Should store a Parquet file with the fetch time next to the JSON snapshot"""
+        pytest.importorskip('pyarrow')
+        import columnar
+        import flows
+
+        data = {'trenes': [{'codComercial': '1', 'codLinea': 'R1', 'ultRetraso': '2'}]}
+        registry = flows.default_flows('R1', general_columnar='parquet')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+            with patch.object(scraper, 'flow_registry', registry), \
+                    patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'GCS_ENABLED', False), \
+                    patch('scraper.datetime') as mock_datetime:
+                mock_datetime.now.return_value = datetime(2026, 10, 17, 8, 0)
+                scraper.process_general_flow(data)
+
+            assert sorted(p.name for p in output_dir.iterdir()) == [
+                'general-prenfe_20261017_080000.json',
+                'general-prenfe_20261017_080000.parquet',
+            ]
+            table = columnar.decode_table(
+                (output_dir / 'general-prenfe_20261017_080000.parquet').read_bytes()
+            )
+
+        assert table.column('ultRetraso').to_pylist() == [2]
+        fetched_at = table.column('fetched_at').to_pylist()[0]
+        assert fetched_at == datetime(2026, 10, 17, 8, 0).astimezone()
+
+
+class TestBatchMode:
+    """Tests for batching cycles through the write-ahead log"""
+
+    def test_cycles_are_buffered_then_flushed_per_partition(self):
+        """Should store no per-cycle objects and one partitioned batch after the hour"""
+        import batching
+
+        payload = [{'codLinea': 'R1', 'codComercial': '1'}]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+            writer = batching.BatchWriter(output_dir / '_wal', 'hour', 'jsonl', 'gzip')
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'batch_writer', writer), \
+                    patch.object(scraper, 'GCS_ENABLED', False), \
+                    patch.object(scraper, 'DEDUP_ENABLED', True), \
+                    patch('scraper.datetime') as mock_datetime:
+                for minute in (0, 2):
+                    mock_datetime.now.return_value = datetime(2026, 10, 17, 8, minute)
+                    scraper.process_cat_flow(payload)
+                assert not list(output_dir.glob('prenfe-cat_*'))
+
+                mock_datetime.now.return_value = datetime(2026, 10, 17, 9, 0)
+                assert scraper.flush_batches() == 1
+
+            batch = output_dir / 'flow=prenfe-cat' / 'date=2026-10-17' / 'hour=08' / \
+                'part-20261017T080000.jsonl.gz'
+            records = [json.loads(line) for line in
+                       serialization.decompress(batch.read_bytes(), 'gzip').splitlines()]
+            assert records[0]['payload'] == payload
+            assert records[1]['unchanged'] is True
+            assert records[1]['same_as'] == 'prenfe-cat_20261017_080000'
+            assert writer.pending() == []
+
+
 class TestCleanupOldLogs:
     """Tests for cleanup_old_logs function"""
 
@@ -215,13 +594,341 @@ class TestCleanupOldLogs:
                 assert new_file.exists()
 
 
+class TestOutputCodec:
+    """Tests for the configurable snapshot codec"""
+
+    def test_gzip_codec_sets_extension_and_content_encoding(self):
+        """Should name gzip snapshots .json.gz and upload them with Content-Encoding gzip"""
+        client = MagicMock()
+        blob = client.bucket.return_value.blob.return_value
+
+        with patch.object(scraper, 'OUTPUT_CODEC', 'gzip'), \
+                patch.object(scraper, 'GCS_ENABLED', True), \
+                patch.object(scraper, 'gcs_client', client), \
+                patch.object(scraper, 'KEEP_LOCAL_COPY', False):
+            scraper.process_cat_flow([{'codLinea': 'R1'}, {'codLinea': 'AVE'}])
+
+        blob_name = client.bucket.return_value.blob.call_args[0][0]
+        assert blob_name.startswith(f"{scraper.GCS_FOLDER_NAME}/prenfe-cat_")
+        assert blob_name.endswith('.json.gz')
+        assert blob.content_encoding == 'gzip'
+        body = blob.upload_from_string.call_args[0][0]
+        assert serialization.decode_snapshot(body, 'gzip') == [{'codLinea': 'R1'}]
+
+    def test_default_codec_uploads_without_content_encoding(self):
+        """Should keep plain JSON snapshots unencoded"""
+        client = MagicMock()
+        blob = client.bucket.return_value.blob.return_value
+
+        with patch.object(scraper, 'OUTPUT_CODEC', 'json'), \
+                patch.object(scraper, 'GCS_ENABLED', True), \
+                patch.object(scraper, 'gcs_client', client):
+            scraper.upload_to_cloud_storage(b'[]', 'general-prenfe_x.json', 'general-prenfe')
+
+        assert blob.content_encoding is None
+
+    def test_zstd_codec_uploads_as_zstd_content_type(self):
+        """Should upload zstd snapshots as application/zstd, without a Content-Encoding"""
+        pytest.importorskip('zstandard')
+        client = MagicMock()
+        blob = client.bucket.return_value.blob.return_value
+
+        with patch.object(scraper, 'OUTPUT_CODEC', 'zstd'), \
+                patch.object(scraper, 'GCS_ENABLED', True), \
+                patch.object(scraper, 'gcs_client', client), \
+                patch.object(scraper, 'KEEP_LOCAL_COPY', False):
+            scraper.process_cat_flow([{'codLinea': 'R1'}])
+
+        assert client.bucket.return_value.blob.call_args[0][0].endswith('.json.zst')
+        assert blob.content_encoding is None
+        assert blob.upload_from_string.call_args[1]['content_type'] == 'application/zstd'
+
+
+class TestDeltaMode:
+    """Tests for delta snapshots in the flows"""
+
+    def test_stores_keyframe_then_deltas(self):
+        """Should store a full keyframe, then deltas, then a new keyframe"""
+        import snapshots
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+            cycles = [
+                [{'codLinea': 'R1', 'codComercial': '1', 'v': i},
+                 {'codLinea': 'R2', 'codComercial': '2'}]
+                for i in range(4)
+            ]
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'GCS_ENABLED', False), \
+                    patch.object(scraper, 'SNAPSHOT_MODE', 'delta'), \
+                    patch.object(scraper, 'DELTA_KEYFRAME_INTERVAL', 3), \
+                    patch.object(scraper, '_delta_state', {}), \
+                    patch('scraper.datetime') as mock_datetime:
+                for minute, payload in enumerate(cycles):
+                    mock_datetime.now.return_value = datetime(2026, 10, 17, 8, minute)
+                    scraper.process_cat_flow(payload)
+
+            names = sorted(p.name for p in output_dir.iterdir())
+            assert names == [
+                'prenfe-cat_20261017_080000.json',
+                'prenfe-cat_20261017_080100.delta.json',
+                'prenfe-cat_20261017_080200.delta.json',
+                'prenfe-cat_20261017_080300.json',
+            ]
+            at = datetime(2026, 10, 17, 8, 2)
+            payload, _ = snapshots.reconstruct(output_dir, 'prenfe-cat', at)
+            assert payload == cycles[2]
+
+
+class TestDeduplication:
+    """Tests for skipping unchanged payloads"""
+
+    def test_unchanged_payload_stores_marker_only(self):
+        """Should store a marker instead of a second identical snapshot"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+            first = [
+                {'codLinea': 'R1', 'codComercial': '1'},
+                {'codLinea': 'R2', 'codComercial': '2'},
+            ]
+            reordered = list(reversed(first))
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'GCS_ENABLED', False), \
+                    patch.object(scraper, 'DEDUP_ENABLED', True), \
+                    patch('scraper.datetime') as mock_datetime:
+                mock_datetime.now.return_value = datetime(2026, 10, 17, 8, 0)
+                scraper.process_cat_flow(first)
+                mock_datetime.now.return_value = datetime(2026, 10, 17, 8, 2)
+                scraper.process_cat_flow(reordered)
+
+            assert sorted(p.name for p in output_dir.iterdir()) == [
+                'prenfe-cat_20261017_080000.json',
+                'prenfe-cat_20261017_080200.unchanged.json',
+            ]
+            marker_path = output_dir / 'prenfe-cat_20261017_080200.unchanged.json'
+            marker = json.loads(marker_path.read_bytes())
+            assert marker['unchanged'] is True
+            assert marker['timestamp'] == '2026-10-17T08:02:00'
+            assert marker['same_as'] == 'prenfe-cat_20261017_080000.json'
+
+    def test_persisted_state_survives_restart(self):
+        """Should reload the last hash from disk after the in-memory state is lost"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+            payload = [{'codLinea': 'R1', 'codComercial': '1'}]
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'GCS_ENABLED', False), \
+                    patch.object(scraper, 'DEDUP_ENABLED', True), \
+                    patch.object(scraper, 'DEDUP_PERSIST', True), \
+                    patch('scraper.datetime') as mock_datetime:
+                mock_datetime.now.return_value = datetime(2026, 10, 17, 8, 0)
+                scraper.process_cat_flow(payload)
+
+                scraper._dedup_state = None  # simulate an instance restart
+                mock_datetime.now.return_value = datetime(2026, 10, 17, 8, 2)
+                scraper.process_cat_flow(payload)
+
+            assert (output_dir / 'prenfe-cat_20261017_080200.unchanged.json').exists()
+            assert not (output_dir / 'prenfe-cat_20261017_080200.json').exists()
+
+
+class TestOutputRetention:
+    """Tests for snapshot compaction and eviction in OUTPUT_DIR"""
+
+    @staticmethod
+    def _snapshot(directory, name, age_hours, size=10):
+        path = directory / name
+        path.write_bytes(b'x' * size)
+        mtime = (datetime.now() - timedelta(hours=age_hours)).timestamp()
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_evicts_snapshots_older_than_retention(self):
+        """Should delete old snapshots and leave recent and unrelated files"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+            old = self._snapshot(output_dir, 'general-prenfe_20260101_080000.json', 48)
+            recent = self._snapshot(output_dir, 'general-prenfe_20260103_080000.json', 1)
+            other = self._snapshot(output_dir, 'notes.txt', 48)
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'OUTPUT_RETENTION_SECONDS', 24 * 3600), \
+                    patch.object(scraper, 'ARCHIVE_AFTER_SECONDS', 0):
+                result = scraper.enforce_output_retention()
+
+            assert result == {'archived': 0, 'deleted': 1}
+            assert not old.exists()
+            assert recent.exists()
+            assert other.exists()
+
+    def test_evicts_oldest_first_when_over_size_limit(self):
+        """Should delete the oldest snapshots until the directory fits the size limit"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+            oldest = self._snapshot(output_dir, 'prenfe-cat_20260101_080000.json', 3, size=100)
+            middle = self._snapshot(output_dir, 'prenfe-cat_20260101_090000.json', 2, size=100)
+            newest = self._snapshot(output_dir, 'prenfe-cat_20260101_100000.json', 1, size=100)
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'OUTPUT_MAX_BYTES', 250), \
+                    patch.object(scraper, 'ARCHIVE_AFTER_SECONDS', 0):
+                scraper.enforce_output_retention()
+
+            assert not oldest.exists()
+            assert middle.exists()
+            assert newest.exists()
+
+    def test_evicts_rotated_store_segments_but_not_the_current_store(self):
+        """Should delete old local store segments as a pair and keep the files in use"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+            store_dir = output_dir / scraper.STORE_SUBDIR
+            store_dir.mkdir()
+            old = [self._snapshot(store_dir, f"general-prenfe.20260101050000{ext}", 48)
+                   for ext in ('.dat', '.idx')]
+            recent = self._snapshot(store_dir, 'general-prenfe.20260102050000.dat', 1)
+            current = [self._snapshot(store_dir, f"general-prenfe{ext}", 48)
+                       for ext in ('.dat', '.idx')]
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'OUTPUT_RETENTION_SECONDS', 24 * 3600), \
+                    patch.object(scraper, 'ARCHIVE_AFTER_SECONDS', 0):
+                result = scraper.enforce_output_retention()
+
+            assert result == {'archived': 0, 'deleted': 2}
+            assert not any(path.exists() for path in old)
+            assert recent.exists()
+            assert all(path.exists() for path in current)
+
+    def test_evicts_old_local_batches(self):
+        """Should delete old batch objects and their emptied partition directories"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+            old_dir = output_dir / 'flow=prenfe-cat' / 'date=2026-01-01' / 'hour=08'
+            new_dir = output_dir / 'flow=prenfe-cat' / 'date=2026-01-03' / 'hour=08'
+            old_dir.mkdir(parents=True)
+            new_dir.mkdir(parents=True)
+            old = self._snapshot(old_dir, 'part-20260101T080000.jsonl.gz', 48)
+            recent = self._snapshot(new_dir, 'part-20260103T080000.jsonl.gz', 1)
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'OUTPUT_RETENTION_SECONDS', 24 * 3600), \
+                    patch.object(scraper, 'ARCHIVE_AFTER_SECONDS', 0):
+                result = scraper.enforce_output_retention()
+
+            assert result == {'archived': 0, 'deleted': 1}
+            assert not old.exists()
+            assert not (output_dir / 'flow=prenfe-cat' / 'date=2026-01-01').exists()
+            assert recent.exists()
+
+    def test_compacts_old_snapshots_into_hourly_archives(self):
+        """Should roll old snapshots into one tar.gz per flow and hour"""
+        import tarfile
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = Path(tmpdir)
+            self._snapshot(output_dir, 'general-prenfe_20260101_080000.json', 5)
+            self._snapshot(output_dir, 'general-prenfe_20260101_083000.json', 5)
+            self._snapshot(output_dir, 'general-prenfe_20260101_090000.json', 5)
+            recent = self._snapshot(output_dir, 'general-prenfe_20260101_120000.json', 0)
+
+            with patch.object(scraper, 'OUTPUT_DIR', output_dir), \
+                    patch.object(scraper, 'ARCHIVE_AFTER_SECONDS', 3600):
+                result = scraper.enforce_output_retention()
+
+                # A late snapshot for an archived hour is merged into the archive
+                self._snapshot(output_dir, 'general-prenfe_20260101_085900.json', 5)
+                scraper.compact_snapshots()
+
+            archive_dir = output_dir / 'archive'
+            assert result['archived'] == 3
+            assert sorted(p.name for p in archive_dir.iterdir()) == [
+                'general-prenfe_20260101_08.tar.gz',
+                'general-prenfe_20260101_09.tar.gz',
+            ]
+            with tarfile.open(archive_dir / 'general-prenfe_20260101_08.tar.gz') as tar:
+                assert tar.getnames() == [
+                    'general-prenfe_20260101_080000.json',
+                    'general-prenfe_20260101_083000.json',
+                    'general-prenfe_20260101_085900.json',
+                ]
+            assert [p.name for p in output_dir.glob('*.json')] == [recent.name]
+
+    def test_schedule_runs_in_background_once_per_interval(self):
+        """Should start one background run and skip reruns within the interval"""
+        with patch.object(scraper, 'enforce_output_retention') as mock_enforce, \
+                patch.object(scraper, 'flush_batches') as mock_flush, \
+                patch.object(scraper, '_last_maintenance', None):
+            thread = scraper.schedule_output_maintenance()
+            thread.join(timeout=5)
+
+            assert scraper.schedule_output_maintenance() is None
+            mock_enforce.assert_called_once_with()
+            mock_flush.assert_called_once_with()
+
+    def test_http_trigger_waits_for_maintenance(self):
+        """Should finish the background run before responding to the trigger"""
+        finished = threading.Event()
+
+        def slow_retention():
+            time.sleep(0.2)
+            finished.set()
+
+        with patch.object(scraper, 'fetch_flota_data', return_value={'trenes': []}), \
+                patch.object(scraper, 'process_flow'), \
+                patch.object(scraper, 'flush_batches'), \
+                patch.object(scraper, 'cleanup_old_logs'), \
+                patch.object(scraper, 'enforce_output_retention', side_effect=slow_retention), \
+                patch.object(scraper, '_last_maintenance', None):
+            reply = scraper.app.test_client().post('/')
+
+            assert reply.status_code == 200
+            assert finished.is_set()
+
+    def test_save_leaves_batch_flushing_to_maintenance(self):
+        """Should not flush batches on the request path"""
+        with patch.object(scraper, 'flush_batches') as mock_flush, \
+                patch.object(scraper, 'process_flow'), \
+                patch.object(scraper, 'schedule_output_maintenance') as mock_schedule:
+            scraper.save_flota_data({'trenes': []})
+
+            mock_flush.assert_not_called()
+            mock_schedule.assert_called_once_with()
+
+
 class TestFetchFlotaData:
     """Tests for fetch_flota_data function"""
 
+    @pytest.fixture(autouse=True)
+    def reset_validators(self):
+        """Start every test without validators from previous fetches, breaker closed"""
+        empty = {'etag': None, 'last_modified': None, 'body_hash': None}
+        scraper.fetch_breaker.reset()
+        with patch.dict(scraper._fetch_validators, empty), \
+                patch.object(scraper.fetch_retry_policy, 'sleep', lambda seconds: None):
+            yield
+        scraper.fetch_breaker.reset()
+
+    @staticmethod
+    def _response(body=b'[]', status_code=200, headers=None):
+        mock_response = Mock()
+        mock_response.status_code = status_code
+        mock_response.content = body
+        mock_response.headers = headers or {}
+        mock_response.json.side_effect = lambda: json.loads(body)
+        mock_response.raise_for_status.return_value = None
+        return mock_response
+
     @patch('scraper.session.get')
     def test_fetch_successful(self, mock_get):
         """Should return data on successful fetch"""
         mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.content = b'[{"linea": "RG1"}, {"linea": "AVE"}]'
+        mock_response.headers = {}
         mock_response.json.return_value = [
             {'linea': 'RG1', 'nombre': 'Train 1'},
             {'linea': 'AVE', 'nombre': 'Train 2'},
@@ -240,6 +947,7 @@ class TestFetchFlotaData:
     def test_fetch_handles_http_error(self, mock_get):
         """Should return None on HTTP error"""
         mock_response = Mock()
+        mock_response.status_code = 404
         mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("404 Not Found")
         mock_get.return_value = mock_response
 
@@ -251,6 +959,9 @@ class TestFetchFlotaData:
     def test_fetch_handles_json_error(self, mock_get):
         """Should return None on JSON parse error"""
         mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.content = b'{invalid'
+        mock_response.headers = {}
         mock_response.raise_for_status.return_value = None
         mock_response.json.side_effect = json.JSONDecodeError("Invalid JSON", "", 0)
         mock_get.return_value = mock_response
@@ -259,6 +970,163 @@ class TestFetchFlotaData:
 
         assert result is None
 
+    @patch('scraper.session.get')
+    def test_fetch_sends_validators_and_handles_304(self, mock_get):
+        """Should send ETag/Last-Modified back and return NOT_MODIFIED on 304"""
+        validators = {'ETag': '"abc"', 'Last-Modified': 'Sat, 17 Oct 2026 08:00:00 GMT'}
+        mock_get.side_effect = [
+            self._response(b'[{"codLinea": "R1"}]', headers=validators),
+            self._response(b'', status_code=304),
+        ]
+
+        assert scraper.fetch_flota_data() == [{'codLinea': 'R1'}]
+        assert scraper.fetch_flota_data() is scraper.NOT_MODIFIED
+
+        headers = mock_get.call_args_list[1].kwargs['headers']
+        assert headers == {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': validators['Last-Modified'],
+        }
+        assert mock_get.call_args_list[1].kwargs['params'] is None
+
+    @patch('scraper.session.get')
+    def test_fetch_detects_identical_body_without_validators(self, mock_get):
+        """Should return NOT_MODIFIED when the body hash matches the previous fetch"""
+        mock_get.side_effect = [
+            self._response(b'[{"codLinea": "R1"}]'),
+            self._response(b'[{"codLinea": "R1"}]'),
+            self._response(b'[{"codLinea": "R2"}]'),
+        ]
+
+        assert scraper.fetch_flota_data() == [{'codLinea': 'R1'}]
+        assert scraper.fetch_flota_data() is scraper.NOT_MODIFIED
+        assert scraper.fetch_flota_data() == [{'codLinea': 'R2'}]
+
+    @patch('scraper.session.get')
+    def test_strict_schema_counts_rejected_trains(self, mock_get):
+        """Should keep valid trains, count the malformed ones per cycle and report drift"""
+        pytest.importorskip('msgspec')
+        body = (b'{"fechaActualizacion": "x", "trenes": [{"codComercial": "1", "codLinea": "R1"},'
+                b' {"codComercial": "2", "latitud": "41,3"}, 7,'
+                b' {"codComercial": "3", "codLinea": "R2", "nuevoCampo": 1}]}')
+        mock_get.return_value = self._response(body)
+        drift = scraper.schema_unknown_fields.value(field='nuevoCampo')
+
+        with patch.object(scraper, 'STRICT_SCHEMA', True), \
+                patch.dict(scraper.schema_rejections, {'cycle': 0, 'total': 1}):
+            result = scraper.fetch_flota_data()
+
+            assert result['fechaActualizacion'] == 'x'
+            assert result['trenes'] == [{'codComercial': '1', 'codLinea': 'R1'},
+                                        {'codComercial': '3', 'codLinea': 'R2', 'nuevoCampo': 1}]
+            assert scraper.schema_rejections == {'cycle': 2, 'total': 3}
+            assert scraper.schema_unknown_fields.value(field='nuevoCampo') == drift + 1
+            assert scraper.analyze_flota_data(result)['line_counts'] == {'R1': 1, 'R2': 1}
+
+    @patch('scraper.session.get')
+    def test_fetch_retries_transient_failures(self, mock_get):
+        """Should retry connection errors and 503s, but not other HTTP errors"""
+        mock_get.side_effect = [
+            requests.exceptions.ConnectionError("reset"),
+            self._response(b'', status_code=503),
+            self._response(b'[{"codLinea": "R1"}]'),
+        ]
+        retries = scraper.fetch_retries.value()
+
+        assert scraper.fetch_flota_data() == [{'codLinea': 'R1'}]
+        assert mock_get.call_count == 3
+        assert scraper.fetch_retries.value() == retries + 2
+        assert mock_get.call_args.kwargs['timeout'] <= scraper.FETCH_TIMEOUT_SECONDS
+
+        not_found = self._response(b'', status_code=404)
+        not_found.raise_for_status.side_effect = requests.exceptions.HTTPError("404")
+        mock_get.side_effect = None
+        mock_get.return_value = not_found
+        assert scraper.fetch_flota_data() is None
+        assert mock_get.call_count == 4
+
+    @patch('scraper.session.get')
+    def test_circuit_breaker_skips_fetches_while_open(self, mock_get):
+        """Should stop requesting after repeated failures and resume after the cooldown"""
+        mock_get.side_effect = requests.exceptions.ConnectionError("down")
+        clock = [0.0]
+        breaker = resilience.CircuitBreaker(2, 300, clock=lambda: clock[0])
+
+        with patch.object(scraper, 'fetch_breaker', breaker), \
+                patch.object(scraper.fetch_retry_policy, 'max_attempts', 1):
+            assert scraper.fetch_flota_data() is None
+            assert scraper.fetch_flota_data() is None
+            assert scraper.fetch_circuit_open.value() == 1
+            skipped = scraper.fetch_results.value(result='circuit_open')
+            assert scraper.fetch_flota_data() is None
+            assert mock_get.call_count == 2
+            assert scraper.fetch_results.value(result='circuit_open') == skipped + 1
+
+            clock[0] += 300
+            mock_get.side_effect = None
+            mock_get.return_value = self._response(b'[{"codLinea": "R1"}]')
+            assert scraper.fetch_flota_data() == [{'codLinea': 'R1'}]
+            assert breaker.state == breaker.CLOSED
+            assert scraper.fetch_circuit_open.value() == 0
+
+    @patch('scraper.session.get')
+    def test_failed_half_open_trial_reopens_the_breaker(self, mock_get):
+        """Should count unexpected errors and bad bodies in a trial fetch as failures"""
+        clock = [0.0]
+        breaker = resilience.CircuitBreaker(1, 300, clock=lambda: clock[0])
+
+        with patch.object(scraper, 'fetch_breaker', breaker):
+            mock_get.side_effect = RuntimeError("unexpected")
+            with pytest.raises(RuntimeError):
+                scraper.fetch_flota_data()
+            assert breaker.state == breaker.OPEN
+
+            clock[0] += 300
+            with pytest.raises(RuntimeError):
+                scraper.fetch_flota_data()  # the half-open trial
+            assert breaker.state == breaker.OPEN
+
+            clock[0] += 300
+            mock_get.side_effect = None
+            mock_get.return_value = self._response(b'{invalid')
+            assert scraper.fetch_flota_data() is None
+            assert breaker.state == breaker.OPEN
+            assert scraper.fetch_circuit_open.value() == 1
+
+    @patch('scraper.save_flota_data')
+    @patch('scraper.fetch_flota_data')
+    def test_cycle_skips_processing_when_not_modified(self, mock_fetch, mock_save):
+        """Should skip the save pipeline entirely when the feed is unchanged"""
+        mock_fetch.return_value = scraper.NOT_MODIFIED
+
+        assert scraper.run_fetch_cycle() is True
+        mock_save.assert_not_called()
+
+
+class TestMetricsEndpoint:
+    """Tests for the per-stage instrumentation and the /metrics route"""
+
+    def test_cycle_stages_are_exported(self):
+        """Should time the cycle stages and count fetch results"""
+        response = Mock(status_code=200, content=b'[{"codLinea": "R1"}]', headers={})
+        fetches = scraper.fetch_results.value(result='ok')
+        parses = scraper.stage_seconds.count(stage='parse')
+
+        with patch.dict(scraper._fetch_validators, {'body_hash': None}), \
+                patch('scraper.session.get', return_value=response), \
+                patch.object(scraper, 'save_flota_data'):
+            assert scraper.run_fetch_cycle()
+
+        assert scraper.fetch_results.value(result='ok') == fetches + 1
+        assert scraper.stage_seconds.count(stage='parse') == parses + 1
+        reply = scraper.app.test_client().get('/metrics')
+        assert reply.status_code == 200
+        assert reply.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+        body = reply.get_data(as_text=True)
+        assert 'prenfe_stage_seconds_bucket{stage="fetch",le="+Inf"}' in body
+        assert 'prenfe_fetch_bytes_count ' in body
+        assert 'prenfe_last_success_timestamp_seconds ' in body
+
 
 class TestIntegration:
     """Integration tests combining multiple functions"""
@@ -298,18 +1166,18 @@ class TestScheduling:
     """Tests for dynamic scheduling logic with night hours exclusion"""
 
     def test_interval_during_morning_peak(self):
-        """Should return 60 seconds during morning peak (05:50-09:30)"""
+        """Should return 2 minutes during morning peak (06:00-09:59)"""
         with patch('scraper.datetime') as mock_datetime:
             mock_datetime.now.return_value = datetime(2026, 2, 17, 7, 0, 0)
             interval = scraper.get_interval_for_time()
-            assert interval == 60
+            assert interval == 120
 
     def test_interval_during_evening_peak(self):
-        """Should return 60 seconds during evening peak (16:00-18:30)"""
+        """Should return 2 minutes during evening peak (16:00-18:59)"""
         with patch('scraper.datetime') as mock_datetime:
             mock_datetime.now.return_value = datetime(2026, 2, 17, 17, 15, 0)
             interval = scraper.get_interval_for_time()
-            assert interval == 60
+            assert interval == 120
 
     def test_interval_during_off_peak(self):
         """Should return 600 seconds during off-peak hours"""
@@ -319,7 +1187,7 @@ class TestScheduling:
             assert interval == 600
 
     def test_interval_during_night_hours(self):
-        """Should return None during night hours (00:00-05:50) to skip queries"""
+        """Should return None during night hours (00:00-04:59) to skip queries"""
         with patch('scraper.datetime') as mock_datetime:
             # Test at 00:00 (midnight)
             mock_datetime.now.return_value = datetime(2026, 2, 17, 0, 0, 0)
@@ -329,39 +1197,134 @@ class TestScheduling:
             mock_datetime.now.return_value = datetime(2026, 2, 17, 3, 0, 0)
             assert scraper.get_interval_for_time() is None
 
-            # Test at 05:49 (just before morning peak)
-            mock_datetime.now.return_value = datetime(2026, 2, 17, 5, 49, 0)
+            # Test at 04:59 (just before the first morning window)
+            mock_datetime.now.return_value = datetime(2026, 2, 17, 4, 59, 0)
             assert scraper.get_interval_for_time() is None
 
     def test_interval_at_boundaries(self):
         """Should correctly handle peak hour boundaries"""
         with patch('scraper.datetime') as mock_datetime:
-            # At 05:50 (start of morning peak - should start querying)
-            mock_datetime.now.return_value = datetime(2026, 2, 17, 5, 50, 0)
-            assert scraper.get_interval_for_time() == 60
+            # At 05:00 (start of low morning traffic - should start querying)
+            mock_datetime.now.return_value = datetime(2026, 2, 17, 5, 0, 0)
+            assert scraper.get_interval_for_time() == 300
+
+            # At 06:00 (start of morning peak)
+            mock_datetime.now.return_value = datetime(2026, 2, 17, 6, 0, 0)
+            assert scraper.get_interval_for_time() == 120
 
-            # At 09:30 (end of morning peak)
-            mock_datetime.now.return_value = datetime(2026, 2, 17, 9, 30, 0)
-            assert scraper.get_interval_for_time() == 60
+            # At 09:59 (end of morning peak)
+            mock_datetime.now.return_value = datetime(2026, 2, 17, 9, 59, 0)
+            assert scraper.get_interval_for_time() == 120
+
+            # At 10:00 (start of off-peak)
+            mock_datetime.now.return_value = datetime(2026, 2, 17, 10, 0, 0)
+            assert scraper.get_interval_for_time() == 600
 
             # At 16:00 (start of evening peak)
             mock_datetime.now.return_value = datetime(2026, 2, 17, 16, 0, 0)
-            assert scraper.get_interval_for_time() == 60
+            assert scraper.get_interval_for_time() == 120
 
-            # At 18:30 (end of evening peak)
-            mock_datetime.now.return_value = datetime(2026, 2, 17, 18, 30, 0)
-            assert scraper.get_interval_for_time() == 60
+            # At 18:59 (end of evening peak)
+            mock_datetime.now.return_value = datetime(2026, 2, 17, 18, 59, 0)
+            assert scraper.get_interval_for_time() == 120
 
     def test_interval_evening_to_night_transition(self):
-        """Should return 10min after 18:30 until night"""
+        """Should return 5min after the evening peak until night"""
         with patch('scraper.datetime') as mock_datetime:
             # At 19:00 (after evening peak, before night)
             mock_datetime.now.return_value = datetime(2026, 2, 17, 19, 0, 0)
-            assert scraper.get_interval_for_time() == 600
+            assert scraper.get_interval_for_time() == 300
 
             # At 23:59 (last minute before night)
             mock_datetime.now.return_value = datetime(2026, 2, 17, 23, 59, 0)
-            assert scraper.get_interval_for_time() == 600
+            assert scraper.get_interval_for_time() == 300
+
+
+class TestAdaptiveScheduler:
+    """Tests for the adaptive polling scheduler"""
+
+    @staticmethod
+    def _fleet(stations):
+        return {'trenes': [
+            {'codComercial': str(i), 'codEstAct': station, 'latitud': 41.0 + i}
+            for i, station in enumerate(stations)
+        ]}
+
+    def test_tightens_when_fleet_changes_and_backs_off_when_static(self):
+        """Should shrink the interval on busy cycles and grow it on static ones"""
+        scheduler = scraper.AdaptiveScheduler(min_interval=30, max_backoff=2)
+        with patch.object(scraper, 'get_interval_for_time', return_value=120):
+            scheduler.observe(self._fleet(['A', 'B', 'C', 'D']))
+            assert scheduler.next_interval() == 120
+
+            scheduler.observe(self._fleet(['B', 'C', 'D', 'E']))  # every train moved on
+            assert scheduler.next_interval() == 60
+            scheduler.observe(self._fleet(['C', 'D', 'E', 'F']))
+            scheduler.observe(self._fleet(['D', 'E', 'F', 'G']))
+            assert scheduler.next_interval() == 30  # clamped to the minimum
+
+            for _ in range(10):
+                scheduler.observe(scraper.NOT_MODIFIED)
+            assert scheduler.next_interval() == 240  # clamped to max_backoff x window
+
+    def test_sleeps_outside_schedule_windows(self):
+        """Should return None during the overnight window regardless of activity"""
+        scheduler = scraper.AdaptiveScheduler()
+        with patch.object(scraper, 'get_interval_for_time', return_value=None):
+            assert scheduler.next_interval() is None
+
+    def test_failed_fetches_do_not_adapt(self):
+        """Should ignore failed fetches"""
+        scheduler = scraper.AdaptiveScheduler()
+        scheduler.observe(None)
+        assert scheduler.factor == 1.0
+
+
+class TestRunPolling:
+    """Tests for the drift-free polling loop"""
+
+    class FakeClock:
+        """Monotonic clock advanced by waits and by simulated cycle durations"""
+
+        def __init__(self):
+            self.now = 1000.0
+
+        def __call__(self):
+            return self.now
+
+    def _run(self, intervals, durations, max_cycles):
+        clock = self.FakeClock()
+        stop_event = Mock()
+        stop_event.is_set.return_value = False
+        stop_event.wait.side_effect = lambda timeout: setattr(clock, 'now', clock.now + timeout)
+
+        scheduler = Mock()
+        scheduler.next_interval.side_effect = intervals
+        starts = []
+        durations = iter(durations)
+
+        def cycle(observer=None):
+            starts.append(clock.now)
+            clock.now += next(durations)
+
+        with patch.object(scraper, 'run_fetch_cycle', side_effect=cycle):
+            scraper.run_polling(scheduler, stop_event, max_cycles=max_cycles, clock=clock)
+        return starts
+
+    def test_cycles_start_on_a_fixed_grid_despite_cycle_duration(self):
+        """Should schedule from the previous deadline, not from cycle end"""
+        starts = self._run([60, 60, 60, 60], [7, 13, 2, 1], max_cycles=4)
+        assert starts == [1000.0, 1060.0, 1120.0, 1180.0]
+
+    def test_overrunning_cycle_skips_missed_slots_without_overlap(self):
+        """Should skip slots a long cycle ran over instead of bursting"""
+        starts = self._run([30, 30, 30], [75, 1, 1], max_cycles=3)
+        assert starts == [1000.0, 1090.0, 1120.0]
+
+    def test_sleep_window_rechecks_without_running(self):
+        """Should not fetch while the scheduler returns None"""
+        starts = self._run([None, None, 60], [1], max_cycles=1)
+        assert starts == [1000.0 + 2 * scraper.POLL_SLEEP_RECHECK_SECONDS]
 
 
 if __name__ == "__main__":
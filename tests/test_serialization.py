@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for snapshot codecs
+"""
+
+import gzip
+import json
+
+import pytest
+
+import serialization
+
+
+PAYLOAD = {
+    'fechaActualizacion': '2026-10-17T08:00:00',
+    'trenes': [
+        {'codComercial': '25001', 'codLinea': 'R2N', 'desEst': 'Estació de França'},
+        {'codComercial': '25002', 'codLinea': 'RG1', 'latitud': 41.98, 'accesible': True},
+    ],
+}
+
+
+class TestEncodeSnapshot:
+    """Tests for encode_snapshot and decode_snapshot"""
+
+    @pytest.mark.parametrize('codec', serialization.available_codecs())
+    def test_round_trip(self, codec):
+        """Should decode back to the original payload with every available codec"""
+        encoded = serialization.encode_snapshot(PAYLOAD, codec)
+        assert serialization.decode_snapshot(encoded, codec) == PAYLOAD
+
+    def test_json_keeps_pretty_printed_format(self):
+        """Should produce the historical indent=2, non-ASCII-escaped output"""
+        encoded = serialization.encode_snapshot(PAYLOAD, 'json')
+        assert encoded == json.dumps(PAYLOAD, indent=2, ensure_ascii=False).encode('utf-8')
+
+    def test_compact_json_has_no_whitespace(self):
+        """Should drop indentation and separator whitespace"""
+        encoded = serialization.encode_snapshot(PAYLOAD, 'json-compact')
+        assert b'\n' not in encoded
+        assert b'", "' not in encoded
+        assert len(encoded) < len(serialization.encode_snapshot(PAYLOAD, 'json'))
+
+    def test_gzip_is_deterministic_and_standard(self):
+        """Should produce identical bytes for identical payloads, readable by gzip"""
+        first = serialization.encode_snapshot(PAYLOAD, 'gzip', level=9)
+        second = serialization.encode_snapshot(PAYLOAD, 'gzip', level=9)
+        assert first == second
+        assert json.loads(gzip.decompress(first)) == PAYLOAD
+
+    def test_zstd_round_trip(self):
+        """Should compress with zstd when zstandard is installed"""
+        pytest.importorskip('zstandard')
+        encoded = serialization.encode_snapshot(PAYLOAD, 'zstd', level=10)
+        assert encoded[:4] == b'\x28\xb5\x2f\xfd'  # zstd frame magic
+        assert serialization.decode_snapshot(encoded, 'zstd') == PAYLOAD
+
+    def test_unknown_codec_raises(self):
+        """Should reject unknown codec names"""
+        with pytest.raises(ValueError):
+            serialization.encode_snapshot(PAYLOAD, 'bz2')
+
+    def test_check_level_against_the_codec(self):
+        """Should accept levels in the codec's range and reject any other"""
+        serialization.check_level('gzip', 9)
+        serialization.check_level('zstd', 22)
+        serialization.check_level('json', None)
+        for codec, level in (('gzip', 10), ('zstd', 0), ('json', 3), ('bz2', None)):
+            with pytest.raises(ValueError):
+                serialization.check_level(codec, level)
+
+
+class TestCodecForFilename:
+    """Tests for codec_for_filename"""
+
+    @pytest.mark.parametrize('filename, codec', [
+        ('general-prenfe_20261017_080000.json', 'json'),
+        ('general-prenfe_20261017_080000.json.gz', 'gzip'),
+        ('prenfe-cat_20261017_080000.json.zst', 'zstd'),
+    ])
+    def test_infers_codec_from_extension(self, filename, codec):
+        """Should map each codec extension back to its codec"""
+        assert serialization.codec_for_filename(filename) == codec
+
+
+class TestJsonBackends:
+    """Tests for the pluggable JSON backends"""
+
+    @pytest.fixture(params=list(serialization.JSON_BACKENDS))
+    def backend(self, request):
+        previous = serialization.json_backend()
+        serialization.set_json_backend(request.param)
+        yield request.param
+        serialization.set_json_backend(previous)
+
+    def test_backends_match_stdlib_output(self, backend):
+        """Should produce the stdlib's compact, pretty and sorted documents byte for byte"""
+        assert serialization.dumps(PAYLOAD) == \
+            json.dumps(PAYLOAD, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        assert serialization.dumps(PAYLOAD, pretty=True) == \
+            json.dumps(PAYLOAD, indent=2, ensure_ascii=False).encode('utf-8')
+        assert serialization.dumps(PAYLOAD, sort_keys=True) == json.dumps(
+            PAYLOAD, ensure_ascii=False, separators=(',', ':'), sort_keys=True
+        ).encode('utf-8')
+
+    def test_backends_parse_bytes_and_records(self, backend):
+        """Should parse bytes and serialize TrainRecords"""
+        import records
+
+        encoded = serialization.dumps(PAYLOAD)
+        assert serialization.loads(encoded) == PAYLOAD
+        parsed = records.parse_payload(PAYLOAD)
+        assert serialization.dumps(parsed) == encoded
+        with pytest.raises(ValueError):
+            serialization.loads(b'{invalid')
+
+    def test_unknown_backend_raises(self):
+        """Should raise ValueError for backends that are not installed"""
+        with pytest.raises(ValueError):
+            serialization.set_json_backend('simdjson')
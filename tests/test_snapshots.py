@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Tests for delta snapshots and point-in-time reconstruction
+"""
+
+import tarfile
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+import serialization
+import snapshots
+
+
+def make_payload(trains, updated='2026-10-17T08:00:00'):
+    return {'fechaActualizacion': updated, 'trenes': trains}
+
+
+def write_snapshot(directory, name, document, codec='json'):
+    (directory / name).write_bytes(serialization.encode_snapshot(document, codec))
+
+
+class TestComputeDelta:
+    """Tests for compute_delta and apply_delta"""
+
+    def test_delta_captures_added_removed_and_changed(self):
+        """Should list only the trains that differ between cycles"""
+        previous = make_payload([
+            {'codComercial': '1', 'latitud': 41.0},
+            {'codComercial': '2', 'latitud': 41.5},
+            {'codComercial': '3', 'latitud': 42.0},
+        ])
+        current = make_payload([
+            {'codComercial': '1', 'latitud': 41.0},
+            {'codComercial': '2', 'latitud': 41.6},
+            {'codComercial': '4', 'latitud': 40.0},
+        ], updated='2026-10-17T08:02:00')
+        previous_index, _ = snapshots.index_trains(previous['trenes'])
+
+        delta, index = snapshots.compute_delta(previous_index, current, 'base.json')
+
+        assert delta['base'] == 'base.json'
+        assert delta['meta'] == {'fechaActualizacion': '2026-10-17T08:02:00'}
+        assert delta['added'] == {'4': {'codComercial': '4', 'latitud': 40.0}}
+        assert delta['changed'] == {'2': {'codComercial': '2', 'latitud': 41.6}}
+        assert delta['removed'] == ['3']
+        assert list(index) == ['1', '2', '4']
+
+    def test_apply_delta_reconstructs_payload(self):
+        """Should rebuild the new payload, including repeated ids and unkeyed trains"""
+        previous = [{'codComercial': '1', 'v': 0}, {'codComercial': '1', 'v': 1}, {'v': 'x'}]
+        current = [{'codComercial': '1', 'v': 0}, {'codComercial': '1', 'v': 2}, {'v': 'y'}]
+        previous_index, _ = snapshots.index_trains(previous)
+
+        delta, _ = snapshots.compute_delta(previous_index, current, 'base.json')
+        index = snapshots.apply_delta(previous_index, delta)
+
+        assert snapshots.build_payload(index, delta['unkeyed'], delta['meta']) == current
+
+    def test_rejects_unexpected_payload_shape(self):
+        """Should raise ValueError for payloads without a trains list"""
+        with pytest.raises(ValueError):
+            snapshots.compute_delta({}, {'unexpected': 1}, 'base.json')
+
+
+class TestReconstruct:
+    """Tests for reconstruct"""
+
+    def _write_chain(self, directory, codec='json'):
+        ext = serialization.CODECS[codec]['extension']
+        cycles = [
+            make_payload([{'codComercial': '1', 'v': 0}, {'codComercial': '2', 'v': 0}]),
+            make_payload([{'codComercial': '1', 'v': 1}, {'codComercial': '2', 'v': 0}]),
+            make_payload([{'codComercial': '1', 'v': 1}, {'codComercial': '3', 'v': 0}]),
+        ]
+        names = [
+            f"general-prenfe_20261017_080000{ext}",
+            f"general-prenfe_20261017_080200.delta{ext}",
+            f"general-prenfe_20261017_080400.delta{ext}",
+        ]
+        write_snapshot(directory, names[0], cycles[0], codec)
+        index, _ = snapshots.index_trains(cycles[0]['trenes'])
+        for previous_name, name, payload in zip(names, names[1:], cycles[1:]):
+            delta, index = snapshots.compute_delta(index, payload, previous_name)
+            write_snapshot(directory, name, delta, codec)
+        return cycles
+
+    @pytest.mark.parametrize('codec', ['json', 'gzip'])
+    def test_reconstructs_each_point_in_time(self, codec):
+        """Should return the payload of the latest cycle at or before the requested time"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            directory = Path(tmpdir)
+            cycles = self._write_chain(directory, codec)
+
+            for at, expected in [
+                (datetime(2026, 10, 17, 8, 1), cycles[0]),
+                (datetime(2026, 10, 17, 8, 2), cycles[1]),
+                (datetime(2026, 10, 17, 9, 0), cycles[2]),
+            ]:
+                payload, _ = snapshots.reconstruct(directory, 'general-prenfe', at)
+                assert payload == expected
+
+    def test_reads_chains_continuing_from_an_archive(self):
+        """Should find a keyframe and deltas rolled into an hourly archive"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            directory = Path(tmpdir)
+            cycles = self._write_chain(directory, 'gzip')
+            archive_dir = directory / snapshots.ARCHIVE_SUBDIR
+            archive_dir.mkdir()
+            with tarfile.open(archive_dir / 'general-prenfe_20261017_08.tar.gz', 'w:gz') as tar:
+                for name in ('general-prenfe_20261017_080000.json.gz',
+                             'general-prenfe_20261017_080200.delta.json.gz'):
+                    tar.add(directory / name, arcname=name)
+                    (directory / name).unlink()
+
+            for minute, expected in [(1, cycles[0]), (3, cycles[1]), (5, cycles[2])]:
+                payload, _ = snapshots.reconstruct(directory, 'general-prenfe',
+                                                   datetime(2026, 10, 17, 8, minute))
+                assert payload == expected
+
+    def test_missing_keyframe_raises(self):
+        """Should raise LookupError when no keyframe precedes the requested time"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            directory = Path(tmpdir)
+            self._write_chain(directory)
+
+            with pytest.raises(LookupError):
+                snapshots.reconstruct(directory, 'general-prenfe', datetime(2026, 10, 17, 7, 0))
+
+    def test_broken_chain_raises(self):
+        """Should raise ValueError when a delta is missing from the chain"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            directory = Path(tmpdir)
+            self._write_chain(directory)
+            (directory / 'general-prenfe_20261017_080200.delta.json').unlink()
+
+            with pytest.raises(ValueError):
+                snapshots.reconstruct(directory, 'general-prenfe', datetime(2026, 10, 17, 9, 0))
+
+
+class TestPayloadFingerprint:
+    """Tests for payload_fingerprint"""
+
+    def test_ignores_train_order_key_order_and_metadata(self):
+        """Should match fleets that differ only in ordering and update time"""
+        first = make_payload([{'codComercial': '1', 'v': 1}, {'v': 2, 'codComercial': '2'}])
+        second = make_payload([{'codComercial': '2', 'v': 2}, {'codComercial': '1', 'v': 1}],
+                              updated='2026-10-17T08:02:00')
+        assert snapshots.payload_fingerprint(first) == snapshots.payload_fingerprint(second)
+
+    def test_detects_changed_and_duplicated_trains(self):
+        """Should differ when a value changes or a train is repeated"""
+        base = [{'codComercial': '1', 'v': 1}]
+        assert snapshots.payload_fingerprint(base) != \
+            snapshots.payload_fingerprint([{'codComercial': '1', 'v': 2}])
+        assert snapshots.payload_fingerprint(base) != snapshots.payload_fingerprint(base * 2)
+
+
+class TestParseSnapshotName:
+    """Tests for parse_snapshot_name"""
+
+    def test_parses_keyframes_and_deltas(self):
+        """Should extract flow, timestamp and delta flag"""
+        assert snapshots.parse_snapshot_name('prenfe-cat_20261017_080200.delta.json.gz') == {
+            'flow': 'prenfe-cat',
+            'timestamp': datetime(2026, 10, 17, 8, 2),
+            'delta': True,
+            'unchanged': False,
+        }
+        marker = snapshots.parse_snapshot_name('prenfe-cat_20261017_080400.unchanged.json')
+        assert marker['unchanged'] is True
+        keyframe = snapshots.parse_snapshot_name('general-prenfe_20261017_080000.json')
+        assert keyframe['delta'] is False
+        assert snapshots.parse_snapshot_name('notes.txt') is None
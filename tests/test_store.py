@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Tests for the append-only local snapshot store
+"""
+
+import io
+import os
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+import serialization
+import snapshots
+import store
+
+START = datetime(2026, 10, 17, 8, 0)
+
+
+def fleet(minute):
+    return {'fechaActualizacion': f"2026-10-17T08:{minute:02d}:00",
+            'trenes': [{'codComercial': '1', 'ultRetraso': str(minute)},
+                       {'codComercial': '2', 'ultRetraso': '0'}]}
+
+
+class TestSnapshotStore:
+    """Tests for SnapshotStore"""
+
+    def test_locates_snapshots_by_time(self):
+        """Should find the snapshot at, before and nearest to a time, and ranges"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            local_store = store.SnapshotStore(tmpdir, 'general-prenfe', writable=True)
+            for minute in (0, 2, 4, 10):
+                local_store.append(START + timedelta(minutes=minute),
+                                   serialization.encode_snapshot(fleet(minute), 'gzip'), 'gzip')
+
+            assert len(local_store) == 4
+            assert local_store.locate(START + timedelta(minutes=3)) == 1
+            assert local_store.locate(START + timedelta(minutes=4)) == 2
+            assert local_store.locate(START - timedelta(minutes=1)) is None
+            assert local_store.nearest(START + timedelta(minutes=8)) == 3
+            assert local_store.nearest(START + timedelta(minutes=7)) == 2
+            assert list(local_store.between(START + timedelta(minutes=1),
+                                            START + timedelta(minutes=4))) == [1, 2]
+            assert isinstance(local_store.read(3), memoryview)
+            assert local_store.decode(3) == fleet(10)
+            assert local_store.name(3) == 'general-prenfe_20261017_081000.json.gz'
+
+            reopened = store.SnapshotStore(tmpdir, 'general-prenfe', writable=True)
+            assert reopened.entry(-1)['timestamp'] == START + timedelta(minutes=10)
+            with pytest.raises(ValueError):
+                reopened.append(START, b'{}', 'json')
+
+    def test_drops_torn_append_on_open(self):
+        """Should ignore a partial index entry and unindexed data after a crash"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            local_store = store.SnapshotStore(tmpdir, 'general-prenfe', writable=True)
+            local_store.append(START, b'[1]', 'json')
+            with open(local_store.data_path, 'ab') as data:
+                data.write(b'[2, 3')
+            with open(local_store.index_path, 'ab') as index:
+                index.write(b'\x00' * 10)
+
+            reopened = store.SnapshotStore(tmpdir, 'general-prenfe', writable=True)
+            assert len(reopened) == 1
+            assert reopened.data_path.stat().st_size == 3
+            reopened.append(START + timedelta(minutes=2), b'[4]', 'json')
+            assert bytes(reopened.read(1)) == b'[4]'
+
+    def test_readers_never_modify_the_store(self):
+        """Should leave a writer's unindexed data alone and refuse to append"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with pytest.raises(FileNotFoundError):
+                store.SnapshotStore(tmpdir, 'general-prenfe')
+            writer = store.SnapshotStore(tmpdir, 'general-prenfe', writable=True)
+            writer.append(START, b'[1]', 'json')
+            with open(writer.data_path, 'ab') as data:
+                data.write(b'[2, 3')  # an append in progress
+
+            reader = store.SnapshotStore(tmpdir, 'general-prenfe')
+            assert len(reader) == 1
+            assert writer.data_path.stat().st_size == 8
+            with pytest.raises(io.UnsupportedOperation):
+                reader.append(START + timedelta(minutes=2), b'[4]', 'json')
+
+    def test_rotates_daily_into_segments(self):
+        """Should start new files on a day's first keyframe and open the segment covering a time"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer = store.SnapshotStore(tmpdir, 'general-prenfe', writable=True, rotate_daily=True)
+            next_day = START + timedelta(days=1)
+            writer.append(START, serialization.encode_snapshot(fleet(0), 'json'))
+            writer.append(next_day, b'{}', 'json', store.KIND_UNCHANGED)
+            writer.append(next_day + timedelta(minutes=2),
+                          serialization.encode_snapshot(fleet(2), 'json'))
+
+            assert len(writer) == 1
+            assert store.segments(tmpdir, 'general-prenfe') == [(START, 20261017080000)]
+            previous = store.open_at(tmpdir, 'general-prenfe', next_day)
+            assert len(previous) == 2
+            assert previous.reconstruct(next_day)[0] == fleet(0)
+            assert previous.name(0) == 'general-prenfe_20261017_080000.json'
+            current = store.open_at(tmpdir, 'general-prenfe', next_day + timedelta(hours=1))
+            assert current.decode(0) == fleet(2)
+
+    def test_rotation_survives_a_crash_and_is_seen_by_readers(self):
+        """Should replace a stale segment link and let readers notice same-size files"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer = store.SnapshotStore(tmpdir, 'general-prenfe', writable=True, rotate_daily=True)
+            writer.append(START, b'[1]', 'json')
+            reader = store.SnapshotStore(tmpdir, 'general-prenfe')
+            assert bytes(reader.read(0)) == b'[1]'
+            # A rotation that crashed after linking the segment, before the swap
+            segment = Path(tmpdir) / 'general-prenfe.20261017080000'
+            os.link(writer.data_path, segment.with_suffix(segment.suffix + '.dat'))
+
+            writer.append(START + timedelta(days=1), b'[2]', 'json')
+
+            assert len(store.SnapshotStore(tmpdir, 'general-prenfe', segment=20261017080000)) == 1
+            # Same size and count as before the rotation, but new files
+            assert len(reader) == 1
+            assert bytes(reader.read(0)) == b'[2]'
+
+    def test_imports_files_and_reconstructs_deltas(self):
+        """Should import keyframes, deltas and markers and rebuild any cycle"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = Path(tmpdir) / 'data'
+            source.mkdir()
+            index, base = None, None
+            for minute in (0, 2, 4):
+                timestamp = START + timedelta(minutes=minute)
+                if index is None:
+                    name = f"general-prenfe_{timestamp:%Y%m%d_%H%M%S}.json"
+                    document = fleet(minute)
+                    index, _ = snapshots.index_trains(document['trenes'])
+                else:
+                    name = f"general-prenfe_{timestamp:%Y%m%d_%H%M%S}.delta.json"
+                    document, index = snapshots.compute_delta(index, fleet(minute), base)
+                (source / name).write_bytes(serialization.encode_snapshot(document, 'json'))
+                base = name
+            (source / 'general-prenfe_20261017_080600.unchanged.json').write_bytes(
+                serialization.encode_snapshot({'unchanged': True, 'same_as': base}, 'json'))
+            (source / 'prenfe-cat_20261017_080000.json').write_bytes(b'[]')
+
+            local_store = store.SnapshotStore(Path(tmpdir) / 'store', 'general-prenfe',
+                                              writable=True)
+            assert store.import_directory(local_store, source) == 4
+            assert store.import_directory(local_store, source) == 0
+
+            payload, timestamp = local_store.reconstruct(START + timedelta(minutes=7))
+            assert payload == fleet(4)
+            assert timestamp == START + timedelta(minutes=4)
+            assert local_store.reconstruct(START + timedelta(minutes=3))[0] == fleet(2)
+            with pytest.raises(LookupError):
+                local_store.reconstruct(START - timedelta(minutes=1))